@@ -2,13 +2,29 @@ import os
 import logging
 import random
 import json
-
-from datetime import datetime
-from functools import wraps
+import sys
+import hashlib
+import hmac
+import threading
+import asyncio
+import secrets
+import gzip
+import base64
+import tempfile
+import time
+import gc
+import cProfile
+import pstats
+import tracemalloc
+
+from datetime import datetime, time as dtime, timedelta
+import bisect
+from functools import wraps, lru_cache
 from pathlib import Path
+from types import SimpleNamespace
 from zoneinfo import ZoneInfo  # Python 3.9+
-from io import BytesIO
-from collections import Counter
+from io import BytesIO, StringIO
+from collections import Counter, defaultdict, OrderedDict, deque
 from PIL import Image, ImageDraw, ImageFont
 
 from telegram import (
@@ -19,7 +35,10 @@ from telegram import (
     BotCommandScopeChat,
     InputFile,
     InlineKeyboardMarkup,
-    InlineKeyboardButton
+    InlineKeyboardButton,
+    InputMediaPhoto,
+    InlineQueryResultArticle,
+    InputTextMessageContent
 )
 
 from telegram.ext import (
@@ -30,9 +49,15 @@ from telegram.ext import (
     filters,
     ContextTypes,
     CallbackQueryHandler,
+    InlineQueryHandler,
+    BaseRateLimiter,
+    ExtBot,
+    TypeHandler,
+    ApplicationHandlerStop,
 )
+from telegram.request import HTTPXRequest
 
-from telegram.error import BadRequest
+from telegram.error import BadRequest, RetryAfter
 
 from dotenv import load_dotenv
 
@@ -52,6 +77,171 @@ USER_FILE = Path("user_activity.json")
 SUGGESTIONS_FILE = Path("suggestions.json")
 # админ айди
 ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
+# московское время (часовой пояс резолвим один раз)
+MSK = ZoneInfo("Europe/Moscow")
+
+# --- Исходящие запросы к Telegram ---
+
+# Пулы соединений: интерактивные ответы и массовые рассылки не делят сокеты
+INTERACTIVE_POOL_SIZE = int(os.getenv("INTERACTIVE_POOL_SIZE", "32"))
+BULK_POOL_SIZE = int(os.getenv("BULK_POOL_SIZE", "4"))
+# Лимиты Telegram: ~30 сообщений в секунду на бота, ~1 в секунду на чат (с небольшим запасом на всплески)
+GLOBAL_RATE = 30
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+# Сколько раз повторяем запрос после RetryAfter
+FLOOD_RETRIES = 3
+
+
+class OutboundLimiter(BaseRateLimiter):
+    """
+    Ограничитель исходящих запросов для ExtBot.
+    - глобальное ведро токенов GLOBAL_RATE/сек и ведро на каждый чат (CHAT_RATE, всплеск CHAT_BURST);
+    - приоритет: запросы с rate_limit_args="bulk" или "group" ждут, пока интерактивным
+      не хватает глобальных токенов (ожидание своего ведра чата рассылки не держит);
+    - на RetryAfter вся отправка замирает на указанное время, запрос повторяется;
+    - время ожидания в очереди копится в stats по классам.
+    """
+
+    def __init__(self):
+        self.tokens = float(GLOBAL_RATE)
+        self.updated = time.monotonic()
+        self.chats: dict[int, list[float]] = {}   # chat_id -> [токены, время обновления]
+        self.paused_until = 0.0
+        # интерактивные, которым не хватает именно глобальных токенов; пока они есть, gate закрыт
+        self.global_starved = 0
+        self.gate = asyncio.Event()
+        self.gate.set()
+        self.stats = {
+            cls: {"count": 0, "wait_total": 0.0, "wait_max": 0.0, "retries": 0}
+            for cls in ("interactive", "group", "bulk")
+        }
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def _try_take(self, chat_id, now: float) -> tuple[float, bool]:
+        """
+        Берет токены, если можно. Возвращает (сколько секунд подождать,
+        упирается ли ожидание в глобальное ведро, а не в ведро чата).
+        """
+        self.tokens = min(GLOBAL_RATE, self.tokens + (now - self.updated) * GLOBAL_RATE)
+        self.updated = now
+        global_wait = max(0.0, self.paused_until - now, (1 - self.tokens) / GLOBAL_RATE)
+
+        bucket, chat_wait = None, 0.0
+        if chat_id is not None:
+            bucket = self.chats.setdefault(chat_id, [float(CHAT_BURST), now])
+            bucket[0] = min(CHAT_BURST, bucket[0] + (now - bucket[1]) * CHAT_RATE)
+            bucket[1] = now
+            chat_wait = max(0.0, (1 - bucket[0]) / CHAT_RATE)
+        wait = max(global_wait, chat_wait)
+        if wait > 0:
+            return wait, global_wait > 0 and global_wait >= chat_wait
+
+        self.tokens -= 1
+        if bucket is not None:
+            bucket[0] -= 1
+        # полные ведра простаивающих чатов не нужны — держим память O(активных чатов)
+        if len(self.chats) > 10_000:
+            self.chats = {c: b for c, b in self.chats.items() if b[0] < CHAT_BURST - 1e-9 or now - b[1] < 1}
+        return 0.0, False
+
+    def _starve(self, delta: int) -> None:
+        self.global_starved += delta
+        if self.global_starved:
+            self.gate.clear()
+        else:
+            self.gate.set()
+
+    async def _acquire(self, chat_id, bulk: bool) -> None:
+        if bulk:
+            while True:
+                await self.gate.wait()
+                wait, _starved = self._try_take(chat_id, time.monotonic())
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+
+        starved = False
+        try:
+            while True:
+                wait, short = self._try_take(chat_id, time.monotonic())
+                if short != starved:
+                    starved = short
+                    self._starve(1 if short else -1)
+                if not wait:
+                    return
+                await asyncio.sleep(wait)
+        finally:
+            if starved:
+                self._starve(-1)
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        bulk = rate_limit_args in ("bulk", "group")
+        stats = self.stats[rate_limit_args if bulk else "interactive"]
+        chat_id = data.get("chat_id")
+        # ответы на callback/inline-запросы не привязаны к чату и не ждут
+        limited = endpoint.startswith(("send", "edit", "copy", "forward"))
+
+        for attempt in range(FLOOD_RETRIES + 1):
+            if limited:
+                queued = time.monotonic()
+                await self._acquire(chat_id, bulk)
+                waited = time.monotonic() - queued
+                stats["count"] += 1
+                stats["wait_total"] += waited
+                stats["wait_max"] = max(stats["wait_max"], waited)
+            try:
+                return await callback(*args, **kwargs)
+            except RetryAfter as e:
+                if attempt == FLOOD_RETRIES:
+                    raise
+                delay = e.retry_after
+                if isinstance(delay, timedelta):
+                    delay = delay.total_seconds()
+                stats["retries"] += 1
+                self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                logger.warning(f"Flood control on {endpoint}: retry in {delay}s")
+                await asyncio.sleep(delay)
+
+
+OUTBOUND = OutboundLimiter()
+
+
+def bulk_bot(context: ContextTypes.DEFAULT_TYPE):
+    """Бот с отдельным пулом для рассылок (если еще не создан — основной)."""
+    return context.application.bot_data.get("bulk_bot", context.bot)
+
+
+async def post_init(app):
+    # отдельный бот с маленьким пулом под рассылки, с тем же ограничителем
+    bulk = ExtBot(
+        app.bot.token,
+        request=HTTPXRequest(connection_pool_size=BULK_POOL_SIZE, pool_timeout=30.0),
+        rate_limiter=OUTBOUND,
+    )
+    await bulk.initialize()
+    app.bot_data["bulk_bot"] = bulk
+    start_group_workers(app)
+    await set_commands(app)
+
+
+async def post_shutdown(app):
+    bulk = app.bot_data.pop("bulk_bot", None)
+    if bulk:
+        await bulk.shutdown()
+    # не теряем накопленное в памяти при остановке контейнера
+    await save_file_ids(None)
+    await save_series(None)
+    await save_challenge_stats(None)
+    await flush_suggestions(None)
+    await duel_flush(0)
+    await flush_last_seen(None)
+
 
 async def set_commands(app):
     
@@ -59,15 +249,27 @@ async def set_commands(app):
         [
             BotCommand("start",         "Показать приветствие"),
             BotCommand("play",          "Начать новую игру"),
+            BotCommand("daily",         "Слово дня"),
+            BotCommand("daily_top",     "Лидеры слова дня"),
+            BotCommand("duel",          "Дуэль с другим игроком"),
+            BotCommand("absurd",        "Абсурд: слово уворачивается от догадок"),
+            BotCommand("challenge",     "Вызов другу по ссылке"),
             BotCommand("hint",    "Подсказка"),
             BotCommand("reset",         "Сбросить игру"),
             BotCommand("notification",         "Включить/Отключить уведомления"),
+            BotCommand("display",       "Доска: картинка, текст или одно сообщение"),
+            BotCommand("hard",          "Хард-режим вкл/выкл"),
             BotCommand("my_stats",      "Ваша статистика"),
             BotCommand("global_stats",  "Глобальная статистика"),
             BotCommand("feedback", "Жалоба на слово"),
             BotCommand("dict_file",  "Посмотреть словарь"),
-            BotCommand("dump_activity", "Скачать user_activity.json"),
+            BotCommand("dict_reload", "Перечитать словарь без перезапуска"),
+            BotCommand("dump_activity", "Скачать user_activity (summary — только сводка)"),
+            BotCommand("activity", "Графики активности (minute|hour|day)"),
+            BotCommand("profile", "Профилирование: start [секунд] [sample|cprofile] | stop"),
+            BotCommand("memsnap", "Топ аллокаций памяти (tracemalloc)"),
             BotCommand("suggestions_view", "Посмотреть фидбек юзеров"),
+            BotCommand("suggestions_review", "Модерация предложений с кнопками"),
             BotCommand("suggestions_move", "Переместить слово из белого списка в add список"),
             BotCommand("suggestions_remove", "Удалить что-то из фидбека"),
             BotCommand("suggestions_approve", "Внести изменения в словарь"),
@@ -80,50 +282,410 @@ async def set_commands(app):
     )
 
 
-def load_suggestions() -> dict[str, set[str]]:
-    """Возвращает {'black': set(...), 'white': set(...), 'add': set(...)} без дубликатов."""
+def _fsync_dir(path: Path) -> None:
+    """fsync каталога, чтобы rename/unlink пережили падение питания."""
+    try:
+        fd = os.open(path.parent.resolve(), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _journal_path(path: Path) -> Path:
+    return path.with_name(path.name + ".journal")
+
+
+def _tmp_path(path: Path) -> Path:
+    return path.with_name(path.name + ".tmp")
+
+
+def atomic_write_bytes(path: Path, data: bytes) -> None:
+    """
+    Надежная запись файла:
+    1) журнал намерения (размер и sha256 новых данных) + fsync;
+    2) данные во временный файл + fsync;
+    3) os.replace поверх старого файла + fsync каталога;
+    4) удаление журнала.
+    Если процесс упадет на любом шаге, recover_writes при старте
+    либо доведет замену до конца, либо откатит ее — полуфайла не будет.
+    """
+    journal, tmp = _journal_path(path), _tmp_path(path)
+    intent = {"size": len(data), "sha256": hashlib.sha256(data).hexdigest()}
+
+    with journal.open("w", encoding="utf-8") as f:
+        json.dump(intent, f)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_dir(path)
+
+    with tmp.open("wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(tmp, path)
+    _fsync_dir(path)
+    journal.unlink()
+    _fsync_dir(path)
+
+
+def recover_writes(path: Path) -> None:
+    """
+    Восстановление после падения посреди atomic_write_bytes.
+    Временный файл целиком совпадает с журналом — доводим замену (replay),
+    иначе — выбрасываем его, старый файл остается как был (rollback).
+    """
+    journal, tmp = _journal_path(path), _tmp_path(path)
+    if not journal.exists():
+        if tmp.exists():
+            tmp.unlink()
+        return
+
+    try:
+        intent = json.loads(journal.read_text("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        intent = None
+
+    data = tmp.read_bytes() if tmp.exists() else None
+    if (
+        intent and data is not None
+        and len(data) == intent.get("size")
+        and hashlib.sha256(data).hexdigest() == intent.get("sha256")
+    ):
+        os.replace(tmp, path)
+        logger.warning(f"Recovered interrupted write of {path} (replayed)")
+    else:
+        if tmp.exists():
+            tmp.unlink()
+        logger.warning(f"Recovered interrupted write of {path} (rolled back)")
+    _fsync_dir(path)
+    journal.unlink()
+    _fsync_dir(path)
+
+
+class _InjectedCrash(Exception):
+    """Имитация падения процесса в bench_writes (не OSError, чтобы _fsync_dir ее не глотал)."""
+
+
+def bench_writes(sizes: tuple[int, ...] = (1024, 100 * 1024, 1024 * 1024), saves: int = 50) -> str:
+    """
+    1) Инъекция сбоев: роняем atomic_write_bytes перед каждым fsync (и с
+       недописанным временным файлом), зовем recover_writes и проверяем,
+       что файл целиком старый или целиком новый.
+    2) Цена сохранения: atomic_write_bytes против простого write_bytes без fsync.
+    Все во временном каталоге. Запуск: python bot.py --bench-writes
+    """
+    lines, failures = ["Инъекция сбоев (падение перед N-м fsync):"], 0
+    old, new = b"old" * 1000, b"new" * 2000
+    real_fsync = os.fsync
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / "state.json"
+        # 5 fsync на запись; 6 — запись без сбоя; torn — временный файл оборван
+        for crash_at, torn in [(n, False) for n in range(1, 7)] + [(3, True)]:
+            path.write_bytes(old)
+            calls = 0
+
+            def fsync(fd):
+                nonlocal calls
+                calls += 1
+                if calls == crash_at:
+                    raise _InjectedCrash()
+                real_fsync(fd)
+
+            os.fsync = fsync
+            try:
+                atomic_write_bytes(path, new)
+            except _InjectedCrash:
+                pass
+            finally:
+                os.fsync = real_fsync
+            tmp = _tmp_path(path)
+            if torn and tmp.exists():
+                tmp.write_bytes(tmp.read_bytes()[:len(new) // 2])
+            recover_writes(path)
+
+            data = path.read_bytes()
+            leftovers = tmp.exists() or _journal_path(path).exists()
+            ok = data in (old, new) and not leftovers
+            failures += not ok
+            state = "новый" if data == new else "старый" if data == old else "БИТЫЙ"
+            label = f"fsync {crash_at}" + (" + обрыв tmp" if torn else "") if crash_at <= 5 else "без сбоя"
+            lines.append(f"  {label:<20} → {state:<6} {'ok' if ok else 'ОШИБКА'}")
+
+        lines.append(f"Сбоев проверки: {failures}")
+        lines.append("")
+        lines.append("размер     atomic мс/запись   без fsync мс/запись   записей/с")
+        for size in sizes:
+            data = os.urandom(size)
+            started = time.perf_counter()
+            for _ in range(saves):
+                atomic_write_bytes(path, data)
+            atomic = (time.perf_counter() - started) / saves
+            started = time.perf_counter()
+            for _ in range(saves):
+                path.write_bytes(data)
+            plain = (time.perf_counter() - started) / saves
+            lines.append(
+                f"{size // 1024:>5} КиБ  {atomic * 1000:>16.2f}  {plain * 1000:>20.2f}  {1 / atomic:>10,.0f}"
+            )
+    return "\n".join(lines)
+
+
+def quarantine_corrupt(path: Path) -> None:
+    """Откладывает битый файл в сторону, чтобы пустой шаблон не затер данные навсегда."""
+    backup = path.with_name(f"{path.name}.corrupt-{datetime.now().strftime('%Y%m%d%H%M%S')}")
+    os.replace(path, backup)
+    logger.error(f"{path} is corrupt, moved to {backup}")
+
+
+# Списки предложений и лимит на общее число слов в них
+SUGGESTION_LISTS = ("black", "white", "add")
+SUGGESTIONS_LIMIT = 5000
+
+
+def load_suggestions() -> dict[str, dict[str, dict]]:
+    """
+    Возвращает индекс предложений:
+    {'black': {слово: {"users": [uid, ...], "votes": n, "first_seen": iso}}, 'white': {...}, 'add': {...}}
+    Старый формат (просто списки слов) переводится на лету, авторы
+    восстанавливаются по suggested_words пользователей.
+    """
+    empty = {key: {} for key in SUGGESTION_LISTS}
     if not SUGGESTIONS_FILE.exists():
-        return {"black": set(), "white": set(), "add": set()}
+        return empty
     raw = SUGGESTIONS_FILE.read_text("utf-8").strip()
     if not raw:
-        return {"black": set(), "white": set(), "add": set()}
+        return empty
     try:
         data = json.loads(raw)
-        return {
-            "black": set(data.get("black", [])),
-            "white": set(data.get("white", [])),
-            "add": set(data.get("add", [])),
-        }
     except json.JSONDecodeError:
-        return {"black": set(), "white": set(), "add": set()}
+        return empty
+
+    out, migrated = {}, False
+    for key in SUGGESTION_LISTS:
+        val = data.get(key, {})
+        if isinstance(val, list):
+            migrated = True
+            val = {w: {"users": [], "votes": 0, "first_seen": None} for w in val}
+        out[key] = val
+
+    if migrated:
+        for uid, udata in load_store()["users"].items():
+            for w in udata.get("suggested_words", []):
+                for key in SUGGESTION_LISTS:
+                    entry = out[key].get(w)
+                    if entry is not None and uid not in entry["users"]:
+                        entry["users"].append(uid)
+                        entry["votes"] += 1
+    return out
+
+
+# Голоса копятся в памяти и сбрасываются джобой flush_suggestions раз в минуту
+_suggestions_dirty = False
+
+
+def save_suggestions(sugg: dict[str, dict[str, dict]]):
+    """Сохраняет индекс предложений (слова отсортированы для читаемого диффа)."""
+    global _suggestions_dirty
+    _suggestions_dirty = False
+    atomic_write_bytes(
+        SUGGESTIONS_FILE,
+        json.dumps(sugg, ensure_ascii=False, indent=2, sort_keys=True).encode("utf-8")
+    )
+
 
+def suggestions_count() -> int:
+    return sum(len(suggestions[key]) for key in SUGGESTION_LISTS)
 
 
-def save_suggestions(sugg: dict[str, set[str]]):
+def suggest_word(target: str, word: str, uid: str) -> bool:
     """
-    Сохраняет suggestions, конвертируя множества в отсортированные списки.
+    Добавляет голос uid за слово в списке target.
+    Возвращает False, если слово новое, а лимит предложений исчерпан.
     """
-    out = {
-        "black": sorted(sugg["black"]),
-        "white": sorted(sugg["white"]),
-        "add": sorted(sugg["add"]),
-    }
-    with SUGGESTIONS_FILE.open("w", encoding="utf-8") as f:
-        json.dump(out, f, ensure_ascii=False, indent=2)
+    global _suggestions_dirty
+    entry = suggestions[target].get(word)
+    if entry is None:
+        if suggestions_count() >= SUGGESTIONS_LIMIT:
+            return False
+        entry = suggestions[target][word] = {
+            "users": [], "votes": 0, "first_seen": datetime.now(MSK).isoformat(timespec="seconds")
+        }
+    if uid not in entry["users"]:
+        entry["users"].append(uid)
+        entry["votes"] += 1
+        _suggestions_dirty = True
+    return True
 
 
-# загружаем один раз при старте
-suggestions = load_suggestions()
+async def flush_suggestions(context: ContextTypes.DEFAULT_TYPE):
+    """Пишет suggestions.json, только если с прошлого раза были голоса."""
+    if _suggestions_dirty:
+        save_suggestions(suggestions)
+
+
+def drop_suggestions(store: dict, items: list[tuple[str, str]]) -> int:
+    """
+    Убирает (список, слово) из предложений и из suggested_words авторов.
+    Благодаря обратному индексу слово → авторы трогаем только затронутых
+    пользователей. Возвращает, сколько слов убрано из профилей.
+    """
+    removed = 0
+    for key, word in items:
+        entry = suggestions[key].pop(word, None)
+        if entry is None:
+            continue
+        for uid in entry["users"]:
+            words = store["users"].get(uid, {}).get("suggested_words")
+            if words and word in words:
+                words.remove(word)
+                removed += 1
+    return removed
+
+
+# доводим/откатываем прерванные записи до первого чтения
+recover_writes(SUGGESTIONS_FILE)
+recover_writes(USER_FILE)
+
+
+# --- Кодеки для user_activity.json ---
+# Пишем выбранным кодеком (STORE_CODEC), читаем любым: формат определяется
+# по первому байту, так что старые файлы с отступами мигрируют сами при
+# первой же записи. Имя файла не меняется, чтобы журнал записи и бэкапы работали как раньше.
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+class CodecUnavailable(RuntimeError):
+    """Файл записан кодеком, библиотеки которого нет — такой файл нельзя считать битым."""
+
+
+CODECS = {
+    # прежний формат: читать глазами удобно, но это самый медленный и самый большой вариант
+    "json-pretty": lambda obj: json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8"),
+    "json": lambda obj: json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"),
+}
+if orjson:
+    CODECS["orjson"] = lambda obj: orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+if msgpack:
+    CODECS["msgpack"] = lambda obj: msgpack.packb(obj, use_bin_type=True)
+
+STORE_CODEC = os.getenv("STORE_CODEC", "orjson" if orjson else "json")
+if STORE_CODEC not in CODECS:
+    logger.warning(f"STORE_CODEC={STORE_CODEC} недоступен, пишем json (есть: {', '.join(CODECS)})")
+    STORE_CODEC = "json"
+
+# первый байт msgpack-контейнера: fixmap, fixarray, map16/32, array16/32
+_MSGPACK_FIRST = frozenset(range(0x80, 0xa0)) | {0xdc, 0xdd, 0xde, 0xdf}
+
+
+def encode_state(obj, codec: str | None = None) -> bytes:
+    return CODECS[codec or STORE_CODEC](obj)
+
+
+def decode_state(raw: bytes):
+    """
+    Разбирает данные любого из кодеков. Ошибки формата — ValueError
+    (JSONDecodeError, ошибки msgpack); нет библиотеки — CodecUnavailable.
+    """
+    head = raw.lstrip()[:1]
+    if head in (b"{", b"["):
+        return orjson.loads(raw) if orjson else json.loads(raw)
+    if head and head[0] in _MSGPACK_FIRST:
+        if msgpack is None:
+            raise CodecUnavailable("файл записан в msgpack, а пакет msgpack не установлен")
+        return msgpack.unpackb(raw, raw=False, strict_map_key=False)
+    raise ValueError("неизвестный формат данных")
+
+
+def bench_store_codecs(sizes: tuple[int, ...] = (1_000, 10_000, 100_000)) -> str:
+    """
+    Время кодирования/разбора и размер стора на синтетических пользователях
+    во всех доступных кодеках. Чтение — через decode_state, как в load_store
+    (JSON любого вида разбирает orjson, если он есть). Запуск: python bot.py --bench-store
+    """
+    rng = random.Random(0)
+    words = WORDS_BY_LENGTH.get(5, ["слово"])
+    lines = ["юзеров  кодек         запись мс   чтение мс     размер"]
+    for n in sizes:
+        users = {}
+        for i in range(n):
+            played = rng.randint(0, 200)
+            wins = rng.randint(0, played)
+            u = {
+                "first_name": f"Игрок{i}", "last_name": None, "username": f"user{i}",
+                "is_bot": False, "is_premium": rng.random() < 0.1, "language_code": "ru",
+                "last_seen_msk": datetime.now(MSK).isoformat(), "banned": False,
+                "stats": {
+                    "games_played": played, "wins": wins, "losses": played - wins,
+                    "win_rate": wins / played if played else 0.0,
+                    "dist": [rng.randint(0, wins) for _ in range(6)],
+                    "by_length": {"5": {"played": played, "wins": wins}},
+                    "streak": rng.randint(0, 10), "max_streak": rng.randint(0, 20),
+                },
+            }
+            if rng.random() < 0.2:
+                u["current_game"] = {
+                    "secret": rng.choice(words), "attempts": 2,
+                    "guesses": rng.sample(words, 2), "started_at": int(time.time()),
+                }
+            users[str(100_000_000 + i)] = u
+        store = {"users": users, "global": {"total_games": n, "total_wins": n // 2,
+                                            "total_losses": n // 2, "win_rate": 0.5}, "daily": {}}
+        for codec in CODECS:
+            # сборщик мусора на больших сторах дает шум в разы больше разницы кодеков
+            gc.collect()
+            gc.disable()
+            try:
+                started = time.perf_counter()
+                raw = encode_state(store, codec)
+                encoded = time.perf_counter() - started
+                started = time.perf_counter()
+                decode_state(raw)
+                decoded = time.perf_counter() - started
+            finally:
+                gc.enable()
+            lines.append(
+                f"{n:>6}  {codec:<12} {encoded * 1000:>9.1f}  {decoded * 1000:>10.1f}  {len(raw) / 1024:>8.0f} КиБ"
+            )
+    return "\n".join(lines)
+
+
+# Игры только что сведенных дуэлей, еще не записанные на диск: {uid: current_game}.
+# load_store подмешивает их сам, duel_flush пишет пачкой (см. «Дуэли»).
+_duel_unsaved: dict[str, dict] = {}
+
 
 def load_store() -> dict:
     """
-    Загружает user_activity.json.
+    Загружает user_activity.json (с еще не записанными играми дуэлей).
     Если файла нет или он пуст/битый — возвращает чистый шаблон:
     {
       "users": {},
-      "global": { "total_games":0, "total_wins":0, "total_losses":0, "win_rate":0.0 }
+      "global": { "total_games":0, "total_wins":0, "total_losses":0, "win_rate":0.0 },
+      "daily": { "<дата>": { "<длина>": агрегат дня } }
     }
     """
+    store = read_store()
+    if _duel_unsaved:
+        duel_overlay(store)
+    return store
+
+
+def read_store() -> dict:
+    """Сам файл user_activity.json без наложений из памяти."""
     template = {
         "users": {},
         "global": {
@@ -131,22 +693,26 @@ def load_store() -> dict:
             "total_wins": 0,
             "total_losses": 0,
             "win_rate": 0.0
-        }
+        },
+        "daily": {}
     }
     if not USER_FILE.exists():
         return template
 
-    raw = USER_FILE.read_text("utf-8").strip()
-    if not raw:
+    raw = USER_FILE.read_bytes()
+    if not raw.strip():
         return template
 
     try:
-        data = json.loads(raw)
-    except json.JSONDecodeError:
+        # CodecUnavailable не ловим: такой файл цел, просто нечем его прочесть
+        data = decode_state(raw)
+    except (ValueError, UnicodeDecodeError):
+        quarantine_corrupt(USER_FILE)
         return template
 
     # Убедимся, что структура корректна
     if not isinstance(data, dict):
+        quarantine_corrupt(USER_FILE)
         return template
 
     # Проверим разделы
@@ -154,6 +720,8 @@ def load_store() -> dict:
         data["users"] = {}
     if not isinstance(data.get("global"), dict):
         data["global"] = template["global"].copy()
+    if not isinstance(data.get("daily"), dict):
+        data["daily"] = {}
 
     # Подставим недостающие ключи в global
     for key, val in template["global"].items():
@@ -163,17 +731,59 @@ def load_store() -> dict:
 
 def save_store(store: dict) -> None:
     """
-    Сохраняет переданный store в USER_FILE в JSON-формате с отступами.
+    Атомарно сохраняет переданный store в USER_FILE кодеком STORE_CODEC.
     Ожидаем, что store имеет формат:
     {
       "users": { ... },
       "global": { ... }
     }
+    Профили и last_seen из памяти (update_user_activity) накладываются на
+    store перед записью — устаревшая копия стора их не откатит.
     """
-    USER_FILE.write_text(
-        json.dumps(store, ensure_ascii=False, indent=2),
-        encoding="utf-8"
-    )
+    merge_activity(store)
+    atomic_write_bytes(USER_FILE, encode_state(store))
+
+# загружаем один раз при старте, дальше работаем с индексом в памяти
+suggestions = load_suggestions()
+
+
+# Профиль и last_seen копятся в памяти и пишутся на диск раз в LAST_SEEN_FLUSH_INTERVAL секунд
+LAST_SEEN_FLUSH_INTERVAL = 300
+# Последнее известное по недавно активным: {uid: {"profile", "last_seen", "at": monotonic}}.
+# save_store накладывает это на любой сохраняемый стор, поэтому обработчик,
+# загрузивший стор до сброса, своим сохранением сброс не откатит.
+_activity_seen: dict[str, dict] = {}
+# Кто менялся с последнего сброса
+_activity_dirty: set[str] = set()
+
+
+def seen_newer(a: str | None, b: str | None) -> bool:
+    """True, если отметка a свежее b (b пустая — тоже True)."""
+    if not a:
+        return False
+    if not b:
+        return True
+    try:
+        return datetime.fromisoformat(a) > datetime.fromisoformat(b)
+    except ValueError:
+        return True
+
+
+def apply_activity(u: dict, profile: dict, last_seen: str) -> None:
+    """Переносит профиль и last_seen в запись; старая отметка не затирает более новую."""
+    u.update(profile)
+    if seen_newer(last_seen, u.get("last_seen_msk")):
+        u["last_seen_msk"] = last_seen
+
+
+def merge_activity(store: dict) -> None:
+    """Накладывает профили и last_seen недавно активных на store перед записью."""
+    users = store["users"]
+    for uid, seen in _activity_seen.items():
+        u = users.get(uid)
+        if u is not None:
+            apply_activity(u, seen["profile"], seen["last_seen"])
+
 
 def update_user_activity(user) -> None:
     """
@@ -183,13 +793,37 @@ def update_user_activity(user) -> None:
     - last_seen_msk (по московскому времени)
     - stats (если еще нет): games_played, wins, losses, win rate
     - banned: флаг бана пользователя (если не установлен, то False)
+    Стор читается только при первом обращении пользователя (чтобы сразу
+    завести запись); дальше профиль и last_seen обновляются в памяти и
+    попадают на диск с ближайшим save_store или в flush_last_seen.
     """
-    store = load_store()
     uid = str(user.id)
+    now = time.monotonic()
+    last_seen = datetime.now(MSK).isoformat()
+    profile = {
+        "first_name":    user.first_name,
+        "last_name":     user.last_name,
+        "username":      user.username,
+        "is_bot":        user.is_bot,
+        "is_premium":    getattr(user, "is_premium", False),
+        "language_code": user.language_code,
+    }
+
+    seen = _activity_seen.get(uid)
+    if seen is not None:
+        seen["at"] = now
+        seen["profile"] = profile
+        if seen_newer(last_seen, seen["last_seen"]):
+            seen["last_seen"] = last_seen
+        _activity_dirty.add(uid)
+        return
+
+    store = load_store()
     users = store["users"]
 
     # Если пользователь впервые — создаем базовую запись
     if uid not in users:
+        series_add("new_users")
         users[uid] = {
             "first_name": user.first_name,
             "suggested_words": [],  # Список слов, предложенных пользователем
@@ -202,17 +836,226 @@ def update_user_activity(user) -> None:
             "banned": False  # По умолчанию пользователь не забанен
         }
 
-    u = users[uid]
-    # Обновляем поля профиля
-    u["first_name"]    = user.first_name
-    u["last_name"]     = user.last_name
-    u["username"]      = user.username
-    u["is_bot"]        = user.is_bot
-    u["is_premium"]    = getattr(user, "is_premium", False)
-    u["language_code"] = user.language_code
-    u["last_seen_msk"] = datetime.now(ZoneInfo("Europe/Moscow")).isoformat()
+    _activity_seen[uid] = {"profile": profile, "last_seen": last_seen, "at": now}
+    save_store(store)
+
+
+async def flush_last_seen(context: ContextTypes.DEFAULT_TYPE):
+    """Периодически сбрасывает накопленные профили и last_seen одной записью и забывает неактивных."""
+    if _activity_dirty:
+        _activity_dirty.clear()
+        # save_store сам наложит накопленное из _activity_seen
+        save_store(load_store())
+    now = time.monotonic()
+    for uid, seen in list(_activity_seen.items()):
+        if now - seen["at"] >= LAST_SEEN_FLUSH_INTERVAL:
+            del _activity_seen[uid]
+
+
+# --- Защита от флуда ---
+# Токен-бакет на пользователя до всех хендлеров: лишние апдейты отбрасываются
+# еще до load_store и рендера. Состояние — только по недавно активным.
+
+FLOOD_RATE = float(os.getenv("FLOOD_RATE", "1.0"))     # апдейтов в секунду в среднем
+FLOOD_BURST = int(os.getenv("FLOOD_BURST", "5"))       # сколько можно подряд
+FLOOD_STRIKES = 10          # отброшенных апдейтов до временного мута
+FLOOD_MUTE_BASE = 30        # первый мут, секунд; каждый следующий вдвое дольше
+FLOOD_MUTE_MAX = 3600
+FLOOD_FORGET = 600          # через сколько секунд тишины забываем пользователя
+
+# {user_id: {"tokens", "at", "strikes", "warned", "mutes", "muted_until"}}
+_flood: dict[int, dict] = {}
+_flood_swept = 0.0
+
+
+def flood_sweep(now: float) -> None:
+    """Раз в минуту выкидывает тех, кто молчит дольше FLOOD_FORGET и не в муте."""
+    global _flood_swept
+    if now - _flood_swept < 60:
+        return
+    _flood_swept = now
+    for user_id, st in list(_flood.items()):
+        if now - st["at"] >= FLOOD_FORGET and st["muted_until"] <= now:
+            del _flood[user_id]
+
+
+async def flood_guard(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Группа -2: пропускает не чаще FLOOD_RATE/с с запасом FLOOD_BURST, остальное отбрасывает."""
+    user = update.effective_user
+    if not user or user.id == ADMIN_ID or update.inline_query:
+        # inline-запросы идут на каждое нажатие клавиши, дешевы и троттлятся самим Telegram
+        return
+    # в группах обычная переписка не должна тратить токены; там догадки ограничены очередью чата
+    chat = update.effective_chat
+    if chat and chat.type != "private":
+        return
+    now = time.monotonic()
+    flood_sweep(now)
+
+    st = _flood.get(user.id)
+    if st is None:
+        st = _flood[user.id] = {
+            "tokens": float(FLOOD_BURST), "at": now,
+            "strikes": 0, "warned": False, "mutes": 0, "muted_until": 0.0,
+        }
+    if st["muted_until"] > now:
+        raise ApplicationHandlerStop
+
+    st["tokens"] = min(FLOOD_BURST, st["tokens"] + (now - st["at"]) * FLOOD_RATE)
+    st["at"] = now
+    if st["tokens"] >= 1:
+        st["tokens"] -= 1
+        if st["tokens"] >= FLOOD_BURST - 1:
+            # успокоился — прощаем предупреждение
+            st["strikes"], st["warned"] = 0, False
+        return
+
+    st["strikes"] += 1
+    message = update.effective_message
+    if st["strikes"] >= FLOOD_STRIKES:
+        mute = min(FLOOD_MUTE_BASE * 2 ** st["mutes"], FLOOD_MUTE_MAX)
+        st["mutes"] += 1
+        st["muted_until"] = now + mute
+        st["strikes"], st["warned"] = 0, False
+        logger.info(f"Flood: user {user.id} muted for {mute}s")
+        if message:
+            await message.reply_text(f"🔇 Слишком много сообщений. Я не буду отвечать {mute} с.")
+    elif not st["warned"]:
+        st["warned"] = True
+        if message:
+            await message.reply_text("⏳ Не так быстро — лишние сообщения я пропускаю.")
+    elif update.callback_query:
+        await update.callback_query.answer()
+    raise ApplicationHandlerStop
+
+
+# --- Уборка: простаивающие сессии и брошенные игры ---
+
+SESSION_GC_INTERVAL = 3600
+# Через сколько секунд простоя забываем context.user_data пользователя
+USER_DATA_TTL = int(os.getenv("USER_DATA_TTL", str(6 * 3600)))
+# Через сколько дней без ходов игра считается брошенной
+GAME_ABANDON_DAYS = int(os.getenv("GAME_ABANDON_DAYS", "7"))
+# "expire" — просто убрать игру, "loss" — засчитать поражение
+ABANDONED_GAMES = os.getenv("ABANDONED_GAMES", "expire")
+
+# Время последнего апдейта от пользователя {user_id: monotonic}
+_user_last_active: dict[int, float] = {}
+
+
+async def touch_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Группа -1: отмечает время любого апдейта от пользователя."""
+    if update.effective_user:
+        _user_last_active[update.effective_user.id] = time.monotonic()
+
+
+def game_last_move(cg: dict) -> float:
+    """
+    Unix-время последнего хода в игре (у старых игр без last_move — начало игры).
+    По last_seen судить нельзя: игрок мог жать /stats, а игру давно бросить.
+    У игр из версий без отметок времени нет ни того, ни другого — считаем их
+    свежими (gc_sessions проставит last_move, и отсчет пойдет с момента обновления).
+    """
+    return cg.get("last_move", cg.get("started_at", time.time()))
+
+
+def drop_conversations(app, user_ids: set[int]) -> None:
+    """
+    Забывает состояния ConversationHandler'ов этих пользователей. Публичного
+    API у PTB для этого нет, поэтому чистим _conversations (ключ — (chat_id, user_id)).
+    """
+    if not user_ids:
+        return
+    for handlers in app.handlers.values():
+        for handler in handlers:
+            if isinstance(handler, ConversationHandler):
+                for key in [k for k in handler._conversations if k and k[-1] in user_ids]:
+                    del handler._conversations[key]
+
+
+def compact_user(user: dict, today: str) -> None:
+    """Убирает из записи пользователя пустые и устаревшие поля."""
+    for key in ("suggested_words",):
+        if not user.get(key, True):
+            del user[key]
+    for key in ("notified", "was_banned"):
+        if user.get(key) is False:
+            del user[key]
+    if user.get("daily_played", {}).get("day", today) != today:
+        del user["daily_played"]
+
+
+async def gc_sessions(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Забывает user_data пользователей, молчащих дольше USER_DATA_TTL,
+    закрывает игры без ходов дольше GAME_ABANDON_DAYS и ужимает стор.
+    """
+    app = context.application
+    now = time.monotonic()
+    evicted = set()
+    for user_id in list(app.user_data):
+        last = _user_last_active.get(user_id)
+        if last is not None and now - last < USER_DATA_TTL:
+            continue
+        # ждущий дуэли живет в очереди — его не трогаем
+        if app.user_data[user_id].get("duel_waiting"):
+            continue
+        app.drop_user_data(user_id)
+        _user_last_active.pop(user_id, None)
+        evicted.add(user_id)
+    for user_id, last in list(_user_last_active.items()):
+        if now - last >= USER_DATA_TTL:
+            del _user_last_active[user_id]
 
+    store = load_store()
+    cutoff = time.time() - GAME_ABANDON_DAYS * 86400
+    today = today_msk()
+    closed, closed_users = 0, set()
+    # дуэль закрываем, только когда ее бросили оба: тогда матч и индекс игроков
+    # забываем, и их игры ниже закрываются как обычные
+    for match in list(DUEL_MATCHES.values()):
+        games = [store["users"].get(uid, {}).get("current_game") for uid in match["players"]]
+        if all(not g or g.get("duel") != match["id"] or game_last_move(g) < cutoff for g in games):
+            duel_finish(match)
+    for uid, user in store["users"].items():
+        cg = user.get("current_game")
+        if cg and "last_move" not in cg and "started_at" not in cg:
+            cg["last_move"] = int(time.time())
+        if cg and uid not in USER_DUEL and game_last_move(cg) < cutoff:
+            del user["current_game"]
+            closed += 1
+            if ABANDONED_GAMES == "loss" and cg["attempts"] > 0:
+                stats = user["stats"]
+                stats["games_played"] += 1
+                stats["losses"] += 1
+                stats["win_rate"] = stats["wins"] / stats["games_played"]
+                record_user_result(user, False, cg)
+                g = store["global"]
+                g["total_games"] += 1
+                g["total_losses"] += 1
+                g["win_rate"] = g["total_wins"] / g["total_games"]
+            user.pop("notified", None)
+            if uid.isdigit():
+                closed_users.add(int(uid))
+        compact_user(user, today)
+    closed_chats = 0
+    for chat in GROUPS.values():
+        cg = chat.get("current_game")
+        if cg and game_last_move(cg) < cutoff:
+            del chat["current_game"]
+            closed_chats += 1
+    if closed_chats:
+        save_groups()
+    closed += closed_chats
+    store["global"]["abandoned_games"] = store["global"].get("abandoned_games", 0) + closed
     save_store(store)
+    # состояние диалога оставляем тем, у кого игра жива: по нему догадки идут в handle_guess
+    drop_conversations(app, {
+        user_id for user_id in evicted | closed_users
+        if "current_game" not in store["users"].get(str(user_id), {})
+    })
+    if evicted or closed:
+        logger.info(f"Session GC: dropped user_data of {len(evicted)} idle users, closed {closed} abandoned games")
 
 
 def clear_notification_flag(user_id: str):
@@ -273,15 +1116,49 @@ KB_LAYOUT = [
     list("ячсмитьбю")
 ]
 
-def render_full_board_with_keyboard(
-    guesses: list[str],
-    secret: str,
-    total_rows: int = 6,
-    max_width_px: int = 1080
-) -> BytesIO:
+# Формат картинки доски: "png-p" (палитра, по умолчанию), "png" (RGB) или "webp"
+BOARD_FORMAT = os.getenv("BOARD_FORMAT", "png-p")
+# Уровень zlib для PNG (0–9): меньше — быстрее кодирование, больше — меньше байт
+BOARD_COMPRESS_LEVEL = int(os.getenv("BOARD_COMPRESS_LEVEL", "6"))
+# Цветов в палитре: на доске ~6 цветов, остальное — сглаживание букв
+BOARD_PALETTE_COLORS = int(os.getenv("BOARD_PALETTE_COLORS", "32"))
+# Качество WebP (0–100)
+BOARD_WEBP_QUALITY = int(os.getenv("BOARD_WEBP_QUALITY", "80"))
+# Наибольший размер клетки доски в пикселях — от него зависит размер картинки.
+# (Ограничение ширины в 1080 px при клетке 80 px не срабатывает: самая широкая доска ~950 px.)
+BOARD_CELL_PX = int(os.getenv("BOARD_CELL_PX", "80"))
+
+
+def encode_board(img: Image.Image, fmt: str | None = None) -> BytesIO:
+    """Кодирует картинку доски в выбранный формат; имя файла — в buf.name."""
+    fmt = fmt or BOARD_FORMAT
+    buf = BytesIO()
+    if fmt == "webp":
+        img.save(buf, format="WEBP", quality=BOARD_WEBP_QUALITY, method=2)
+        buf.name = "wordle_board.webp"
+    elif fmt == "png-p":
+        img.quantize(BOARD_PALETTE_COLORS, method=Image.Quantize.FASTOCTREE).save(
+            buf, format="PNG", compress_level=BOARD_COMPRESS_LEVEL
+        )
+        buf.name = "wordle_board.png"
+    else:
+        img.save(buf, format="PNG", compress_level=BOARD_COMPRESS_LEVEL)
+        buf.name = "wordle_board.png"
+    buf.seek(0)
+    return buf
+
+
+# Цвета клеток: по символу фидбека и по статусу буквы на клавиатуре
+BG_BY_FEEDBACK = {"🟩": (106,170,100), "🟨": (201,180,88), "⬜": (128,128,128)}
+BG_BY_STATUS   = {"green": (106,170,100), "yellow": (201,180,88), "red": (128,128,128)}
+EMPTY_BG       = (255,255,255)
+
+
+@lru_cache(maxsize=64)
+def board_layout(cols: int, total_rows: int = 6, max_width_px: int = 1080) -> dict:
+    """Геометрия картинки для слова из cols букв (не зависит от загаданного слова)."""
     padding   = 6
-    board_def = 80
-    cols      = len(secret)
+    board_def = BOARD_CELL_PX
     total_pad = (cols + 1) * padding
 
     # размер квадратика доски
@@ -307,210 +1184,1692 @@ def render_full_board_with_keyboard(
     kb_rows = len(KB_LAYOUT)
     img_h   = board_h + kb_rows * kb_sq + (kb_rows + 1) * padding
 
-    img        = Image.new("RGB", (board_w, img_h), (30, 30, 30))
-    draw       = ImageDraw.Draw(img)
-    font_board = ImageFont.truetype("DejaVuSans-Bold.ttf", int(board_sq * 0.6))
-    font_kb    = ImageFont.truetype("DejaVuSans-Bold.ttf", int(kb_sq * 0.6))
-
-    # --- игровая доска (6 строк) ---
-    for r in range(total_rows):
-        y0 = padding + r * (board_sq + padding)
-        if r < len(guesses):
-            guess = guesses[r]
-            fb    = make_feedback(secret, guess)
-        else:
-            guess = None
-            fb    = [None] * cols
-
-        for c in range(cols):
-            x0 = padding + c * (board_sq + padding)
-            x1 = x0 + board_sq
-            y1 = y0 + board_sq
-
-            color = fb[c]
-            if color == GREEN:
-                bg = (106,170,100)
-            elif color == YELLOW:
-                bg = (201,180,88)
-            elif color == WHITE:
-                bg = (128,128,128)
-            else:
-                bg = (255,255,255)
-
-            draw.rectangle([x0,y0,x1,y1], fill=bg, outline=(0,0,0), width=2)
-
-            if guess:
-                ch = guess[c].upper()
-                tc = (0,0,0) if bg == (255,255,255) else (255,255,255)
-                bbox = draw.textbbox((0,0), ch, font=font_board)
-                w, h = bbox[2]-bbox[0], bbox[3]-bbox[1]
-                draw.text(
-                    (x0 + (board_sq-w)/2, y0 + (board_sq-h)/2),
-                    ch, font=font_board, fill=tc
-                )
-
-    # --- мини-клавиатура ---
-    letter_status = compute_letter_status(secret, guesses)
+    # координаты клавиш мини-клавиатуры
+    keys = {}
     for ri, row in enumerate(KB_LAYOUT):
         y0      = board_h + padding + ri * (kb_sq + padding)
         row_len = len(row)
         row_pad = (row_len + 1) * padding
         row_w   = row_len * kb_sq + row_pad
         x_off   = (board_w - row_w) // 2
-
         for i, ch in enumerate(row):
-            x0 = x_off + padding + i * (kb_sq + padding)
-            x1 = x0 + kb_sq
-            y1 = y0 + kb_sq
-
-            st = letter_status.get(ch)
-            if st == "green":
-                bg = (106,170,100)
-            elif st == "yellow":
-                bg = (201,180,88)
-            elif st == "red":
-                bg = (128,128,128)
-            else:
-                bg = (255,255,255)
-
-            draw.rectangle([x0,y0,x1,y1], fill=bg, outline=(0,0,0), width=1)
-            tc = (0,0,0) if bg == (255,255,255) else (255,255,255)
-            letter = ch.upper()
-            bbox   = draw.textbbox((0,0), letter, font=font_kb)
-            w, h   = bbox[2]-bbox[0], bbox[3]-bbox[1]
-            draw.text(
-                (x0 + (kb_sq-w)/2, y0 + (kb_sq-h)/2),
-                letter, font=font_kb, fill=tc
-            )
+            keys[ch] = (x_off + padding + i * (kb_sq + padding), y0)
 
-    buf = BytesIO()
-    img.save(buf, format="PNG")
-    buf.seek(0)
-    return buf
+    return {
+        "padding": padding, "cols": cols, "total_rows": total_rows,
+        "board_sq": board_sq, "board_w": board_w, "board_h": board_h,
+        "kb_sq": kb_sq, "img_h": img_h, "keys": keys,
+    }
 
-# --- Константы и словарь ---
-ASK_LENGTH, GUESSING, FEEDBACK_CHOOSE, FEEDBACK_WORD, REMOVE_INPUT, BROADCAST= range(6)
 
-# --- Загрузка и сортировка списка слов ---
-BASE_FILE = Path("base_words.json")
+@lru_cache(maxsize=8)
+def load_font(size: int) -> ImageFont.FreeTypeFont:
+    return ImageFont.truetype("DejaVuSans-Bold.ttf", size)
 
-# Читаем список слов из base_words.json
-with BASE_FILE.open("r", encoding="utf-8") as f:
-    base_words = json.load(f)
-    if isinstance(base_words, dict):
-        # Если файл уже в новом формате
-        main_words = base_words.get("main", [])
-        additional_words = base_words.get("additional", [])
-    else:
-        # Если файл в старом формате (просто список)
-        main_words = base_words
-        additional_words = []
 
-# Фильтруем по критериям: только буквы, длина 4–11 символов
-# и нормализуем слова (нижний регистр, замена ё на е)
-filtered_main = [normalize(w) for w in main_words if w.isalpha() and 4 <= len(w) <= 11]
-filtered_additional = [normalize(w) for w in additional_words if w.isalpha() and 4 <= len(w) <= 11]
+def _draw_cell(draw, x0, y0, sq, bg, letter, font, width):
+    draw.rectangle([x0, y0, x0 + sq, y0 + sq], fill=bg, outline=(0,0,0), width=width)
+    if letter:
+        tc = (0,0,0) if bg == EMPTY_BG else (255,255,255)
+        bbox = draw.textbbox((0,0), letter, font=font)
+        w, h = bbox[2]-bbox[0], bbox[3]-bbox[1]
+        draw.text((x0 + (sq-w)/2, y0 + (sq-h)/2), letter, font=font, fill=tc)
 
-# Удаляем дубликаты, которые могли появиться после нормализации
-filtered_main = list(dict.fromkeys(filtered_main))
-filtered_additional = list(dict.fromkeys(filtered_additional))
 
-# Сортируем списки
-WORDLIST = sorted(filtered_main)
-with BASE_FILE.open("w", encoding="utf-8") as f:
-    json.dump({"main": WORDLIST, "additional": sorted(filtered_additional)}, f, ensure_ascii=False, indent=2)
+@lru_cache(maxsize=64)
+def base_board_image(cols: int, total_rows: int = 6, max_width_px: int = 1080) -> Image.Image:
+    """
+    Пустая доска + белая клавиатура для данной длины.
+    Кэшируется: при рендере копируем ее и дорисовываем только изменившееся.
+    Не изменять — только .copy().
+    """
+    lay  = board_layout(cols, total_rows, max_width_px)
+    pad  = lay["padding"]
+    sq   = lay["board_sq"]
+    img  = Image.new("RGB", (lay["board_w"], lay["img_h"]), (30, 30, 30))
+    draw = ImageDraw.Draw(img)
 
-GREEN, YELLOW, WHITE = "🟩", "🟨", "⬜"
+    for r in range(total_rows):
+        y0 = pad + r * (sq + pad)
+        for c in range(cols):
+            _draw_cell(draw, pad + c * (sq + pad), y0, sq, EMPTY_BG, None, None, 2)
 
-def make_feedback(secret: str, guess: str) -> str:
-    fb = [None] * len(guess)
-    secret_chars = list(secret)
-    # 1) зеленые
-    for i, ch in enumerate(guess):
-        if secret[i] == ch:
-            fb[i] = GREEN
-            secret_chars[i] = None
-    # 2) желтые/красные
-    for i, ch in enumerate(guess):
-        if fb[i] is None:
-            if ch in secret_chars:
-                fb[i] = YELLOW
-                secret_chars[secret_chars.index(ch)] = None
-            else:
-                fb[i] = WHITE
-    return "".join(fb)
+    font_kb = load_font(int(lay["kb_sq"] * 0.6))
+    for ch, (x0, y0) in lay["keys"].items():
+        _draw_cell(draw, x0, y0, lay["kb_sq"], EMPTY_BG, ch.upper(), font_kb, 1)
+    return img
 
 
-# --- Обработчики команд ---
+@lru_cache(maxsize=4096)
+def feedback_cached(secret: str, guess: str) -> str:
+    """make_feedback с кэшем — пары (слово, догадка) часто повторяются между игроками."""
+    return make_feedback(secret, guess)
 
-def check_ban_status(handler):
-    @wraps(handler)
-    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
-        user_id = str(update.effective_user.id)
-        store = load_store()
-        user_data = store["users"].get(user_id, {})
-        
-        if user_data.get("banned", False):
-            try:
-                # Проверяем, не отправляли ли мы уже сообщение в этом обновлении
-                if context.user_data.get("last_ban_update_id") != update.update_id:
-                    if update.callback_query:
-                        await update.callback_query.answer("❌ Вы заблокированы в этом боте.", show_alert=True)
-                    else:
-                        await update.message.reply_text("❌ Вы заблокированы в этом боте.")
-                    # Запоминаем ID обновления
-                    context.user_data["last_ban_update_id"] = update.update_id
-                return ConversationHandler.END
-            except Exception as e:
-                logger.warning(f"Error handling banned user {user_id}: {e}")
-                return
-        else:
-            # Если пользователь был разбанен, очищаем его состояние при первом сообщении
-            if user_data.get("was_banned"):
-                context.user_data.clear()
-                # Удаляем флаг разбана из базы данных
-                user_data.pop("was_banned", None)
-                save_store(store)
-        return await handler(update, context, *args, **kwargs)
-    return wrapper
 
-async def is_banned(user_id: str) -> bool:
-    """Проверяет, забанен ли пользователь"""
-    store = load_store()
-    user_data = store["users"].get(str(user_id), {})
-    return user_data.get("banned", False)
+@lru_cache(maxsize=512)
+def render_tile(sq: int, mark: str, letter: str) -> Image.Image:
+    """
+    Клетка доски с буквой (до ~20 КиБ). Ключ не зависит от слова, поэтому клетки
+    общие для всех игр: 33 буквы × 3 цвета × 8 размеров. Не изменять — только вставлять.
+    """
+    tile = Image.new("RGB", (sq + 1, sq + 1), (30, 30, 30))
+    _draw_cell(ImageDraw.Draw(tile), 0, 0, sq, BG_BY_FEEDBACK[mark], letter.upper(), load_font(int(sq * 0.6)), 2)
+    return tile
 
 
+def paste_row(img: Image.Image, lay: dict, row: int, secret: str, guess: str) -> None:
+    """Вставляет в доску строку с догадкой из готовых клеток."""
+    pad, sq = lay["padding"], lay["board_sq"]
+    y0 = pad + row * (sq + pad)
+    fb = feedback_cached(secret, guess)
+    for c, ch in enumerate(guess):
+        img.paste(render_tile(sq, fb[c], ch), (pad + c * (sq + pad), y0))
+
+
+def render_full_board_with_keyboard(
+    guesses: list[str],
+    secret: str,
+    total_rows: int = 6,
+    max_width_px: int = 1080
+) -> BytesIO:
+    lay = board_layout(len(secret), total_rows, max_width_px)
+    img = base_board_image(len(secret), total_rows, max_width_px).copy()
+
+    # --- игровая доска: собираем строки из готовых клеток ---
+    for r, guess in enumerate(guesses[:total_rows]):
+        paste_row(img, lay, r, secret, guess)
+
+    # --- мини-клавиатура: перерисовываем только отгаданные/отсеянные буквы ---
+    draw    = ImageDraw.Draw(img)
+    font_kb = load_font(int(lay["kb_sq"] * 0.6))
+    for ch, st in compute_letter_status(secret, guesses).items():
+        if ch not in lay["keys"]:
+            continue
+        x0, y0 = lay["keys"][ch]
+        _draw_cell(draw, x0, y0, lay["kb_sq"], BG_BY_STATUS[st], ch.upper(), font_kb, 1)
+
+    return encode_board(img)
+
+
+def bench_board_encoding(rounds: int = 10) -> str:
+    """
+    Замер кодирования доски (4 догадки) во всех форматах для длин 4–11:
+    среднее время в мс и размер в байтах. Запуск: python bot.py --bench-images
+    """
+    variants = ["png", "png-p", "webp"]
+    lines = ["длина  " + "  ".join(f"{v:>16}" for v in variants)]
+    rng = random.Random(0)
+    for length in range(4, 12):
+        bucket = WORDS_BY_LENGTH.get(length)
+        if not bucket:
+            continue
+        secret, guesses = rng.choice(bucket), rng.sample(bucket, min(4, len(bucket)))
+        lay = board_layout(length, 6)
+        img = base_board_image(length, 6).copy()
+        for r, guess in enumerate(guesses):
+            paste_row(img, lay, r, secret, guess)
+
+        cells = []
+        for fmt in variants:
+            started = time.perf_counter()
+            for _ in range(rounds):
+                size = len(encode_board(img, fmt).getbuffer())
+            cells.append(f"{(time.perf_counter() - started) / rounds * 1000:6.1f}мс {size:6d}Б")
+        lines.append(f"{length:>5}  " + "  ".join(f"{c:>16}" for c in cells))
+    return "\n".join(lines)
+
+# --- Временные ряды активности ---
+
+# Файл с рядами (компактный JSON, пишется раз в минуту)
+SERIES_FILE = Path("activity_series.json")
+# Разрешения: имя -> (шаг в секундах, число ячеек). Память фиксирована при любом аптайме.
+SERIES_RESOLUTIONS = {"minute": (60, 60), "hour": (3600, 48), "day": (86400, 90)}
+# Счетчики (суммируются) и «пиковые» метрики (берется максимум за ячейку)
+SERIES_SUM = ("games", "guesses", "wins", "losses", "new_users", "renders", "render_ms", "photo_hits", "photo_misses")
+SERIES_MAX = ("active",)
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def series_empty() -> dict:
+    return {
+        name: {"ids": [-1] * size, **{m: [0] * size for m in SERIES_SUM + SERIES_MAX}}
+        for name, (_step, size) in SERIES_RESOLUTIONS.items()
+    }
+
+
+def load_series() -> dict:
+    if not SERIES_FILE.exists():
+        return series_empty()
+    try:
+        data = json.loads(SERIES_FILE.read_text("utf-8"))
+    except json.JSONDecodeError:
+        return series_empty()
+    # схема могла поменяться — берем только совпадающие кольца
+    fresh = series_empty()
+    for name, ring in fresh.items():
+        old = data.get(name, {})
+        for key, values in ring.items():
+            if isinstance(old.get(key), list) and len(old[key]) == len(values):
+                ring[key] = old[key]
+    return fresh
+
+
+recover_writes(SERIES_FILE)
+SERIES = load_series()
+# Пользователи, активные в текущую минуту (для пиковой одновременности)
+_series_active = {"slot": -1, "users": set()}
+
+
+def _series_cells(now: float):
+    """Ячейки текущего момента во всех кольцах; устаревшие ячейки обнуляются."""
+    for name, (step, size) in SERIES_RESOLUTIONS.items():
+        ring = SERIES[name]
+        slot = int(now // step)
+        i = slot % size
+        if ring["ids"][i] != slot:
+            ring["ids"][i] = slot
+            for m in SERIES_SUM + SERIES_MAX:
+                ring[m][i] = 0
+        yield ring, i
+
+
+def series_add(metric: str, value: float = 1) -> None:
+    """Прибавляет value к метрике в минутном, часовом и дневном кольце (O(1))."""
+    for ring, i in _series_cells(time.time()):
+        ring[metric][i] += value
+
+
+def series_touch(uid: str) -> None:
+    """Отмечает пользователя активным; пик уникальных за минуту идет в метрику active."""
+    now = time.time()
+    slot = int(now // 60)
+    if _series_active["slot"] != slot:
+        _series_active["slot"] = slot
+        _series_active["users"] = set()
+    _series_active["users"].add(uid)
+    count = len(_series_active["users"])
+    for ring, i in _series_cells(now):
+        ring["active"][i] = max(ring["active"][i], count)
+
+
+def series_values(name: str, metric: str) -> list[float]:
+    """Значения метрики от старых к новым; пропущенные ячейки — нули."""
+    step, size = SERIES_RESOLUTIONS[name]
+    ring = SERIES[name]
+    last = int(time.time() // step)
+    out = []
+    for slot in range(last - size + 1, last + 1):
+        i = slot % size
+        out.append(ring[metric][i] if ring["ids"][i] == slot else 0)
+    return out
+
+
+def sparkline(values: list[float]) -> str:
+    top = max(values) or 1
+    return "".join(SPARK[min(len(SPARK) - 1, int(v / top * (len(SPARK) - 1)))] for v in values)
+
+
+async def save_series(context: ContextTypes.DEFAULT_TYPE):
+    atomic_write_bytes(SERIES_FILE, json.dumps(SERIES, separators=(",", ":")).encode("utf-8"))
+
+
+# --- Кэш file_id отправленных картинок ---
+
+# Файл с кэшем и его размер (LRU: при переполнении выкидываем самые давние)
+FILE_IDS_FILE = Path("file_ids.json")
+FILE_ID_CACHE_SIZE = 20000
+# Меняется при любой правке отрисовки — старые file_id перестают совпадать
+RENDER_VERSION = 1
+
+
+def load_file_ids() -> OrderedDict:
+    if not FILE_IDS_FILE.exists():
+        return OrderedDict()
+    try:
+        data = json.loads(FILE_IDS_FILE.read_text("utf-8"))
+    except json.JSONDecodeError:
+        return OrderedDict()
+    # в файле пары [ключ, file_id] от давних к свежим
+    return OrderedDict(data if isinstance(data, list) else [])
+
+
+recover_writes(FILE_IDS_FILE)
+FILE_IDS = load_file_ids()
+_file_ids_dirty = False
+
+
+def board_key(secret: str, guesses: list[str]) -> str:
+    """Хеш содержимого картинки: одинаковые входы рендера дают одинаковую картинку."""
+    raw = f"{RENDER_VERSION}|{BOARD_FORMAT}|{BOARD_PALETTE_COLORS}|{BOARD_CELL_PX}|{secret}|{','.join(guesses)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def remember_file_id(key: str, file_id: str) -> None:
+    global _file_ids_dirty
+    FILE_IDS[key] = file_id
+    FILE_IDS.move_to_end(key)
+    while len(FILE_IDS) > FILE_ID_CACHE_SIZE:
+        FILE_IDS.popitem(last=False)
+    _file_ids_dirty = True
+
+
+async def save_file_ids(context: ContextTypes.DEFAULT_TYPE):
+    global _file_ids_dirty
+    if not _file_ids_dirty:
+        return
+    _file_ids_dirty = False
+    atomic_write_bytes(
+        FILE_IDS_FILE,
+        json.dumps(list(FILE_IDS.items()), separators=(",", ":")).encode("utf-8")
+    )
+
+
+def board_photo(secret: str, guesses: list[str]):
+    """
+    Фото доски для отправки: file_id, если такая картинка уже уходила,
+    иначе свежий рендер. Возвращает (ключ, фото, из_кэша).
+    """
+    key = board_key(secret, guesses)
+    file_id = FILE_IDS.get(key)
+    if file_id:
+        return key, file_id, True
+
+    # Рендерим доску из 6 строк + мини-клавиатуру снизу.
+    # Клавиатура будет крупнее для слов ≥8 букв, чуть меньше для 7 и еще меньше для 4–5.
+    render_started = time.perf_counter()
+    img_buf = render_full_board_with_keyboard(
+        guesses=guesses,
+        secret=secret,
+        total_rows=6,
+        max_width_px=1080
+    )
+    series_add("renders")
+    series_add("render_ms", round((time.perf_counter() - render_started) * 1000, 1))
+    return key, InputFile(img_buf, filename=img_buf.name), False
+
+
+def board_sent(key: str, sent, cached: bool) -> None:
+    """Учитывает попадание в кэш file_id и запоминает file_id загруженной картинки."""
+    if cached:
+        FILE_IDS.move_to_end(key)
+        series_add("photo_hits")
+        return
+    series_add("photo_misses")
+    if sent and getattr(sent, "photo", None):
+        remember_file_id(key, sent.photo[-1].file_id)
+
+
+async def send_board(bot, chat_id: int, secret: str, guesses: list[str], caption: str, **kwargs):
+    """
+    Отправляет доску в чат. Если такая картинка уже уходила — шлем ее file_id
+    (ни рендера, ни загрузки), иначе рендерим, загружаем и запоминаем file_id.
+    kwargs уходят в bot.send_photo (например, reply_to_message_id, rate_limit_args).
+    """
+    key, photo, cached = board_photo(secret, guesses)
+    if cached:
+        try:
+            sent = await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption, **kwargs)
+            board_sent(key, sent, True)
+            return sent
+        except BadRequest as e:
+            # file_id протух — забываем и загружаем заново
+            logger.warning(f"Stale file_id for board {key}: {e}")
+            FILE_IDS.pop(key, None)
+            key, photo, cached = board_photo(secret, guesses)
+
+    sent = await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption, **kwargs)
+    board_sent(key, sent, False)
+    return sent
+
+
+async def reply_board(message, secret: str, guesses: list[str], caption: str):
+    """Отправляет доску в чат сообщения (как reply_photo)."""
+    return await send_board(message.get_bot(), message.chat_id, secret, guesses, caption)
+
+
+# --- Одно сообщение с доской на игру (/display одно) ---
+
+# Пауза перед правкой доски: быстрые догадки подряд сливаются в одну правку
+BOARD_EDIT_DEBOUNCE = float(os.getenv("BOARD_EDIT_DEBOUNCE", "1.0"))
+
+
+async def edit_board(bot, chat_id: int, message_id: int | None, secret: str, guesses: list[str], caption: str) -> int:
+    """
+    Меняет картинку в сообщении доски через edit_message_media.
+    Если править нечего или нельзя (сообщение удалено, слишком старое) —
+    шлет новое сообщение. Возвращает message_id актуальной доски.
+    """
+    key, photo, cached = board_photo(secret, guesses)
+    if message_id:
+        for _ in range(2):
+            try:
+                sent = await bot.edit_message_media(
+                    chat_id=chat_id,
+                    message_id=message_id,
+                    media=InputMediaPhoto(media=photo, caption=caption)
+                )
+                board_sent(key, sent, cached)
+                return message_id
+            except BadRequest as e:
+                if "not modified" in str(e).lower():
+                    return message_id
+                if cached:
+                    # возможно, протух file_id — пробуем еще раз со свежим рендером
+                    FILE_IDS.pop(key, None)
+                    key, photo, cached = board_photo(secret, guesses)
+                    continue
+                logger.warning(f"Cannot edit board message {message_id} in {chat_id}: {e}")
+                break
+
+    sent = await bot.send_photo(chat_id=chat_id, photo=photo, caption=caption)
+    board_sent(key, sent, cached)
+    return sent.message_id
+
+
+def cancel_board_edit(context: ContextTypes.DEFAULT_TYPE, uid: str) -> None:
+    for job in context.job_queue.get_jobs_by_name(f"board_edit:{uid}"):
+        job.schedule_removal()
+
+
+async def board_edit_job(context: ContextTypes.DEFAULT_TYPE):
+    """Отложенная правка доски: берет из стора последнее состояние игры."""
+    uid = context.job.data
+    store = load_store()
+    cg = store["users"].get(uid, {}).get("current_game")
+    if not cg or not cg["guesses"]:
+        return
+    msg_id = await edit_board(
+        context.bot, context.job.chat_id, cg.get("board_msg_id"),
+        cg["secret"], cg["guesses"], f"Попытка {cg['attempts']} из 6"
+    )
+    if msg_id == cg.get("board_msg_id"):
+        return
+    # пока ждали Telegram, стор мог измениться — перечитываем и меняем только board_msg_id
+    store = load_store()
+    fresh = store["users"].get(uid, {}).get("current_game")
+    if fresh and fresh["secret"] == cg["secret"] and fresh.get("started_at") == cg.get("started_at"):
+        fresh["board_msg_id"] = msg_id
+        save_store(store)
+
+
+# --- Текстовый режим доски (/display) ---
+
+# Режимы доски: картинка на каждый ход, текст, одна картинка на игру (правится на месте)
+DISPLAY_MODES = ("image", "text", "edit")
+DISPLAY_ALIASES = {
+    "image": "image", "картинка": "image",
+    "text": "text", "текст": "text",
+    "edit": "edit", "одно": "edit",
+}
+TEXT_KB_MARKS = {"green": "🟩", "yellow": "🟨", "red": "⬜"}
+
+
+def render_text_board(secret: str, guesses: list[str], total_rows: int = 6) -> str:
+    """
+    Доска эмодзи-строками + состояние клавиатуры — без Pillow и загрузки файла.
+    Возвращает HTML для parse_mode="HTML": буквы в <code>, чтобы шли моноширинно.
+    """
+    lines = []
+    for guess in guesses:
+        lines.append(f"{feedback_cached(secret, guess)} <code>{' '.join(guess.upper())}</code>")
+    for _ in range(total_rows - len(guesses)):
+        lines.append("⬛" * len(secret))
+
+    status = compute_letter_status(secret, guesses)
+    # неиспользованные буквы видны, отброшенные заменены точкой
+    kb_rows = [
+        " ".join("·" if status.get(ch) == "red" else ch for ch in row)
+        for row in KB_LAYOUT
+    ]
+    lines.append("")
+    lines.append("<code>" + "\n".join(kb_rows) + "</code>")
+    for st in ("green", "yellow"):
+        letters = sorted(ch.upper() for ch, s in status.items() if s == st)
+        if letters:
+            lines.append(f"{TEXT_KB_MARKS[st]} {', '.join(letters)}")
+    return "\n".join(lines)
+
+
+async def reply_board_for(context: ContextTypes.DEFAULT_TYPE, store: dict, uid: str, message, final: bool = False):
+    """
+    Отправляет доску текущей игры в режиме игрока:
+      - text:  эмодзи-доска, картинка только в конце игры (final) или по кнопке «Картинка»;
+      - edit:  одно сообщение на игру, правки откладываются на BOARD_EDIT_DEBOUNCE,
+               чтобы быстрые догадки подряд дали одну правку; финал правится сразу;
+      - image: новая картинка на каждый ход.
+    """
+    user = store["users"][uid]
+    cg = user["current_game"]
+    secret, guesses = cg["secret"], cg["guesses"]
+    caption = f"Попытка {cg['attempts']} из 6"
+    mode = user.get("display", "image")
+
+    if mode == "edit" and (final or not cg.get("board_msg_id")):
+        cancel_board_edit(context, uid)
+        msg_id = await edit_board(context.bot, message.chat_id, cg.get("board_msg_id"), secret, guesses, caption)
+        if msg_id != cg.get("board_msg_id"):
+            cg["board_msg_id"] = msg_id
+            save_store(store)
+        return
+    if mode == "edit":
+        cancel_board_edit(context, uid)
+        context.job_queue.run_once(
+            board_edit_job, BOARD_EDIT_DEBOUNCE,
+            chat_id=message.chat_id, data=uid, name=f"board_edit:{uid}"
+        )
+        return
+    if final or mode != "text":
+        await reply_board(message, secret, guesses, caption)
+        return
+    markup = InlineKeyboardMarkup([[InlineKeyboardButton("🖼 Картинка", callback_data="board_img")]])
+    await message.reply_text(
+        f"{caption}\n\n{render_text_board(secret, guesses)}",
+        parse_mode="HTML",
+        reply_markup=markup
+    )
+
+
+# --- Подробная статистика игрока ---
+
+def record_user_result(user: dict, won: bool, cg: dict) -> None:
+    """
+    Инкрементально (O(1)) обновляет расширенную статистику игрока при конце игры:
+    распределение попыток, серии побед, процент по длинам и время решения.
+    Базовые games_played/wins/losses по-прежнему считает handle_guess.
+    """
+    series_add("wins" if won else "losses")
+    stats = user.setdefault("stats", {"games_played": 0, "wins": 0, "losses": 0})
+    dist = stats.setdefault("dist", [0] * 6)
+    length = str(len(cg["secret"]))
+    by_length = stats.setdefault("by_length", {}).setdefault(length, {"played": 0, "wins": 0})
+    by_length["played"] += 1
+
+    if won:
+        dist[cg["attempts"] - 1] += 1
+        by_length["wins"] += 1
+        stats["streak"] = stats.get("streak", 0) + 1
+        stats["max_streak"] = max(stats.get("max_streak", 0), stats["streak"])
+        if cg.get("started_at"):
+            stats["solve_seconds"] = stats.get("solve_seconds", 0) + round(time.time() - cg["started_at"])
+            stats["timed_wins"] = stats.get("timed_wins", 0) + 1
+    else:
+        stats["streak"] = 0
+
+
+@lru_cache(maxsize=256)
+def render_stats_chart(stats_key: str) -> bytes:
+    """
+    Картинка со статистикой игрока. Ключ — JSON статистики, так что кэш
+    сам «протухает», как только статистика меняется (т.е. после каждой игры).
+    """
+    s = json.loads(stats_key)
+    dist = s.get("dist", [0] * 6)
+    played = s.get("games_played", 0)
+    wins = s.get("wins", 0)
+    timed = s.get("timed_wins", 0)
+    avg_time = s.get("solve_seconds", 0) / timed if timed else 0
+
+    w, pad = 720, 24
+    by_length = sorted(s.get("by_length", {}).items(), key=lambda kv: int(kv[0]))
+    h = 260 + 6 * 44 + 40 + 30 * len(by_length)
+    img = Image.new("RGB", (w, h), (30, 30, 30))
+    draw = ImageDraw.Draw(img)
+    font_title, font = load_font(30), load_font(20)
+
+    draw.text((pad, pad), "Ваша статистика", font=font_title, fill=(255,255,255))
+    lines = [
+        f"Игр: {played}   Побед: {wins}   Процент: {wins / played * 100 if played else 0:.0f}%",
+        f"Серия: {s.get('streak', 0)}   Лучшая серия: {s.get('max_streak', 0)}",
+        f"Среднее время до отгадки: {int(avg_time // 60)}:{int(avg_time % 60):02d}",
+    ]
+    for i, line in enumerate(lines):
+        draw.text((pad, 80 + i * 32), line, font=font, fill=(220,220,220))
+
+    # распределение попыток — горизонтальные столбики
+    y = 190
+    draw.text((pad, y), "Распределение попыток", font=font, fill=(255,255,255))
+    y += 40
+    top = max(dist) or 1
+    bar_max = w - 2 * pad - 40
+    for i, count in enumerate(dist):
+        bar = max(36, int(bar_max * count / top))
+        draw.rectangle([pad + 30, y, pad + 30 + bar, y + 32], fill=BG_BY_FEEDBACK[GREEN] if count else (128,128,128))
+        draw.text((pad, y + 4), str(i + 1), font=font, fill=(255,255,255))
+        draw.text((pad + 38, y + 4), str(count), font=font, fill=(255,255,255))
+        y += 44
+
+    # процент побед по длинам слова
+    y += 10
+    draw.text((pad, y), "По длине слова", font=font, fill=(255,255,255))
+    for length, bl in by_length:
+        y += 30
+        rate = bl["wins"] / bl["played"] * 100 if bl["played"] else 0
+        draw.text((pad, y), f"{length} букв: {bl['wins']}/{bl['played']} ({rate:.0f}%)", font=font, fill=(220,220,220))
+
+    buf = BytesIO()
+    img.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+# --- Константы и словарь ---
+ASK_LENGTH, GUESSING, FEEDBACK_CHOOSE, FEEDBACK_WORD, REMOVE_INPUT, BROADCAST= range(6)
+
+# --- Загрузка и сортировка списка слов ---
+BASE_FILE = Path("base_words.json")
+
+def read_base_words() -> tuple[list[str], list[str]]:
+    """
+    Читает base_words.json и возвращает (main, additional):
+    только буквы, длина 4–11, нормализованы, без дубликатов, отсортированы.
+    Ничего не меняет в глобальном состоянии — можно звать из фонового потока.
+    """
+    with BASE_FILE.open("r", encoding="utf-8") as f:
+        base_words = json.load(f)
+    if isinstance(base_words, dict):
+        # Если файл уже в новом формате
+        main_words = base_words.get("main", [])
+        additional_words = base_words.get("additional", [])
+    else:
+        # Если файл в старом формате (просто список)
+        main_words = base_words
+        additional_words = []
+
+    # Фильтруем по критериям: только буквы, длина 4–11 символов
+    # и нормализуем слова (нижний регистр, замена ё на е)
+    filtered_main = [normalize(w) for w in main_words if w.isalpha() and 4 <= len(w) <= 11]
+    filtered_additional = [normalize(w) for w in additional_words if w.isalpha() and 4 <= len(w) <= 11]
+
+    # Удаляем дубликаты (могли появиться после нормализации) и сортируем
+    return sorted(dict.fromkeys(filtered_main)), sorted(dict.fromkeys(filtered_additional))
+
+
+# base_words.json правится через atomic_write_bytes — доводим прерванную правку до чтения
+recover_writes(BASE_FILE)
+WORDLIST, ADDITIONAL_WORDS = read_base_words()
+atomic_write_bytes(
+    BASE_FILE,
+    json.dumps({"main": WORDLIST, "additional": ADDITIONAL_WORDS}, ensure_ascii=False, indent=2).encode("utf-8")
+)
+
+GREEN, YELLOW, WHITE = "🟩", "🟨", "⬜"
+
+def make_feedback(secret: str, guess: str) -> str:
+    fb = [None] * len(guess)
+    secret_chars = list(secret)
+    # 1) зеленые
+    for i, ch in enumerate(guess):
+        if secret[i] == ch:
+            fb[i] = GREEN
+            secret_chars[i] = None
+    # 2) желтые/красные
+    for i, ch in enumerate(guess):
+        if fb[i] is None:
+            if ch in secret_chars:
+                fb[i] = YELLOW
+                secret_chars[secret_chars.index(ch)] = None
+            else:
+                fb[i] = WHITE
+    return "".join(fb)
+
+
+# --- Хард-режим ---
+# Каждая догадка обязана учитывать все открытые подсказки. Ограничения копятся
+# в current_game["hard"] после каждого хода, поэтому проверка — O(длины слова):
+#   fixed  — строка длины слова, "." там, где буква не известна (🟩 на своих местах);
+#   min    — {буква: сколько минимум раз она есть в слове} (🟩 + 🟨);
+#   banned — буквы, которых в слове точно нет (только ⬜).
+
+
+def hard_rules_new(length: int) -> dict:
+    return {"fixed": "." * length, "min": {}, "banned": ""}
+
+
+def hard_rules_update(rules: dict, guess: str, fb: str) -> None:
+    """Добавляет в ограничения то, что открыл ход guess с фидбеком fb."""
+    fixed = list(rules["fixed"])
+    found = Counter()
+    for i, (ch, mark) in enumerate(zip(guess, fb)):
+        if mark == GREEN:
+            fixed[i] = ch
+        if mark != WHITE:
+            found[ch] += 1
+    for ch, n in found.items():
+        if n > rules["min"].get(ch, 0):
+            rules["min"][ch] = n
+    banned = {ch for ch, mark in zip(guess, fb) if mark == WHITE and ch not in found}
+    rules["fixed"] = "".join(fixed)
+    rules["banned"] = "".join(sorted(set(rules["banned"]) | banned))
+
+
+def hard_rules_violation(rules: dict, guess: str) -> str | None:
+    """Текст ошибки, если догадка нарушает открытые подсказки, иначе None."""
+    for i, (want, ch) in enumerate(zip(rules["fixed"], guess)):
+        if want != "." and ch != want:
+            return f"{i + 1}-я буква должна быть «{want.upper()}»."
+    for ch in guess:
+        if ch in rules["banned"]:
+            return f"Буквы «{ch.upper()}» в слове нет."
+    counts = Counter(guess)
+    for ch, n in rules["min"].items():
+        if counts[ch] < n:
+            times = "" if n == 1 else f" ({n} раза)"
+            return f"В догадке должна быть буква «{ch.upper()}»{times}."
+    return None
+
+
+def _hard_reference_ok(secret: str, history: list[str], guess: str) -> bool:
+    """Эталон для --bench-hard: честная проверка по всей истории ходов."""
+    counts = Counter(guess)
+    for prev in history:
+        fb = make_feedback(secret, prev)
+        found = Counter(ch for ch, mark in zip(prev, fb) if mark != WHITE)
+        for i, (ch, mark) in enumerate(zip(prev, fb)):
+            if mark == GREEN and guess[i] != ch:
+                return False
+            if mark == WHITE and ch not in found and ch in counts:
+                return False
+        if any(counts[ch] < n for ch, n in found.items()):
+            return False
+    return True
+
+
+def bench_hard_mode(games: int = 2000, seed: int = 0) -> str:
+    """
+    Корпус случайных партий по всем длинам: сверка инкрементальной проверки
+    с эталоном и цена одной проверки. Запуск: python bot.py --bench-hard
+    """
+    rng = random.Random(seed)
+    lines = ["длина  партий  проверок  расхождений  мкс/проверка  эталон мкс"]
+    for length in range(4, 12):
+        bucket = WORDS_BY_LENGTH.get(length)
+        if not bucket:
+            continue
+        checks = mismatches = 0
+        fast = slow = 0.0
+        for _ in range(games // 8):
+            secret = rng.choice(bucket)
+            rules, history = hard_rules_new(length), []
+            for _ in range(6):
+                guess = rng.choice(bucket)
+                started = time.perf_counter()
+                ok = hard_rules_violation(rules, guess) is None
+                fast += time.perf_counter() - started
+                started = time.perf_counter()
+                ref = _hard_reference_ok(secret, history, guess)
+                slow += time.perf_counter() - started
+                checks += 1
+                mismatches += ok != ref
+                history.append(guess)
+                hard_rules_update(rules, guess, make_feedback(secret, guess))
+        lines.append(
+            f"{length:>5}  {games // 8:>6}  {checks:>8}  {mismatches:>11}  "
+            f"{fast / checks * 1e6:>12.2f}  {slow / checks * 1e6:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+# --- Сложность слов ---
+
+# Файл с заранее посчитанными оценками сложности
+SCORES_FILE = Path("word_scores.json")
+# Уровни сложности, которые можно передать в /play
+DIFFICULTIES = {"легко": 0, "средне": 1, "сложно": 2}
+# Сколько стартовых слов использует симулятор решателя
+SOLVER_OPENERS = 3
+
+
+def build_length_index(words: list[str]) -> dict[int, list[str]]:
+    """Раскладывает слова по корзинам длины: {длина: [слова]}."""
+    index: dict[int, list[str]] = defaultdict(list)
+    for w in words:
+        index[len(w)].append(w)
+    return dict(index)
+
+
+def wordlist_version(words: list[str]) -> str:
+    """Короткий хеш словаря — по нему понимаем, что оценки устарели."""
+    return hashlib.sha1("\n".join(words).encode("utf-8")).hexdigest()[:12]
+
+
+def _solver_tree(candidates: list[str], order: dict[str, float], depth: int, opener: str | None = None) -> dict[str, int]:
+    """
+    Простой решатель: всегда ходит самым «частотным» из оставшихся кандидатов.
+    Так как ход зависит только от множества кандидатов, все загаданные слова
+    с одинаковым ответом идут по одной ветке — считаем сразу дерево,
+    это O(n * глубина) вызовов make_feedback на корзину.
+    Возвращает {слово: число попыток до отгадки}.
+    """
+    guess = opener or max(candidates, key=order.__getitem__)
+    groups: dict[str, list[str]] = defaultdict(list)
+    for c in candidates:
+        groups[make_feedback(c, guess)].append(c)
+
+    result: dict[str, int] = {}
+    solved = GREEN * len(guess)
+    for pattern, group in groups.items():
+        if pattern == solved:
+            result[group[0]] = depth
+        else:
+            result.update(_solver_tree(group, order, depth + 1))
+    return result
+
+
+def score_bucket(words: list[str]) -> dict[str, dict]:
+    """
+    Оценивает сложность всех слов одной длины по трем признакам:
+    - rarity: насколько редкие буквы в слове (0 — самые частые)
+    - repeats: сколько повторяющихся букв
+    - guesses: среднее число попыток симулированного решателя
+    """
+    freq = Counter(ch for w in words for ch in set(w))
+    top = max(freq.values())
+    order = {w: sum(freq[ch] for ch in set(w)) / top for w in words}
+
+    openers = sorted(words, key=order.__getitem__, reverse=True)[:SOLVER_OPENERS]
+    runs = [_solver_tree(words, order, 1, opener) for opener in openers]
+
+    scores = {}
+    for w in words:
+        letters = set(w)
+        rarity = 1 - sum(freq[ch] for ch in letters) / (top * len(letters))
+        repeats = len(w) - len(letters)
+        guesses = sum(run[w] for run in runs) / len(runs)
+        scores[w] = {
+            "score": round(guesses + rarity + 0.5 * repeats, 4),
+            "guesses": round(guesses, 3),
+            "rarity": round(rarity, 4),
+            "repeats": repeats,
+        }
+    return scores
+
+
+def compute_word_scores(words: list[str]) -> dict:
+    """Считает оценки для всего словаря (по корзинам длины)."""
+    scores = {}
+    for bucket in build_length_index(words).values():
+        scores.update(score_bucket(bucket))
+    return {"version": wordlist_version(words), "scores": scores}
+
+
+def load_word_scores() -> dict:
+    """Читает word_scores.json; при отсутствии или ошибке — пустые оценки."""
+    if not SCORES_FILE.exists():
+        return {"version": None, "scores": {}}
+    try:
+        data = json.loads(SCORES_FILE.read_text("utf-8"))
+    except json.JSONDecodeError:
+        return {"version": None, "scores": {}}
+    if not isinstance(data, dict) or not isinstance(data.get("scores"), dict):
+        return {"version": None, "scores": {}}
+    return data
+
+
+def save_word_scores(data: dict) -> None:
+    atomic_write_bytes(SCORES_FILE, json.dumps(data, ensure_ascii=False).encode("utf-8"))
+
+
+def build_difficulty_tiers(index: dict[int, list[str]], scores: dict[str, dict]) -> dict[int, list[list[str]]]:
+    """
+    Сортирует каждую корзину длины по сложности и режет на три равные части.
+    Выбор слова нужной сложности потом — просто random.choice по готовому списку.
+    """
+    tiers = {}
+    for length, bucket in index.items():
+        ranked = sorted((w for w in bucket if w in scores), key=lambda w: scores[w]["score"])
+        if len(ranked) < len(DIFFICULTIES):
+            continue
+        step = len(ranked) / len(DIFFICULTIES)
+        tiers[length] = [
+            ranked[int(i * step):int((i + 1) * step)] for i in range(len(DIFFICULTIES))
+        ]
+    return tiers
+
+
+def refresh_word_scores(words: list[str]) -> None:
+    """
+    Пересчитывает оценки, если они устарели, и подменяет уровни сложности.
+    Запускается в фоновом потоке, чтобы не задерживать старт бота.
+    """
+    global DIFFICULTY_TIERS, TIERS_GENERATION
+    data = load_word_scores()
+    if data.get("version") != wordlist_version(words):
+        data = compute_word_scores(words)
+        save_word_scores(data)
+        logger.info(f"-> Scored {len(data['scores'])} words into {SCORES_FILE.resolve()}")
+    DIFFICULTY_TIERS = build_difficulty_tiers(build_length_index(words), data["scores"])
+    TIERS_GENERATION += 1
+
+
+# Пересчет оценок — в одной фоновой нити. Одобрения подряд сливаются: нить ждет
+# SCORING_DEBOUNCE секунд тишины и считает только последний словарь.
+SCORING_DEBOUNCE = 10.0
+_scoring = {"words": None, "due": 0.0, "thread": None}
+_scoring_lock = threading.Lock()
+
+
+def request_rescore(words: list[str], delay: float = SCORING_DEBOUNCE) -> None:
+    """Просит пересчитать оценки для words; вторую нить не запускает, пока работает первая."""
+    with _scoring_lock:
+        _scoring["words"] = list(words)
+        _scoring["due"] = time.monotonic() + delay
+        if _scoring["thread"] is None:
+            _scoring["thread"] = threading.Thread(target=_scoring_worker, daemon=True)
+            _scoring["thread"].start()
+
+
+def _scoring_worker() -> None:
+    while True:
+        with _scoring_lock:
+            wait = _scoring["due"] - time.monotonic()
+            words = None
+            if wait <= 0:
+                words, _scoring["words"] = _scoring["words"], None
+                if words is None:
+                    _scoring["thread"] = None
+                    return
+        if words is None:
+            time.sleep(wait)
+            continue
+        try:
+            refresh_word_scores(words)
+        except Exception as e:
+            logger.warning(f"Не смогли пересчитать оценки сложности: {e}")
+
+
+# --- Версии словаря ---
+
+# Как часто проверяем, не поменяли ли base_words.json на диске (сек)
+DICT_WATCH_INTERVAL = 30
+# Сведения об установленной версии словаря
+DICT_STATE = {"version": 0, "hash": None, "mtime_ns": None, "built_ms": 0.0, "size_bytes": 0}
+
+
+def build_dictionary(main: list[str], additional: list[str]) -> dict:
+    """
+    Собирает снимок словаря: списки, индекс по длине и множество для проверки слов.
+    Снимок после сборки не меняется, поэтому его можно строить в фоновом потоке.
+    """
+    started = time.perf_counter()
+    by_length = build_length_index(main)
+    all_words = frozenset(main) | frozenset(additional)
+    size = (
+        sys.getsizeof(main) + sys.getsizeof(additional) + sys.getsizeof(all_words)
+        + sum(sys.getsizeof(bucket) for bucket in by_length.values())
+        + sum(sys.getsizeof(w) for w in all_words)
+    )
+    return {
+        "main": main,
+        "additional": additional,
+        "by_length": by_length,
+        "all": all_words,
+        "hash": wordlist_version(main),
+        "size_bytes": size,
+        "built_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def install_dictionary(snap: dict, mtime_ns: int | None = None) -> None:
+    """
+    Подменяет словарь целиком. Вызывается только из потока event loop и без await,
+    так что обработчики видят либо старую версию, либо новую — не смесь.
+    Старые списки не мутируются: кто успел их взять, дочитает консистентно,
+    а идущие игры хранят свое слово в current_game и не зависят от версии.
+    """
+    global WORDLIST, ADDITIONAL_WORDS, WORDS_BY_LENGTH, ALL_WORDS
+    WORDLIST, ADDITIONAL_WORDS = snap["main"], snap["additional"]
+    WORDS_BY_LENGTH, ALL_WORDS = snap["by_length"], snap["all"]
+    DICT_STATE.update(
+        version=DICT_STATE["version"] + 1,
+        hash=snap["hash"],
+        mtime_ns=mtime_ns,
+        built_ms=snap["built_ms"],
+        size_bytes=snap["size_bytes"],
+    )
+
+
+def load_dictionary_snapshot() -> tuple[dict, int]:
+    """Читает base_words.json и собирает снимок (для asyncio.to_thread)."""
+    mtime_ns = BASE_FILE.stat().st_mtime_ns
+    return build_dictionary(*read_base_words()), mtime_ns
+
+
+install_dictionary(build_dictionary(WORDLIST, ADDITIONAL_WORDS), BASE_FILE.stat().st_mtime_ns)
+
+# Уровни сложности (подставятся после подсчета оценок)
+recover_writes(SCORES_FILE)
+_scores = load_word_scores()
+DIFFICULTY_TIERS = (
+    build_difficulty_tiers(WORDS_BY_LENGTH, _scores["scores"])
+    if _scores.get("version") == wordlist_version(WORDLIST) else {}
+)
+# Растет при каждой пересборке уровней — ключ кэша пулов загадываемых слов
+TIERS_GENERATION = 0
+
+
+def in_main_dictionary(word: str) -> bool:
+    """Есть ли слово в основном словаре (бинарный поиск по корзине длины)."""
+    bucket = WORDS_BY_LENGTH.get(len(word), [])
+    i = bisect.bisect_left(bucket, word)
+    return i < len(bucket) and bucket[i] == word
+
+
+def _sorted_remove(words: list[str], word: str) -> bool:
+    i = bisect.bisect_left(words, word)
+    if i < len(words) and words[i] == word:
+        del words[i]
+        return True
+    return False
+
+
+def _sorted_add(words: list[str], word: str) -> bool:
+    i = bisect.bisect_left(words, word)
+    if i < len(words) and words[i] == word:
+        return False
+    words.insert(i, word)
+    return True
+
+
+def patch_dictionary(remove_main=(), add_main=(), add_additional=()) -> tuple[int, int, int]:
+    """
+    Точечно правит копию словаря (бинарным поиском по отсортированным спискам,
+    без пересортировки), записывает base_words.json и ставит новую версию.
+    Возвращает (удалено, добавлено в main, в additional).
+    """
+    valid = lambda w: w.isalpha() and 4 <= len(w) <= 11
+    main, additional = list(WORDLIST), list(ADDITIONAL_WORDS)
+    removed = sum(_sorted_remove(main, w) for w in remove_main)
+    added = sum(valid(w) and _sorted_add(main, w) for w in add_main)
+    added_extra = sum(valid(w) and _sorted_add(additional, w) for w in add_additional)
+
+    atomic_write_bytes(
+        BASE_FILE,
+        json.dumps({"main": main, "additional": additional}, ensure_ascii=False, indent=2).encode("utf-8")
+    )
+    install_dictionary(build_dictionary(main, additional), BASE_FILE.stat().st_mtime_ns)
+    logger.info(f"-> Patched {BASE_FILE.resolve()}: -{removed} +{added} main, +{added_extra} additional")
+    if removed or added:
+        # оценки сложности пересчитаются в фоне (одобрения подряд — одним пересчетом)
+        request_rescore(WORDLIST)
+    return removed, added, added_extra
+
+
+async def reload_dictionary() -> str:
+    """
+    Пересобирает словарь из файла в фоновом потоке и атомарно подменяет его.
+    Возвращает отчет для админа.
+    """
+    old_main, old_additional = set(WORDLIST), set(ADDITIONAL_WORDS)
+    snap, mtime_ns = await asyncio.to_thread(load_dictionary_snapshot)
+    install_dictionary(snap, mtime_ns)
+    if snap["hash"] != wordlist_version(sorted(old_main)):
+        request_rescore(WORDLIST)
+
+    new_main, new_additional = set(snap["main"]), set(snap["additional"])
+    return (
+        f"📚 Словарь v{DICT_STATE['version']} ({snap['hash']}) загружен за {snap['built_ms']:.0f} мс, "
+        f"~{snap['size_bytes'] / 1_048_576:.1f} МБ.\n"
+        f"main: {len(new_main)} (+{len(new_main - old_main)}, -{len(old_main - new_main)}), "
+        f"additional: {len(new_additional)} (+{len(new_additional - old_additional)}, "
+        f"-{len(old_additional - new_additional)})"
+    )
+
+
+async def watch_dictionary(context: ContextTypes.DEFAULT_TYPE):
+    """Подхватывает правки base_words.json, сделанные прямо на сервере."""
+    try:
+        mtime_ns = BASE_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        return
+    if mtime_ns == DICT_STATE["mtime_ns"]:
+        return
+    try:
+        report = await reload_dictionary()
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        # файл могут дописывать прямо сейчас — попробуем на следующем тике
+        logger.warning(f"Не смогли перечитать {BASE_FILE}: {e}")
+        return
+    logger.info(report)
+    await context.bot.send_message(chat_id=ADMIN_ID, text="🔄 base_words.json изменился на диске.\n" + report)
+
+
+async def dict_reload(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/dict_reload — перечитать base_words.json без перезапуска."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    try:
+        report = await reload_dictionary()
+    except (json.JSONDecodeError, UnicodeDecodeError) as e:
+        await update.message.reply_text(f"❌ base_words.json не читается: {e}")
+        return
+    await update.message.reply_text(report)
+
+
+# --- Выбор загаданного слова: частотные веса и без повторов ---
+
+# Необязательный файл частот {слово: частота}; без него все слова равновероятны
+WORD_FREQ_FILE = Path(os.getenv("WORD_FREQ_FILE", "word_freq.json"))
+# Степень сглаживания частот: 1 — как есть, 0.5 — корень (редкие слова не пропадают совсем)
+WORD_FREQ_POWER = float(os.getenv("WORD_FREQ_POWER", "0.5"))
+# Сколько раз тянем из alias-таблицы, прежде чем выбирать перебором непросмотренных
+SECRET_SAMPLE_TRIES = 32
+
+
+def load_word_freq() -> dict[str, float]:
+    if not WORD_FREQ_FILE.exists():
+        return {}
+    try:
+        data = json.loads(WORD_FREQ_FILE.read_text("utf-8"))
+    except json.JSONDecodeError as e:
+        logger.warning(f"{WORD_FREQ_FILE} не читается, веса слов равные: {e}")
+        return {}
+    if not isinstance(data, dict):
+        logger.warning(f"{WORD_FREQ_FILE}: ожидался объект {{слово: частота}}, веса слов равные")
+        return {}
+    freq = {}
+    for w, f in data.items():
+        # сначала приводим к числу: в файле частоты бывают строками
+        try:
+            f = float(f)
+        except (TypeError, ValueError):
+            continue
+        if 0 < f < float("inf"):
+            freq[normalize(w)] = f
+    return freq
+
+
+WORD_FREQ = load_word_freq()
+
+
+def build_alias(weights: list[float]) -> tuple[list[float], list[int]]:
+    """Таблица Уокера (вариант Воуза): O(n) на сборку, O(1) на выбор."""
+    n = len(weights)
+    total = sum(weights)
+    scaled = [w * n / total for w in weights]
+    prob, alias = [1.0] * n, list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        prob[s], alias[s] = scaled[s], l
+        scaled[l] -= 1.0 - scaled[s]
+        (small if scaled[l] < 1.0 else large).append(l)
+    return prob, alias
+
+
+@lru_cache(maxsize=64)
+def secret_pool(dict_hash: str, tiers_generation: int, length: int, level: int | None) -> dict:
+    """
+    Пул загадываемых слов длины length (и уровня level, если задан):
+    позиции слов в корзине длины, их веса и alias-таблица.
+    Ключ кэша — версия словаря и уровней, так что после перезагрузки пул пересоберется.
+    """
+    bucket = WORDS_BY_LENGTH[length]
+    tiers = DIFFICULTY_TIERS.get(length)
+    indices = []
+    if level is not None and tiers:
+        pos = {w: i for i, w in enumerate(bucket)}
+        indices = sorted(pos[w] for w in tiers[level] if w in pos)
+    if not indices:
+        # уровни еще не посчитаны для этой версии словаря — берем всю корзину
+        indices = list(range(len(bucket)))
+    default = min(WORD_FREQ.values()) if WORD_FREQ else 1.0
+    weights = [WORD_FREQ.get(bucket[i], default) ** WORD_FREQ_POWER for i in indices]
+    prob, alias = build_alias(weights)
+    mask = 0
+    for i in indices:
+        mask |= 1 << i
+    return {"indices": indices, "weights": weights, "prob": prob, "alias": alias, "mask": mask}
+
+
+def bits_encode(bits: int) -> str:
+    """Битсет позиций в корзине длины -> компактная base64-строка для стора."""
+    return base64.b64encode(bits.to_bytes((bits.bit_length() + 7) // 8, "little")).decode("ascii")
+
+
+def bits_decode(raw: str) -> int:
+    return int.from_bytes(base64.b64decode(raw), "little")
+
+
+def seen_bits(user: dict, length: int) -> int:
+    """Битсет уже загаданных слов по позициям в корзине длины (сброс при смене словаря)."""
+    seen = user.get("seen")
+    if not seen or seen.get("v") != DICT_STATE["hash"]:
+        return 0
+    raw = seen.get(str(length))
+    return bits_decode(raw) if raw else 0
+
+
+def store_seen_bits(user: dict, length: int, bits: int) -> None:
+    seen = user.get("seen")
+    if not seen or seen.get("v") != DICT_STATE["hash"]:
+        seen = user["seen"] = {"v": DICT_STATE["hash"]}
+    seen[str(length)] = bits_encode(bits)
+
+
+def pick_secret(length: int, difficulty: str | None = None, user: dict | None = None) -> str:
+    """
+    Выбирает слово с учетом частот за O(1) по alias-таблице.
+    Если передан user — не повторяет слова, пока пул не исчерпан; тогда пул начинается заново.
+    """
+    level = DIFFICULTIES.get(difficulty) if difficulty else None
+    pool = secret_pool(DICT_STATE["hash"], TIERS_GENERATION, length, level)
+    indices, prob, alias = pool["indices"], pool["prob"], pool["alias"]
+    bucket = WORDS_BY_LENGTH[length]
+
+    def draw() -> int:
+        k = random.randrange(len(indices))
+        return k if random.random() < prob[k] else alias[k]
+
+    if user is None:
+        return bucket[indices[draw()]]
+
+    bits = seen_bits(user, length)
+    if bits & pool["mask"] == pool["mask"]:
+        # пул исчерпан — начинаем круг заново
+        bits &= ~pool["mask"]
+    for _ in range(SECRET_SAMPLE_TRIES):
+        k = draw()
+        if not bits >> indices[k] & 1:
+            break
+    else:
+        # почти все просмотрено — выбираем из оставшихся по весам
+        unseen = [k for k, i in enumerate(indices) if not bits >> i & 1]
+        k = random.choices(unseen, weights=[pool["weights"][k] for k in unseen])[0]
+    store_seen_bits(user, length, bits | 1 << indices[k])
+    return bucket[indices[k]]
+
+
+# --- Абсурд: слово выбирается по ходу игры ---
+# Бот не загадывает слово заранее: после каждой догадки кандидаты делятся по
+# фидбеку, и остается самый большой класс. В current_game хранится битсет
+# оставшихся кандидатов, а в "secret" — любой из них: все кандидаты дают один и
+# тот же фидбек на все прошлые догадки, поэтому доска и подсказки рисуются как
+# обычно, а окончательное слово определяется только в конце игры.
+
+# Больше стольких кандидатов — делим в рабочем потоке, чтобы не держать event loop
+ABSURD_INLINE_MAX = 2000
+
+
+def feedback_codes(guess: str, candidates: list[str]) -> list[int]:
+    """
+    make_feedback сразу для всех кандидатов, в виде кодов по основанию 3
+    (⬜=0, 🟨=1, 🟩=2 в разряде позиции). Разбор догадки делается один раз,
+    а на кандидата — один проход без построения строк.
+    """
+    weights = [3 ** i for i in range(len(guess))]
+    pairs = list(zip(guess, weights))
+    codes = []
+    append = codes.append
+    for cand in candidates:
+        code = 0
+        rest = []
+        missed = []
+        for (g, w), c in zip(pairs, cand):
+            if g == c:
+                code += w + w
+            else:
+                rest.append(c)
+                missed.append((g, w))
+        for g, w in missed:
+            if g in rest:
+                code += w
+                rest.remove(g)
+        append(code)
+    return codes
+
+
+def absurd_partition(candidates: list[str], guess: str) -> list[str]:
+    """
+    Делит кандидатов по фидбеку на guess и оставляет самый большой класс;
+    при равенстве — тот, что открывает меньше (меньше зеленых и желтых).
+    """
+    groups: dict[int, list[str]] = defaultdict(list)
+    for cand, code in zip(candidates, feedback_codes(guess, candidates)):
+        groups[code].append(cand)
+
+    def revealed(code: int) -> int:
+        total = 0
+        while code:
+            total += code % 3
+            code //= 3
+        return total
+
+    best = max(groups, key=lambda code: (len(groups[code]), -revealed(code)))
+    return groups[best]
+
+
+def absurd_candidates(cg: dict) -> list[str]:
+    """Оставшиеся кандидаты игры; после смены словаря пересобираются по истории ходов."""
+    bucket = WORDS_BY_LENGTH.get(len(cg["secret"]), [])
+    if cg.get("absurd_v") == DICT_STATE["hash"]:
+        bits = bits_decode(cg["absurd"])
+        return [w for i, w in enumerate(bucket) if bits >> i & 1]
+    secret = cg["secret"]
+    return [
+        w for w in bucket
+        if all(feedback_cached(w, g) == feedback_cached(secret, g) for g in cg["guesses"])
+    ] or [secret]
+
+
+def absurd_store(cg: dict, candidates: list[str]) -> None:
+    """Запоминает кандидатов битсетом и берет представителя для рендера."""
+    pos = {w: i for i, w in enumerate(WORDS_BY_LENGTH.get(len(candidates[0]), []))}
+    bits = 0
+    for w in candidates:
+        if w in pos:
+            bits |= 1 << pos[w]
+    cg["absurd"] = bits_encode(bits)
+    cg["absurd_v"] = DICT_STATE["hash"]
+    cg["secret"] = random.choice(candidates)
+
+
+def bench_absurd(rounds: int = 20) -> str:
+    """Цена одного хода абсурда на полной корзине каждой длины. Запуск: python bot.py --bench-absurd"""
+    rng = random.Random(0)
+    lines = ["длина  кандидатов  мс/ход  осталось"]
+    for length, bucket in sorted(WORDS_BY_LENGTH.items()):
+        started = time.perf_counter()
+        for _ in range(rounds):
+            rest = absurd_partition(bucket, rng.choice(bucket))
+        lines.append(
+            f"{length:>5}  {len(bucket):>10}  {(time.perf_counter() - started) / rounds * 1000:>6.2f}  {len(rest):>8}"
+        )
+    return "\n".join(lines)
+
+
+# --- Слово дня ---
+
+# Сколько дней храним агрегаты и таблицы лидеров
+DAILY_KEEP_DAYS = 7
+# Размер таблицы лидеров на каждую длину
+DAILY_TOP_SIZE = 10
+
+
+def today_msk() -> str:
+    return datetime.now(MSK).date().isoformat()
+
+
+@lru_cache(maxsize=64)
+def daily_secret(length: int, day: str) -> str | None:
+    """
+    Одно и то же слово для всех в этот день: индекс в корзине из хеша (дата, длина).
+    Кэшируется, чтобы правки словаря посреди дня не меняли уже выбранное слово.
+    """
+    bucket = WORDS_BY_LENGTH.get(length)
+    if not bucket:
+        return None
+    seed = hashlib.sha256(f"wordly-daily:{day}:{length}".encode("utf-8")).digest()
+    return bucket[int.from_bytes(seed[:8], "big") % len(bucket)]
+
+
+def record_daily_result(store: dict, day: str, length: int, uid: str, name: str, won: bool, attempts: int) -> None:
+    """
+    Обновляет агрегат дня за O(1): счетчики, распределение попыток
+    и таблицу лидеров фиксированного размера (по попыткам, затем по времени).
+    """
+    agg = store["daily"].setdefault(day, {}).setdefault(str(length), {
+        "played": 0, "wins": 0, "dist": [0] * 6, "leaders": []
+    })
+    agg["played"] += 1
+    if not won:
+        return
+    agg["wins"] += 1
+    agg["dist"][attempts - 1] += 1
+
+    leaders = agg["leaders"]
+    entry = [attempts, datetime.now(MSK).strftime("%H:%M:%S"), uid, name]
+    if len(leaders) < DAILY_TOP_SIZE or entry[:2] < leaders[-1][:2]:
+        bisect.insort(leaders, entry, key=lambda e: e[:2])
+        del leaders[DAILY_TOP_SIZE:]
+
+
+async def prepare_daily(context: ContextTypes.DEFAULT_TYPE):
+    """
+    Раз в сутки (и при старте): греет кэш пустых досок и первой строки
+    для слов дня, выбрасывает агрегаты старше DAILY_KEEP_DAYS.
+    """
+    day = today_msk()
+    for length in WORDS_BY_LENGTH:
+        base_board_image(length)
+        daily_secret(length, day)
+
+    store = load_store()
+    cutoff = (datetime.fromisoformat(day) - timedelta(days=DAILY_KEEP_DAYS)).date().isoformat()
+    stale = [d for d in store["daily"] if d < cutoff]
+    for d in stale:
+        del store["daily"][d]
+    if stale:
+        save_store(store)
+
+
+# --- Дуэли ---
+
+# Сколько секунд ждем соперника в очереди
+DUEL_WAIT_TIMEOUT = 120
+# Очереди ожидания по длине слова: {длина: {uid: {"name", "future"}}} (порядок вставки = FIFO)
+DUEL_QUEUES: dict[int, dict[str, dict]] = {}
+# Идущие матчи: {match_id: {...}} и обратный индекс {uid: match_id}
+DUEL_MATCHES: dict[str, dict] = {}
+USER_DUEL: dict[str, str] = {}
+
+
+def duel_leave_queue(uid: str) -> bool:
+    """Убирает игрока из очереди ожидания (если он там есть)."""
+    for queue in DUEL_QUEUES.values():
+        waiter = queue.pop(uid, None)
+        if waiter:
+            if not waiter["future"].done():
+                waiter["future"].cancel()
+            return True
+    return False
+
+
+async def duel_wait(context: ContextTypes.DEFAULT_TYPE, uid: str, length: int, future: asyncio.Future):
+    """
+    Фоновая задача ожидания соперника. Если за DUEL_WAIT_TIMEOUT пару не нашли —
+    убираем игрока из очереди и сообщаем ему. Обработчики при этом не ждут.
+    """
+    try:
+        await asyncio.wait_for(asyncio.shield(future), DUEL_WAIT_TIMEOUT)
+        return
+    except asyncio.CancelledError:
+        return
+    except asyncio.TimeoutError:
+        pass
+
+    if DUEL_QUEUES.get(length, {}).pop(uid, None) is None:
+        return
+    user_data = context.application.user_data[int(uid)]
+    user_data.pop("duel_waiting", None)
+    user_data.pop("game_active", None)
+    try:
+        await context.bot.send_message(
+            chat_id=int(uid),
+            text="⌛ Соперник не нашелся. Попробуй позже: /duel (или /reset, чтобы выйти)"
+        )
+    except Exception as e:
+        logger.warning(f"Не смогли сообщить {uid} о таймауте дуэли: {e}")
+
+
+# Через сколько секунд после первой пары пишем накопившиеся игры дуэлей одной записью
+DUEL_FLUSH_DELAY = 0.5
+_duel_flush = {"scheduled": False}
+
+
+def duel_overlay(store: dict) -> None:
+    """
+    Подмешивает в store игры сведенных, но еще не записанных дуэлей. Игру,
+    которая в сторе уже есть (и, возможно, с ходами), не трогаем; сдавшимся
+    и закончившим не воскрешаем.
+    """
+    for uid, cg in _duel_unsaved.items():
+        match = DUEL_MATCHES.get(cg["duel"])
+        if not match or match["players"][uid]["done"]:
+            continue
+        u = store["users"].setdefault(uid, {"stats": {"games_played":0,"wins":0,"losses":0}})
+        if u.get("current_game", {}).get("duel") != cg["duel"]:
+            u["current_game"] = dict(cg, guesses=list(cg["guesses"]))
+
+
+async def duel_flush(delay: float = DUEL_FLUSH_DELAY) -> None:
+    """Пишет все игры дуэлей, сведенных за delay секунд, одним save_store."""
+    await asyncio.sleep(delay)
+    _duel_flush["scheduled"] = False
+    if _duel_unsaved:
+        store = load_store()
+        _duel_unsaved.clear()
+        save_store(store)
+
+
+def duel_create(application, length: int, players: dict[str, str]) -> dict:
+    """
+    Создает матч в памяти и текущую игру с общим словом каждому участнику.
+    На диск игры уходят пачкой в duel_flush, а до того их видит load_store.
+    """
+    match = {
+        "id": secrets.token_hex(4),
+        "secret": pick_secret(length),
+        "players": {uid: {"name": name, "attempts": 0, "done": False} for uid, name in players.items()},
+    }
+    DUEL_MATCHES[match["id"]] = match
+    for uid in players:
+        USER_DUEL[uid] = match["id"]
+        _duel_unsaved[uid] = {
+            "secret": match["secret"],
+            "attempts": 0,
+            "guesses": [],
+            "duel": match["id"],
+            "started_at": int(time.time()),
+            "last_move": int(time.time()),
+        }
+        series_add("games")
+    if not _duel_flush["scheduled"]:
+        _duel_flush["scheduled"] = True
+        application.create_task(duel_flush())
+    return match
+
+
+def duel_finish(match: dict) -> None:
+    DUEL_MATCHES.pop(match["id"], None)
+    for uid in match["players"]:
+        if USER_DUEL.get(uid) == match["id"]:
+            del USER_DUEL[uid]
+
+
+async def duel_push(bot, uid: str, text: str) -> None:
+    try:
+        await bot.send_message(chat_id=int(uid), text=text)
+    except Exception as e:
+        logger.warning(f"Не смогли отправить обновление дуэли {uid}: {e}")
+
+
+def duel_on_guess(context: ContextTypes.DEFAULT_TYPE, store: dict, uid: str, guess: str) -> None:
+    """
+    Вызывается из handle_guess после каждой принятой догадки в дуэли.
+    Шлет сопернику фидбек (без букв) фоновой задачей; при победе —
+    завершает игру соперника поражением прямо в уже загруженном store.
+    """
+    cg = store["users"][uid]["current_game"]
+    match = DUEL_MATCHES.get(cg.get("duel"))
+    if not match:
+        return
+    me = match["players"][uid]
+    me["attempts"] = cg["attempts"]
+    won = guess == match["secret"]
+    lost = not won and cg["attempts"] >= 6
+    pattern = feedback_cached(match["secret"], guess)
+
+    for opp_uid, opp in match["players"].items():
+        if opp_uid == uid:
+            continue
+        if won and not opp["done"]:
+            # соперник проиграл — закрываем его игру
+            opp["done"] = True
+            ou = store["users"].get(opp_uid, {})
+            if ou.get("current_game", {}).get("duel") == match["id"]:
+                record_user_result(ou, False, ou.pop("current_game"))
+                stats = ou["stats"]
+                stats["games_played"] += 1
+                stats["losses"] += 1
+                stats["win_rate"] = stats["wins"] / stats["games_played"]
+                g = store["global"]
+                g["total_games"] += 1
+                g["total_losses"] += 1
+                g["win_rate"] = g["total_wins"] / g["total_games"]
+            opp_data = context.application.user_data[int(opp_uid)]
+            opp_data.pop("game_active", None)
+            opp_data["just_done"] = True
+            text = (
+                f"⚔️ {me['name']} угадал слово «{match['secret']}» за {cg['attempts']} поп. — ты проиграл.\n"
+                "Реванш: /duel"
+            )
+        elif won:
+            text = f"⚔️ {me['name']} угадал слово «{match['secret']}» за {cg['attempts']} поп."
+        elif lost:
+            text = f"⚔️ У {me['name']} закончились попытки. Дожимай!"
+        else:
+            text = f"⚔️ {me['name']}, попытка {cg['attempts']}: {pattern}"
+        context.application.create_task(duel_push(context.bot, opp_uid, text))
+
+    if won or lost:
+        me["done"] = True
+    if won or all(p["done"] for p in match["players"].values()):
+        duel_finish(match)
+
+
+# --- Обработчики команд ---
+
+def check_ban_status(handler):
+    @wraps(handler)
+    async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
+        user_id = str(update.effective_user.id)
+        series_touch(user_id)
+        store = load_store()
+        user_data = store["users"].get(user_id, {})
+        
+        if user_data.get("banned", False):
+            try:
+                # Проверяем, не отправляли ли мы уже сообщение в этом обновлении
+                if context.user_data.get("last_ban_update_id") != update.update_id:
+                    if update.callback_query:
+                        await update.callback_query.answer("❌ Вы заблокированы в этом боте.", show_alert=True)
+                    else:
+                        await update.message.reply_text("❌ Вы заблокированы в этом боте.")
+                    # Запоминаем ID обновления
+                    context.user_data["last_ban_update_id"] = update.update_id
+                return ConversationHandler.END
+            except Exception as e:
+                logger.warning(f"Error handling banned user {user_id}: {e}")
+                return
+        else:
+            # Если пользователь был разбанен, очищаем его состояние при первом сообщении
+            if user_data.get("was_banned"):
+                context.user_data.clear()
+                # Удаляем флаг разбана из базы данных
+                user_data.pop("was_banned", None)
+                save_store(store)
+        return await handler(update, context, *args, **kwargs)
+    return wrapper
+
+async def is_banned(user_id: str) -> bool:
+    """Проверяет, забанен ли пользователь"""
+    return str(user_id) in BANNED_USERS
+
+
+# Забаненные — в памяти, чтобы горячие пути (догадки в группах) не разбирали стор.
+# Меняется только в /ban и /unban.
+BANNED_USERS: set[str] = {uid for uid, u in load_store()["users"].items() if u.get("banned")}
+
+
+
+# Режим отчета при старте: "summary" — только сводка, "full" — полная выгрузка
+ACTIVITY_EXPORT_MODE = os.getenv("ACTIVITY_EXPORT", "summary")
+# Сколько записей кладем в одну часть .ndjson.gz (лимит документа у Telegram — 50 МБ)
+EXPORT_PART_RECORDS = 20000
+
+
+def iter_activity_records(store: dict):
+    """
+    Отдает store построчно: сначала global, затем по одному пользователю,
+    затем агрегаты слова дня. Ничего не собирает в одну большую строку.
+    """
+    yield {"type": "global", **store["global"]}
+    for uid, data in store["users"].items():
+        yield {"type": "user", "id": uid, **data}
+    for day, by_length in store.get("daily", {}).items():
+        yield {"type": "daily", "day": day, "lengths": by_length}
+
+
+def export_activity(store: dict, part_records: int = EXPORT_PART_RECORDS):
+    """
+    Потоковая выгрузка в gzip NDJSON частями по part_records записей.
+    Каждая часть пишется во временный файл (в памяти до 1 МБ, дальше на диск),
+    так что память ограничена одной записью и буфером gzip.
+    Генератор отдает (номер части, открытый файл) — файл закрывается после next().
+    """
+    part, count = 1, 0
+    raw = tempfile.SpooledTemporaryFile(max_size=1_000_000)
+    gz = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+    for record in iter_activity_records(store):
+        gz.write(json.dumps(record, ensure_ascii=False).encode("utf-8") + b"\n")
+        count += 1
+        if count >= part_records:
+            gz.close()
+            raw.seek(0)
+            yield part, raw
+            raw.close()
+            part, count = part + 1, 0
+            raw = tempfile.SpooledTemporaryFile(max_size=1_000_000)
+            gz = gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6)
+    gz.close()
+    if count:
+        raw.seek(0)
+        yield part, raw
+    raw.close()
+
+
+def activity_summary(store: dict) -> str:
+    """
+    Короткая сводка: пользователи, активные за сутки/неделю, игры,
+    прирост с прошлой сводки. Снимок для прироста сохраняется в store["global"].
+    """
+    now = datetime.now(MSK)
+    users = store["users"]
+    active_day = active_week = banned = in_game = 0
+    for data in users.values():
+        banned += bool(data.get("banned"))
+        in_game += "current_game" in data
+        seen = data.get("last_seen_msk")
+        if not seen:
+            continue
+        try:
+            age = now - datetime.fromisoformat(seen)
+        except ValueError:
+            continue
+        active_day += age <= timedelta(days=1)
+        active_week += age <= timedelta(days=7)
+
+    g = store["global"]
+    prev = g.get("export_snapshot", {})
+    lines = [
+        f"📋 Сводка user_activity ({now.strftime('%Y-%m-%d %H:%M')} МСК)",
+        f"👥 Пользователей: {len(users)} (+{len(users) - prev.get('users', len(users))} с {prev.get('at', '—')})",
+        f"🟢 Активны за сутки: {active_day}, за неделю: {active_week}",
+        f"🎮 Сейчас в игре: {in_game}, забанено: {banned}",
+        f"🎲 Игр всего: {g['total_games']} (+{g['total_games'] - prev.get('games', g['total_games'])}), "
+        f"побед: {g['total_wins']}, поражений: {g['total_losses']}",
+    ]
+    g["export_snapshot"] = {"at": now.strftime("%Y-%m-%d %H:%M"), "users": len(users), "games": g["total_games"]}
+    return "\n".join(lines)
+
+
+async def send_activity_export(bot, chat_id: int, store: dict) -> None:
+    """Отправляет полную выгрузку частями .ndjson.gz (через пул рассылок)."""
+    for part, f in export_activity(store):
+        await bot.send_document(
+            chat_id=chat_id,
+            document=InputFile(f, filename=f"user_activity.part{part}.ndjson.gz"),
+            caption=f"📁 user_activity, часть {part}",
+            rate_limit_args="bulk"
+        )
+
 
 async def send_activity_periodic(context: ContextTypes.DEFAULT_TYPE):
     """
-    Периодически (и сразу при старте) шлет user_activity.json администратору.
-    Если файл слишком большой, шлет его как документ.
+    Периодически (и сразу при старте) шлет администратору отчет по user_activity.json:
+    по умолчанию только сводку, при ACTIVITY_EXPORT=full — еще и сжатую выгрузку.
     """
     ADMIN_ID = int(os.getenv("ADMIN_ID", "0"))
-    activity_path = USER_FILE
-    if not activity_path.exists():
+    if not USER_FILE.exists():
         return
 
-    content = activity_path.read_text(encoding="utf-8")
-    # Ограничение Telegram — примерно 4096 символов
-    MAX_LEN = 4000
-
-    if len(content) <= MAX_LEN:
-        # Можно втиснуть в одно сообщение
-        await context.bot.send_message(
-            chat_id=ADMIN_ID,
-            text=f"📋 Текущий user_activity.json:\n<pre>{content}</pre>",
-            parse_mode="HTML"
-        )
-    else:
-        # Слишком длинное — отправляем как файл
-        with activity_path.open("rb") as f:
-            await context.bot.send_document(
-                chat_id=ADMIN_ID,
-                document=InputFile(f, filename="user_activity.json"),
-                caption="📁 user_activity.json (слишком большой для текста)"
-            )
+    store = load_store()
+    summary = activity_summary(store)
+    # снимок сохраняем до отправки: пока ждем сеть, стор могут переписать другие
+    save_store(store)
+    await context.bot.send_message(chat_id=ADMIN_ID, text=summary)
+    if ACTIVITY_EXPORT_MODE == "full":
+        await send_activity_export(bulk_bot(context), ADMIN_ID, store)
 
 
 async def send_unfinished_games(context: ContextTypes.DEFAULT_TYPE):
@@ -543,7 +2902,7 @@ async def send_unfinished_games(context: ContextTypes.DEFAULT_TYPE):
             "Нажмите /play или /start, чтобы продолжить!"
         )
         try:
-            await context.bot.send_message(chat_id=int(uid), text=text)
+            await bulk_bot(context).send_message(chat_id=int(uid), text=text, rate_limit_args="bulk")
         except Exception as e:
             logger.warning(f"Не смогли напомнить {uid}: {e}")
             continue
@@ -574,6 +2933,8 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store = load_store()
     u = store["users"].get(str(update.effective_user.id), {})
     clear_notification_flag(str(update.effective_user.id))
+    if context.args and context.args[0].startswith(CHALLENGE_PREFIX) and "current_game" not in u:
+        return await challenge_accept(update, context, context.args[0][len(CHALLENGE_PREFIX):])
     if "current_game" in u:
         cg = u["current_game"]
         # заполняем context.user_data из cg:
@@ -592,11 +2953,18 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         "Привет! Я Wordle Bot — угадай слово за 6 попыток.\n"
         "https://github.com/sqwirex/wordle-bot - ссылка на репозиторий с кодом бота\n\n"
-        "/play — начать или продолжить игру\n"
+        "/play — начать или продолжить игру (можно сразу указать длину и сложность: /play 5, /play сложно, /play 6 легко)\n"
         "/hint — дает слово в подсказку, если вы затрудняетесь ответить " \
         "(случайное слово в котором совпадают некоторые буквы с загаданным)\n"
+        "/daily — слово дня: одно на всех для каждой длины\n"
+        "/daily_top — итоги и лидеры слова дня\n"
+        "/duel — дуэль: кто быстрее угадает одно и то же слово\n"
+        "/absurd — абсурд: слово не загадано заранее и уворачивается от твоих догадок\n"
+        "/challenge — ссылка для друга, чтобы он сыграл твое слово\n"
         "/reset — сбросить текущую игру\n"
         "/notification — включить/отключить уведомления при пробуждении бота\n"
+        "/hard — хард-режим: каждая догадка обязана учитывать все подсказки\n"
+        "/display — доска картинкой, текстом (быстрее) или одним сообщением на игру: /display одно\n"
         "/my_stats — посмотреть свою статистику\n"
         "/global_stats — посмотреть глобальную статистику за все время\n"
         "/feedback — если ты встретил слово, которое не должно быть в словаре или не существует, введи его в Черный список, " \
@@ -616,23 +2984,826 @@ async def ask_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     clear_notification_flag(str(update.effective_user.id))
     context.user_data["game_active"] = True
     store = load_store()
-    u = store["users"].get(str(update.effective_user.id), {})
-    if "current_game" in u:
-        cg = u["current_game"]
-        # заполняем context.user_data из cg:
-        context.user_data.update({
-            "secret": cg["secret"],
-            "length": len(cg["secret"]),
-            "attempts": cg["attempts"],
-            "guesses": cg["guesses"],
-        })
-        await update.message.reply_text(
-            f"Продолжаем игру: {len(cg['secret'])}-буквенное слово, ты на попытке {cg['attempts']}. Вводи догадку:"
-        )
-        return GUESSING
-    
-    await update.message.reply_text("Сколько букв в слове? (4–11)")
-    return ASK_LENGTH
+    u = store["users"].get(str(update.effective_user.id), {})
+    if "current_game" in u:
+        cg = u["current_game"]
+        # заполняем context.user_data из cg:
+        context.user_data.update({
+            "secret": cg["secret"],
+            "length": len(cg["secret"]),
+            "attempts": cg["attempts"],
+            "guesses": cg["guesses"],
+        })
+        await update.message.reply_text(
+            f"Продолжаем игру: {len(cg['secret'])}-буквенное слово, ты на попытке {cg['attempts']}. Вводи догадку:"
+        )
+        return GUESSING
+
+    # необязательные длина и сложность в любом порядке: /play 5, /play сложно, /play 6 легко
+    length = difficulty = None
+    for arg in context.args or []:
+        arg = arg.strip().lower()
+        if arg.isdigit():
+            length = int(arg)
+        else:
+            difficulty = arg
+    if difficulty and difficulty not in DIFFICULTIES:
+        await update.message.reply_text(
+            "Сложность может быть: " + ", ".join(DIFFICULTIES) + ". Например: /play сложно"
+        )
+        context.user_data.pop("game_active", None)
+        return ConversationHandler.END
+    if length is not None and not 4 <= length <= 11:
+        await update.message.reply_text("Длина слова — от 4 до 11 букв: /play 5")
+        context.user_data.pop("game_active", None)
+        return ConversationHandler.END
+    context.user_data["difficulty"] = difficulty
+    context.user_data.pop("mode", None)
+
+    if length is not None:
+        return await begin_game(update, context, length)
+    await update.message.reply_text("Сколько букв в слове? (4–11)")
+    return ASK_LENGTH
+
+
+@check_ban_status
+async def daily_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Слово дня: у всех одно и то же слово для каждой длины, сыграть можно один раз."""
+    context.user_data["state"] = ASK_LENGTH
+    update_user_activity(update.effective_user)
+    clear_notification_flag(str(update.effective_user.id))
+    context.user_data["game_active"] = True
+    store = load_store()
+    u = store["users"].get(str(update.effective_user.id), {})
+    if "current_game" in u:
+        cg = u["current_game"]
+        context.user_data.update({
+            "secret": cg["secret"],
+            "length": len(cg["secret"]),
+            "attempts": cg["attempts"],
+            "guesses": cg["guesses"],
+        })
+        await update.message.reply_text(
+            f"Продолжаем игру: {len(cg['secret'])}-буквенное слово, ты на попытке {cg['attempts']}. Вводи догадку:"
+        )
+        return GUESSING
+
+    context.user_data["mode"] = "daily"
+    context.user_data.pop("difficulty", None)
+    await update.message.reply_text("🗓 Слово дня! Сколько букв в слове? (4–11)")
+    return ASK_LENGTH
+
+
+@check_ban_status
+async def absurd_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Абсурд: бот не загадывает слово заранее и уворачивается от догадок."""
+    context.user_data["state"] = ASK_LENGTH
+    update_user_activity(update.effective_user)
+    clear_notification_flag(str(update.effective_user.id))
+    context.user_data["game_active"] = True
+    store = load_store()
+    u = store["users"].get(str(update.effective_user.id), {})
+    if "current_game" in u:
+        cg = u["current_game"]
+        await update.message.reply_text(
+            f"Продолжаем игру: {len(cg['secret'])}-буквенное слово, ты на попытке {cg['attempts']}. Вводи догадку:"
+        )
+        return GUESSING
+
+    context.user_data["mode"] = "absurd"
+    context.user_data.pop("difficulty", None)
+    await update.message.reply_text(
+        "🌀 Абсурд: я не загадываю слово заранее и после каждой догадки выбираю самый неудобный ответ.\n"
+        "Сколько букв в слове? (4–11)"
+    )
+    return ASK_LENGTH
+
+
+@check_ban_status
+async def duel_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Дуэль: два игрока на одном слове, кто быстрее угадает."""
+    context.user_data["state"] = ASK_LENGTH
+    update_user_activity(update.effective_user)
+    clear_notification_flag(str(update.effective_user.id))
+    context.user_data["game_active"] = True
+    store = load_store()
+    u = store["users"].get(str(update.effective_user.id), {})
+    if "current_game" in u:
+        cg = u["current_game"]
+        context.user_data.update({
+            "secret": cg["secret"],
+            "length": len(cg["secret"]),
+            "attempts": cg["attempts"],
+            "guesses": cg["guesses"],
+        })
+        await update.message.reply_text(
+            f"Продолжаем игру: {len(cg['secret'])}-буквенное слово, ты на попытке {cg['attempts']}. Вводи догадку:"
+        )
+        return GUESSING
+
+    context.user_data["mode"] = "duel"
+    context.user_data.pop("difficulty", None)
+    await update.message.reply_text("⚔️ Дуэль! Сколько букв в слове? (4–11)")
+    return ASK_LENGTH
+
+
+async def duel_enqueue(update: Update, context: ContextTypes.DEFAULT_TYPE, length: int):
+    """Ставит игрока в очередь по длине или сразу сводит с ожидающим соперником."""
+    uid = str(update.effective_user.id)
+    name = update.effective_user.username or update.effective_user.first_name or uid
+    queue = DUEL_QUEUES.setdefault(length, {})
+    duel_leave_queue(uid)
+
+    if not queue:
+        future = asyncio.get_running_loop().create_future()
+        queue[uid] = {"name": name, "future": future}
+        context.user_data["duel_waiting"] = length
+        context.user_data["state"] = GUESSING
+        context.application.create_task(duel_wait(context, uid, length, future))
+        await update.message.reply_text(
+            f"🔎 Ищу соперника на слово из {length} букв… Как только найдется — сразу начнем.\n"
+            "/reset — отменить поиск."
+        )
+        return GUESSING
+
+    # берем самого первого ожидающего
+    opp_uid = next(iter(queue))
+    opp = queue.pop(opp_uid)
+    opp["future"].set_result(None)
+
+    match = duel_create(context.application, length, {opp_uid: opp["name"], uid: name})
+
+    opp_data = context.application.user_data[int(opp_uid)]
+    opp_data.pop("duel_waiting", None)
+    opp_data.update({"state": GUESSING, "game_active": True})
+    context.user_data.update({
+        "secret": match["secret"], "length": length, "attempts": 0, "guesses": [], "state": GUESSING,
+    })
+
+    context.application.create_task(duel_push(
+        context.bot, opp_uid,
+        f"⚔️ Соперник найден: {name}! Слово из {length} букв, у каждого 6 попыток. Вводи первую догадку:"
+    ))
+    await update.message.reply_text(
+        f"⚔️ Соперник найден: {opp['name']}! Слово из {length} букв, у каждого 6 попыток. Вводи первую догадку:"
+    )
+    return GUESSING
+
+
+async def bench_duel_run(players: int, wait_timeout: float) -> str:
+    """
+    Прогон для bench_duel: players игроков одновременно встают в очередь со
+    случайной длиной, пары доигрывают до победы, лишние ждут таймаута.
+    Бот и приложение — заглушки с небольшой задержкой «сети».
+    """
+    rng = random.Random(0)
+    sent = Counter()
+    tasks = []
+
+    class StubBot:
+        async def send_message(self, chat_id, text, **kwargs):
+            await asyncio.sleep(rng.random() * 0.005)
+            sent["timeout" if text.startswith("⌛") else "push"] += 1
+
+    class StubApp:
+        user_data = defaultdict(dict)
+
+        def create_task(self, coro):
+            task = asyncio.ensure_future(coro)
+            tasks.append(task)
+            return task
+
+    app, bot = StubApp(), StubBot()
+
+    async def reply_text(text, **kwargs):
+        await asyncio.sleep(rng.random() * 0.005)
+
+    lengths = {uid: rng.randint(4, 11) for uid in range(1, players + 1)}
+
+    async def join(uid: int):
+        update = SimpleNamespace(
+            effective_user=SimpleNamespace(id=uid, username=f"p{uid}", first_name=None),
+            message=SimpleNamespace(reply_text=reply_text),
+        )
+        context = SimpleNamespace(application=app, bot=bot, user_data=app.user_data[uid])
+        await duel_enqueue(update, context, lengths[uid])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(join(uid) for uid in lengths))
+    matched = time.perf_counter() - started
+    matches = len(DUEL_MATCHES)
+    waiting = sum(len(q) for q in DUEL_QUEUES.values())
+
+    # игры пишутся на диск пачкой после DUEL_FLUSH_DELAY
+    await asyncio.sleep(DUEL_FLUSH_DELAY + 0.1)
+    persisted = sum("duel" in u.get("current_game", {}) for u in read_store()["users"].values())
+
+    # в каждом матче первый игрок угадывает с первой попытки
+    store = load_store()
+    context = SimpleNamespace(application=app, bot=bot)
+    for match in list(DUEL_MATCHES.values()):
+        uid = next(iter(match["players"]))
+        cg = store["users"][uid]["current_game"]
+        cg["attempts"], cg["guesses"] = 1, [match["secret"]]
+        duel_on_guess(context, store, uid, match["secret"])
+    finished = len(DUEL_MATCHES) == 0 and not USER_DUEL
+
+    # дожидаемся таймаутов и всех уведомлений
+    started = time.perf_counter()
+    while tasks:
+        batch, tasks[:] = list(tasks), []
+        await asyncio.gather(*batch)
+    drained = time.perf_counter() - started
+
+    odd = sum(n % 2 for n in Counter(lengths.values()).values())
+    leftover = sum(len(q) for q in DUEL_QUEUES.values())
+    ok = waiting == odd and sent["timeout"] == odd and leftover == 0 and finished and persisted == 2 * matches
+    return "\n".join([
+        f"Игроков: {players}, матчей: {matches}, ждали соперника: {waiting} (ожидалось {odd})",
+        f"Подбор пар: {matched * 1000:.0f} мс ({players / matched:,.0f} игроков/с)",
+        f"Игр на диске после DUEL_FLUSH_DELAY: {persisted} из {2 * matches}",
+        f"Матчи закрыты после победы: {'да' if finished else 'НЕТ'}",
+        f"Таймауты: {sent['timeout']} за {drained:.2f} с (таймаут {wait_timeout} с), в очередях осталось: {leftover}",
+        f"Уведомлений соперникам: {sent['push']}",
+        "OK" if ok else "ОШИБКА",
+    ])
+
+
+def bench_duel(players: int = 1000, wait_timeout: float = 0.5) -> str:
+    """
+    Нагрузка на подбор дуэлей: сотни одновременных матчей и таймауты
+    ожидания против бота-заглушки. Стор пишется во временный каталог,
+    настоящий user_activity.json не трогаем. Запуск: python bot.py --bench-duel
+    """
+    global USER_FILE, DUEL_WAIT_TIMEOUT
+    saved = USER_FILE, DUEL_WAIT_TIMEOUT
+    with tempfile.TemporaryDirectory() as tmpdir:
+        USER_FILE, DUEL_WAIT_TIMEOUT = Path(tmpdir) / "user_activity.json", wait_timeout
+        try:
+            return asyncio.run(bench_duel_run(players, wait_timeout))
+        finally:
+            USER_FILE, DUEL_WAIT_TIMEOUT = saved
+            DUEL_QUEUES.clear()
+            DUEL_MATCHES.clear()
+            USER_DUEL.clear()
+            _duel_unsaved.clear()
+            _duel_flush["scheduled"] = False
+
+
+# --- Игра в группах ---
+# В группе одна общая игра на чат, ходить может любой участник. Хендлеры групп
+# стоят раньше ConversationHandler'ов и ничего не делают сами: догадки
+# складываются в очередь чата, а несколько воркеров обходят чаты по кругу.
+# Так всплеск в одной группе не задерживает ни другие группы, ни личные чаты
+# (ответы групп идут с приоритетом ниже интерактивных).
+
+GROUP_WORKERS = 2
+# Сколько догадок чата обрабатываем за один заход воркера (дальше — очередь других чатов)
+GROUP_BATCH = 5
+# Сколько догадок может ждать в очереди одного чата; лишние отбрасываются
+GROUP_QUEUE_MAX = 20
+GROUP_DEFAULT_LENGTH = 5
+GROUP_ATTEMPTS = 6
+# Игры групп живут отдельно от user_activity.json: воркеры пишут их, пока
+# личные обработчики держат свою копию стора посреди await, и общий файл
+# терял бы ходы при их сохранении
+GROUP_FILE = Path("group_games.json")
+
+GROUP_PENDING: dict[int, deque] = {}
+GROUP_SCHEDULED: set[int] = set()
+GROUP_LOCKS: dict[int, asyncio.Lock] = {}
+GROUP_READY: asyncio.Queue | None = None
+
+
+def load_groups() -> dict[str, dict]:
+    """Общие игры: {chat_id: {"stats": {...}, "current_game": {...}}}."""
+    if not GROUP_FILE.exists():
+        return {}
+    try:
+        data = json.loads(GROUP_FILE.read_text("utf-8"))
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        quarantine_corrupt(GROUP_FILE)
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def save_groups() -> None:
+    atomic_write_bytes(
+        GROUP_FILE,
+        json.dumps(GROUPS, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    )
+
+
+recover_writes(GROUP_FILE)
+# загружаем один раз при старте, дальше работаем с играми в памяти
+GROUPS = load_groups()
+
+
+def group_chat(chat_id: int) -> dict:
+    return GROUPS.setdefault(str(chat_id), {"stats": {"games": 0, "wins": 0}})
+
+
+def group_lock(chat_id: int) -> asyncio.Lock:
+    lock = GROUP_LOCKS.get(chat_id)
+    if lock is None:
+        lock = GROUP_LOCKS[chat_id] = asyncio.Lock()
+    return lock
+
+
+def group_release(chat_id: int) -> None:
+    """Забывает очередь и замок чата, когда они больше не нужны."""
+    if chat_id in GROUP_SCHEDULED or GROUP_PENDING.get(chat_id):
+        return
+    GROUP_PENDING.pop(chat_id, None)
+    lock = GROUP_LOCKS.get(chat_id)
+    if lock and not lock.locked():
+        del GROUP_LOCKS[chat_id]
+
+
+def group_enqueue(chat_id: int, item: tuple) -> bool:
+    pending = GROUP_PENDING.setdefault(chat_id, deque())
+    if len(pending) >= GROUP_QUEUE_MAX:
+        return False
+    pending.append(item)
+    if chat_id not in GROUP_SCHEDULED:
+        GROUP_SCHEDULED.add(chat_id)
+        GROUP_READY.put_nowait(chat_id)
+    return True
+
+
+def group_apply(chat_id: int, batch: list[tuple]) -> tuple[str | None, list[str], object, tuple]:
+    """
+    Применяет пачку догадок по порядку прихода к игре чата в GROUPS.
+    Возвращает (подпись к доске или None, если доска не изменилась, заметки,
+    сообщение для ответа, (слово, догадки)).
+    """
+    chat = group_chat(chat_id)
+    cg = chat.get("current_game")
+    notes, turns, reply_to = [], [], batch[-1][2]
+    board = (cg["secret"], cg["guesses"]) if cg else None
+    late = 0
+    for uid, name, message, guess in batch:
+        if not cg:
+            late += 1
+            continue
+        if len(guess) != len(cg["secret"]):
+            notes.append(f"{name}: нужно слово из {len(cg['secret'])} букв.")
+            continue
+        if guess not in ALL_WORDS:
+            notes.append(f"{name}: слова «{guess}» нет в словаре.")
+            continue
+        if guess in cg["guesses"]:
+            notes.append(f"{name}: «{guess}» уже было.")
+            continue
+        cg["guesses"].append(guess)
+        cg["attempts"] += 1
+        cg["last_move"] = int(time.time())
+        cg["players"][uid] = name
+        series_add("guesses")
+        turns.append(f"{cg['attempts']}. {name}: {guess.upper()}")
+        reply_to = message
+
+        if guess == cg["secret"] or cg["attempts"] >= GROUP_ATTEMPTS:
+            won = guess == cg["secret"]
+            chat["stats"]["games"] += 1
+            if won:
+                chat["stats"]["wins"] += 1
+                turns.append(f"🎉 {name} угадывает слово «{cg['secret']}»!")
+                winners = chat["stats"].setdefault("winners", {})
+                winners[uid] = winners.get(uid, 0) + 1
+            else:
+                turns.append(f"💔 Попытки закончились. Было слово «{cg['secret']}».")
+            turns.append("Новая игра: /play")
+            del chat["current_game"]
+            cg = None
+            # догадки, что ждут в очереди, относятся к законченной игре — отбрасываем разом
+            pending = GROUP_PENDING.get(chat_id)
+            if pending:
+                late += len(pending)
+                pending.clear()
+
+    if late:
+        notes.append(f"Игра уже закончилась — не засчитано догадок: {late}. Новая игра: /play")
+    if not turns:
+        return None, notes, reply_to, board
+    if cg:
+        turns.append(f"Попытка {cg['attempts']} из {GROUP_ATTEMPTS}")
+    return "\n".join(turns), notes, reply_to, board
+
+
+async def group_turns(bot, chat_id: int) -> None:
+    """Один заход воркера в чат: до GROUP_BATCH догадок, одна доска в ответ."""
+    pending = GROUP_PENDING.get(chat_id)
+    batch = [pending.popleft() for _ in range(min(GROUP_BATCH, len(pending)))] if pending else []
+    if not batch:
+        return
+    caption, notes, reply_to, board = group_apply(chat_id, batch)
+    save_groups()
+
+    # Шлем через бота, а не через reply_* сообщения: rate_limit_args принимает только ExtBot
+    if caption is None:
+        if notes:
+            await bot.send_message(
+                chat_id=chat_id,
+                text="\n".join(notes),
+                reply_to_message_id=reply_to.message_id,
+                allow_sending_without_reply=True,
+                rate_limit_args="group"
+            )
+        return
+    secret, guesses = board
+    if notes:
+        caption = caption + "\n\n" + "\n".join(notes)
+    await send_board(
+        bot, chat_id, secret, guesses, caption[:1024],
+        reply_to_message_id=reply_to.message_id,
+        allow_sending_without_reply=True,
+        rate_limit_args="group"
+    )
+
+
+async def group_worker(bot) -> None:
+    """Берет чат из общей очереди, отыгрывает пачку ходов и ставит чат в конец, если ходы остались."""
+    while True:
+        chat_id = await GROUP_READY.get()
+        try:
+            async with group_lock(chat_id):
+                await group_turns(bot, chat_id)
+        except Exception as e:
+            logger.warning(f"Group turn failed in chat {chat_id}: {e}")
+        finally:
+            if GROUP_PENDING.get(chat_id):
+                GROUP_READY.put_nowait(chat_id)
+            else:
+                GROUP_SCHEDULED.discard(chat_id)
+                group_release(chat_id)
+
+
+def start_group_workers(app) -> None:
+    global GROUP_READY
+    GROUP_READY = asyncio.Queue()
+    for _ in range(GROUP_WORKERS):
+        app.create_task(group_worker(app.bot))
+
+
+@check_ban_status
+async def group_play(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/play [длина] в группе — общая игра на весь чат."""
+    chat_id = update.effective_chat.id
+    length = GROUP_DEFAULT_LENGTH
+    if context.args and context.args[0].isdigit():
+        length = int(context.args[0])
+    if length not in WORDS_BY_LENGTH:
+        await update.message.reply_text("Длина слова — от 4 до 11 букв: /play 6")
+        return
+
+    async with group_lock(chat_id):
+        chat = group_chat(chat_id)
+        cg = chat.get("current_game")
+        if cg:
+            await update.message.reply_text(
+                f"Игра уже идет: слово из {len(cg['secret'])} букв, попытка {cg['attempts']} из {GROUP_ATTEMPTS}.\n"
+                "Пишите догадки или /guess слово. /reset — начать заново."
+            )
+            return
+        chat["current_game"] = {
+            "secret": pick_secret(length),
+            "attempts": 0,
+            "guesses": [],
+            "players": {},
+            "started_by": update.effective_user.id,
+            "started_at": int(time.time()),
+        }
+        save_groups()
+        series_add("games")
+    await update.message.reply_text(
+        f"🎲 Загадал слово из {length} букв — угадываем всем чатом, {GROUP_ATTEMPTS} попыток на всех.\n"
+        "Пишите догадку сообщением (или /guess слово, если у бота включен режим приватности)."
+    )
+
+
+async def group_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    Догадка в группе: /guess слово или просто слово нужной длины. Только ставит в очередь.
+    Сюда приходит вся переписка групп, поэтому без check_ban_status: сначала
+    дешевые проверки по памяти (есть ли игра, та ли длина), бан — по BANNED_USERS.
+    """
+    chat_id = update.effective_chat.id
+    is_command = update.message.text.startswith("/")
+    cg = GROUPS.get(str(chat_id), {}).get("current_game")
+    if not cg:
+        if is_command:
+            await update.message.reply_text("Сейчас игры нет — начните: /play")
+        return
+
+    text = " ".join(context.args) if is_command else update.message.text
+    guess = normalize(text)
+    # в обычной переписке ловим только слова нужной длины, остальное — не нам
+    if not is_command and len(guess) != len(cg["secret"]):
+        return
+    if not guess or " " in guess or not guess.isalpha():
+        if is_command:
+            await update.message.reply_text("Формат: /guess слово")
+        return
+
+    user = update.effective_user
+    if str(user.id) in BANNED_USERS:
+        return
+    series_touch(str(user.id))
+    name = user.first_name or user.username or str(user.id)
+    if not group_enqueue(chat_id, (str(user.id), name, update.message, guess)):
+        await update.message.reply_text("⏳ Слишком много догадок сразу — подождите ответа.")
+
+
+@check_ban_status
+async def group_reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/reset в группе — может тот, кто начал игру, или админ чата."""
+    chat_id = update.effective_chat.id
+    user_id = update.effective_user.id
+    cg = GROUPS.get(str(chat_id), {}).get("current_game")
+    if not cg:
+        await update.message.reply_text("Сейчас игры нет — начните: /play")
+        return
+    if user_id != cg.get("started_by") and user_id != ADMIN_ID:
+        member = await context.bot.get_chat_member(chat_id, user_id)
+        if member.status not in ("administrator", "creator"):
+            await update.message.reply_text("Сбросить игру может тот, кто ее начал, или админ чата.")
+            return
+
+    async with group_lock(chat_id):
+        cg = GROUPS.get(str(chat_id), {}).pop("current_game", None)
+        GROUP_PENDING.pop(chat_id, None)
+        if cg:
+            save_groups()
+    if cg:
+        await update.message.reply_text(f"Игра сброшена. Было слово «{cg['secret']}». Новая игра: /play")
+
+
+async def group_help(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    await update.message.reply_text(
+        "В группе играем все вместе:\n"
+        "/play [длина] — новая общая игра (по умолчанию 5 букв)\n"
+        "/guess слово — сделать ход (или просто напишите слово нужной длины)\n"
+        "/reset — сбросить игру (тот, кто начал, или админ)\n"
+        "Остальные режимы — в личке с ботом."
+    )
+
+
+# --- Inline-режим: @bot слово ---
+# Запросы приходят на каждое нажатие клавиши, поэтому ответ строится только из
+# памяти: проверка по ALL_WORDS через LRU-кэш и результат последней игры из
+# SHARE_RESULTS. Стор не читается вовсе. Inline-режим включается у @BotFather (/setinline).
+
+INLINE_CACHE_TIME = 30          # сек; Telegram кэширует ответ на одинаковый запрос
+SHARE_RESULTS_MAX = 50_000
+# Последний результат игрока для «поделиться»: {uid: готовый inline-результат}; живет в памяти
+SHARE_RESULTS: OrderedDict[str, InlineQueryResultArticle] = OrderedDict()
+
+
+def remember_share(uid: str, cg: dict, won: bool) -> None:
+    """Запоминает эмодзи-результат законченной игры для inline-кнопки «поделиться»."""
+    secret = cg["secret"]
+    title = f"Слово дня {cg['daily']}" if cg.get("daily") else "Wordle-бот"
+    score = cg["attempts"] if won else "X"
+    rows = "\n".join(feedback_cached(secret, g) for g in cg["guesses"])
+    head = f"{title}, {len(secret)} букв: {score}/6"
+    SHARE_RESULTS[uid] = InlineQueryResultArticle(
+        id=f"s:{secrets.token_hex(8)}",
+        title="📤 Поделиться результатом",
+        description=head,
+        input_message_content=InputTextMessageContent(f"{head}\n\n{rows}"),
+    )
+    SHARE_RESULTS.move_to_end(uid)
+    while len(SHARE_RESULTS) > SHARE_RESULTS_MAX:
+        SHARE_RESULTS.popitem(last=False)
+
+
+@lru_cache(maxsize=8192)
+def inline_word_check(word: str, dict_version: int) -> InlineQueryResultArticle:
+    """
+    Готовый результат проверки слова. dict_version в ключе сбрасывает кэш при
+    любой смене словаря: хэш основного списка не меняется, если правили только дополнительный.
+    """
+    if word in ALL_WORDS:
+        title, text = f"✅ «{word}» есть в словаре", f"✅ Слово «{word}» есть в словаре Wordle-бота."
+    else:
+        title, text = f"❌ «{word}» нет в словаре", f"❌ Слова «{word}» нет в словаре Wordle-бота."
+    return InlineQueryResultArticle(
+        id=f"w:{hashlib.md5(word.encode('utf-8')).hexdigest()}",
+        title=title,
+        description=f"{len(word)} букв" if 4 <= len(word) <= 11 else "в игре слова из 4–11 букв",
+        input_message_content=InputTextMessageContent(text),
+    )
+
+
+def inline_results(uid: str, query: str) -> tuple[list, bool]:
+    """Результаты inline-запроса и признак «персональный» (есть результат игрока)."""
+    results = []
+    word = normalize(query.split()[0]) if query.split() else ""
+    if word and word.isalpha() and len(word) <= 32:
+        results.append(inline_word_check(word, DICT_STATE["version"]))
+    share = SHARE_RESULTS.get(uid)
+    if share:
+        results.append(share)
+    return results, share is not None
+
+
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    results, personal = inline_results(str(query.from_user.id), query.query)
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=personal)
+
+
+def bench_inline(queries: int = 200_000) -> str:
+    """
+    Сколько inline-запросов в секунду выдерживает построение ответа
+    (без сети): «печать» случайных слов по буквам. Запуск: python bot.py --bench-inline
+    """
+    rng = random.Random(0)
+    words = rng.sample(sorted(ALL_WORDS), min(2000, len(ALL_WORDS)))
+    typed = [w[:rng.randint(1, len(w))] for w in (rng.choice(words) for _ in range(queries))]
+    remember_share("0", {"secret": words[0], "attempts": 1, "guesses": [words[0]]}, True)
+    inline_word_check.cache_clear()
+    lines = []
+    for label in ("холодный кэш", "теплый кэш"):
+        before = inline_word_check.cache_info()
+        started = time.perf_counter()
+        for i, q in enumerate(typed):
+            inline_results(str(i % 2), q)
+        elapsed = time.perf_counter() - started
+        info = inline_word_check.cache_info()
+        hits, misses = info.hits - before.hits, info.misses - before.misses
+        lines.append(
+            f"{label}: {queries / elapsed:,.0f} запросов/с, попаданий в кэш {hits / max(1, hits + misses) * 100:.0f}%"
+        )
+    SHARE_RESULTS.pop("0", None)
+    return "\n".join(lines)
+
+
+# --- Вызовы другу: t.me/<bot>?start=c<токен> ---
+# Токен сам по себе описывает слово: (длина, номер в корзине длины, версия
+# словаря) + усеченная HMAC-подпись. Для старта по ссылке не нужна ни таблица
+# вызовов, ни поиск в сторе. Результаты копятся счетчиками на токен.
+
+CHALLENGE_PREFIX = "c"
+CHALLENGE_FILE = Path("challenge_stats.json")
+CHALLENGE_STATS_MAX = 50_000
+CHALLENGE_SIG_BYTES = 6
+# Ключ подписи: CHALLENGE_SECRET или производный от токена бота
+_challenge_key = hashlib.sha256(
+    (os.getenv("CHALLENGE_SECRET") or os.getenv("BOT_TOKEN") or secrets.token_hex(16)).encode("utf-8")
+).digest()
+
+
+def challenge_token(secret: str) -> str | None:
+    """Компактный подписанный токен слова (18 символов base64url без «=») или None, если слова нет в корзине."""
+    bucket = WORDS_BY_LENGTH.get(len(secret), [])
+    i = bisect.bisect_left(bucket, secret)
+    if i >= len(bucket) or bucket[i] != secret:
+        return None
+    payload = bytes([len(secret)]) + i.to_bytes(2, "big") + bytes.fromhex(DICT_STATE["hash"][:8])
+    sig = hmac.new(_challenge_key, payload, hashlib.sha256).digest()[:CHALLENGE_SIG_BYTES]
+    # «=» в deep link недопустим — паддинг срезаем и восстанавливаем при разборе
+    return base64.urlsafe_b64encode(payload + sig).decode("ascii").rstrip("=")
+
+
+def challenge_secret(token: str) -> tuple[str | None, str]:
+    """Слово по токену и текст ошибки, если токен битый или словарь с тех пор поменялся."""
+    try:
+        raw = base64.urlsafe_b64decode(token.encode("ascii") + b"=" * (-len(token) % 4))
+    except (ValueError, UnicodeEncodeError):
+        return None, "Ссылка повреждена."
+    payload, sig = raw[:-CHALLENGE_SIG_BYTES], raw[-CHALLENGE_SIG_BYTES:]
+    expected = hmac.new(_challenge_key, payload, hashlib.sha256).digest()[:CHALLENGE_SIG_BYTES]
+    if len(payload) != 7 or not hmac.compare_digest(sig, expected):
+        return None, "Ссылка повреждена."
+    length, index, version = payload[0], int.from_bytes(payload[1:3], "big"), payload[3:].hex()
+    bucket = WORDS_BY_LENGTH.get(length, [])
+    if version != DICT_STATE["hash"][:8] or index >= len(bucket):
+        return None, "Ссылка устарела: словарь с тех пор обновился. Попроси друга прислать новую."
+    return bucket[index], ""
+
+
+def load_challenge_stats() -> OrderedDict:
+    if not CHALLENGE_FILE.exists():
+        return OrderedDict()
+    try:
+        data = json.loads(CHALLENGE_FILE.read_text("utf-8"))
+    except json.JSONDecodeError:
+        return OrderedDict()
+    # {токен: [начали, доиграли, угадали, сумма попыток у угадавших]} от давних к свежим
+    return OrderedDict(data if isinstance(data, list) else [])
+
+
+recover_writes(CHALLENGE_FILE)
+CHALLENGE_STATS = load_challenge_stats()
+_challenge_dirty = False
+
+
+def challenge_count(token: str, started: int = 0, won: bool | None = None, attempts: int = 0) -> list[int]:
+    global _challenge_dirty
+    counters = CHALLENGE_STATS.get(token) or [0, 0, 0, 0]
+    counters[0] += started
+    if won is not None:
+        counters[1] += 1
+        if won:
+            counters[2] += 1
+            counters[3] += attempts
+    CHALLENGE_STATS[token] = counters
+    CHALLENGE_STATS.move_to_end(token)
+    while len(CHALLENGE_STATS) > CHALLENGE_STATS_MAX:
+        CHALLENGE_STATS.popitem(last=False)
+    _challenge_dirty = True
+    return counters
+
+
+def challenge_summary(counters: list[int]) -> str:
+    started, finished, wins, attempts = counters
+    avg = f", в среднем за {attempts / wins:.1f}" if wins else ""
+    return f"По этой ссылке играли {started}, доиграли {finished}, угадали {wins}{avg}."
+
+
+def challenge_finish(cg: dict, won: bool) -> str:
+    """Учитывает результат игры по ссылке; строка для итогового сообщения."""
+    token = cg.get("challenge")
+    if not token:
+        return ""
+    return challenge_summary(challenge_count(token, won=won, attempts=cg["attempts"])) + "\n"
+
+
+async def save_challenge_stats(context: ContextTypes.DEFAULT_TYPE):
+    global _challenge_dirty
+    if not _challenge_dirty:
+        return
+    _challenge_dirty = False
+    atomic_write_bytes(
+        CHALLENGE_FILE,
+        json.dumps(list(CHALLENGE_STATS.items()), separators=(",", ":")).encode("utf-8")
+    )
+
+
+@check_ban_status
+async def challenge(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/challenge [длина] — ссылка для друга: слово последней сыгранной игры, либо новое."""
+    store = load_store()
+    u = store["users"].get(str(update.effective_user.id), {})
+    # ссылка на слово идущей игры выдала бы ответ — пока игра не кончилась, вызов не даем
+    if "current_game" in u:
+        await update.message.reply_text("Сначала доиграй текущую игру (или /reset), потом бросай вызов.")
+        return
+    secret = u.get("last_secret")
+    if context.args and context.args[0].isdigit():
+        length = int(context.args[0])
+        if length not in WORDS_BY_LENGTH:
+            await update.message.reply_text("Длина слова — от 4 до 11 букв: /challenge 6")
+            return
+        secret = pick_secret(length)
+    elif not secret:
+        secret = pick_secret(GROUP_DEFAULT_LENGTH)
+
+    token = challenge_token(secret)
+    if not token:
+        await update.message.reply_text("Этого слова уже нет в словаре — попробуй /challenge 5.")
+        return
+    link = f"https://t.me/{context.bot.username}?start={CHALLENGE_PREFIX}{token}"
+    counters = CHALLENGE_STATS.get(token)
+    await update.message.reply_text(
+        f"⚔️ Вызов на слово из {len(secret)} букв — отправь другу ссылку:\n{link}"
+        + (f"\n\n{challenge_summary(counters)}" if counters else "")
+    )
+
+
+async def challenge_accept(update: Update, context: ContextTypes.DEFAULT_TYPE, token: str):
+    """Старт по ссылке-вызову: слово берется из токена, current_game создается сразу."""
+    secret, error = challenge_secret(token)
+    if not secret:
+        await update.message.reply_text(f"{error} А пока можно сыграть обычную игру: /play")
+        return ConversationHandler.END
+
+    store = load_store()
+    u = store["users"].setdefault(str(update.effective_user.id), {"stats": {"games_played":0,"wins":0,"losses":0}})
+    u["current_game"] = {
+        "secret": secret,
+        "attempts": 0,
+        "guesses": [],
+        "started_at": int(time.time()),
+        "last_move": int(time.time()),
+        "challenge": token,
+    }
+    if u.get("hard_mode"):
+        u["current_game"]["hard"] = hard_rules_new(len(secret))
+    save_store(store)
+    series_add("games")
+    challenge_count(token, started=1)
+
+    context.user_data.update({
+        "secret": secret, "length": len(secret), "attempts": 0, "guesses": [],
+        "state": GUESSING, "game_active": True,
+    })
+    await update.message.reply_text(
+        f"⚔️ Тебе бросили вызов! Слово из {len(secret)} букв, 6 попыток. Введи первую догадку:"
+    )
+    return GUESSING
 
 
 @check_ban_status
@@ -642,24 +3813,62 @@ async def receive_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not text.isdigit() or not 4 <= int(text) <= 11:
         await update.message.reply_text("Нужно число от 4 до 11.")
         return ASK_LENGTH
+    return await begin_game(update, context, int(text))
+
 
-    length = int(text)
-    candidates = [w for w in WORDLIST if len(w) == length]
+async def begin_game(update: Update, context: ContextTypes.DEFAULT_TYPE, length: int):
+    """Заводит игру выбранной длины (из ответа на вопрос или сразу из /play 5)."""
+    candidates = WORDS_BY_LENGTH.get(length)
     if not candidates:
         await update.message.reply_text("Не нашел слов такой длины. Попробуй еще:")
         return ASK_LENGTH
 
-    secret = random.choice(candidates)
-    
     store = load_store()
     u = store["users"].setdefault(str(update.effective_user.id), {"stats": {"games_played":0,"wins":0,"losses":0}})
+
+    if context.user_data.get("mode") == "duel":
+        return await duel_enqueue(update, context, length)
+
+    if context.user_data.get("mode") == "daily":
+        day = today_msk()
+        played = u.get("daily_played", {})
+        if played.get("day") == day and length in played.get("lengths", []):
+            await update.message.reply_text(
+                f"Слово дня из {length} букв ты уже разгадывал сегодня. Выбери другую длину:"
+            )
+            return ASK_LENGTH
+        secret = daily_secret(length, day)
+        # отмечаем сразу, чтобы /reset не давал переиграть слово дня
+        if played.get("day") != day:
+            played = {"day": day, "lengths": []}
+        played["lengths"].append(length)
+        u["daily_played"] = played
+    elif context.user_data.get("mode") == "absurd":
+        # настоящее слово определится только в конце игры
+        day = None
+        secret = None
+    else:
+        day = None
+        # если выбрана сложность и оценки уже посчитаны — берем слово из нужного уровня
+        secret = pick_secret(length, context.user_data.get("difficulty"), u)
+
     # Запись текущей игры
     u["current_game"] = {
         "secret": secret,
         "attempts": 0,
         "guesses": [],
+        "started_at": int(time.time()),
+        "last_move": int(time.time()),
     }
+    if day:
+        u["current_game"]["daily"] = day
+    if context.user_data.get("mode") == "absurd":
+        absurd_store(u["current_game"], candidates)
+        secret = u["current_game"]["secret"]
+    if u.get("hard_mode"):
+        u["current_game"]["hard"] = hard_rules_new(length)
     save_store(store)
+    series_add("games")
 
     context.user_data["secret"] = secret
     context.user_data["length"] = length
@@ -667,8 +3876,9 @@ async def receive_length(update: Update, context: ContextTypes.DEFAULT_TYPE):
     context.user_data["guesses"] = []
     context.user_data["state"] = GUESSING
 
+    hard = " Хард-режим: каждая догадка должна учитывать все подсказки." if u.get("hard_mode") else ""
     await update.message.reply_text(
-        f"Я загадал слово из {length} букв. У тебя 6 попыток. Введи первую догадку:"
+        f"Я загадал слово из {length} букв. У тебя 6 попыток.{hard} Введи первую догадку:"
     )
     
     return GUESSING
@@ -684,10 +3894,13 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
     })
 
     # Обновляем время последнего визита
-    user["last_seen_msk"] = datetime.now(ZoneInfo("Europe/Moscow")).isoformat()
+    user["last_seen_msk"] = datetime.now(MSK).isoformat()
 
     # Проверяем активную игру
     if "current_game" not in user:
+        if context.user_data.get("duel_waiting"):
+            await update.message.reply_text("Еще ищу соперника… /reset — отменить поиск.")
+            return GUESSING
         await update.message.reply_text("Нет активной игры, начни /play")
         return ConversationHandler.END
 
@@ -714,7 +3927,7 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = store["users"].get(user_id, {})
     suggested_words = user.get("suggested_words", [])
     
-    if normalized_guess in suggested_words and normalized_guess not in WORDLIST:
+    if normalized_guess in suggested_words and not in_main_dictionary(normalized_guess):
         await update.message.reply_text(
             "Извините, это слово уже было предложено вами, но еще не добавлено в словарь.\n"
             "Пожалуйста, дождитесь его проверки администратором."
@@ -722,13 +3935,7 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return GUESSING
     
     # Проверяем слово в основном и дополнительном списках
-    with BASE_FILE.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-        main_words = set(data.get("main", []))
-        additional_words = set(data.get("additional", []))
-        all_words = main_words | additional_words
-    
-    if normalized_guess not in all_words:
+    if normalized_guess not in ALL_WORDS:
         # Предлагаем добавить слово в белый список
         keyboard = [
             [
@@ -749,30 +3956,57 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Пожалуйста, введите слово без пробелов.")
         return GUESSING
 
+    # Хард-режим: догадка должна учитывать все открытые подсказки
+    if "hard" in cg:
+        problem = hard_rules_violation(cg["hard"], guess)
+        if problem:
+            await update.message.reply_text(f"🔒 Хард-режим: {problem} Попытка не засчитана.")
+            return GUESSING
+
+    # Абсурд: оставляем самый большой класс кандидатов — слово «выбирается» только сейчас
+    if "absurd" in cg:
+        candidates = absurd_candidates(cg)
+        if len(candidates) > ABSURD_INLINE_MAX:
+            attempts = cg["attempts"]
+            candidates = await asyncio.to_thread(absurd_partition, candidates, guess)
+            # пока считали, стор могли переписать джобы — перечитываем
+            store = load_store()
+            user = store["users"].get(user_id, {})
+            cg = user.get("current_game")
+            if not cg or cg["attempts"] != attempts:
+                return GUESSING
+        else:
+            candidates = absurd_partition(candidates, guess)
+        absurd_store(cg, candidates)
+        secret = cg["secret"]
+
+    if "hard" in cg:
+        hard_rules_update(cg["hard"], guess, feedback_cached(secret, guess))
+
     # Сохраняем ход
     cg["guesses"].append(guess)
     cg["attempts"] += 1
+    cg["last_move"] = int(time.time())
     save_store(store)
+    series_add("guesses")
 
-    # Рендерим доску из 6 строк + мини-клавиатуру снизу.
-    # Клавиатура будет крупнее для слов ≥8 букв, чуть меньше для 7 и еще меньше для 4–5.
-    img_buf = render_full_board_with_keyboard(
-        guesses=cg["guesses"],
-        secret=secret,
-        total_rows=6,
-        max_width_px=1080
-    )
-    await update.message.reply_photo(
-        photo=InputFile(img_buf, filename="wordle_board.png"),
-        caption=f"Попытка {cg['attempts']} из 6"
+    await reply_board_for(
+        context, store, user_id, update.message,
+        final=guess == secret or cg["attempts"] >= 6
     )
 
+    if cg.get("duel"):
+        duel_on_guess(context, store, user_id, guess)
+
     # —— Победа ——
     if guess == secret:
         stats = user["stats"]
         stats["games_played"] += 1
         stats["wins"] += 1
         stats["win_rate"] = stats["wins"] / stats["games_played"]
+        record_user_result(user, True, cg)
+        remember_share(user_id, cg, True)
+        user["last_secret"] = secret
 
         g = store["global"]
         g["total_games"] += 1
@@ -789,10 +4023,17 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "wins":     top_data["stats"]["wins"]
         }
 
+        if cg.get("daily"):
+            record_daily_result(
+                store, cg["daily"], length, user_id,
+                user.get("username") or user.get("first_name", ""), True, cg["attempts"]
+            )
+
         await update.message.reply_text(
             f"🎉 Поздравляю! Угадал за {cg['attempts']} "
             f"{'попытка' if cg['attempts']==1 else 'попытки' if 2<=cg['attempts']<=4 else 'попыток'}.\n"
-            "Чтобы сыграть вновь, введи /play."
+            + challenge_finish(cg, True) +
+            "Чтобы сыграть вновь, введи /play. Бросить вызов другу этим словом — /challenge."
         )
         del user["current_game"]
         context.user_data.pop("game_active", None)
@@ -806,14 +4047,24 @@ async def handle_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
         stats["games_played"] += 1
         stats["losses"] += 1
         stats["win_rate"] = stats["wins"] / stats["games_played"]
+        record_user_result(user, False, cg)
+        remember_share(user_id, cg, False)
+        user["last_secret"] = secret
 
         g = store["global"]
         g["total_games"] += 1
         g["total_losses"] += 1
         g["win_rate"] = g["total_wins"] / g["total_games"]
 
+        if cg.get("daily"):
+            record_daily_result(
+                store, cg["daily"], length, user_id,
+                user.get("username") or user.get("first_name", ""), False, cg["attempts"]
+            )
+
         await update.message.reply_text(
             f"💔 Попытки закончились. Было слово «{secret}».\n"
+            + challenge_finish(cg, False) +
             "Чтобы начать новую игру, введи /play."
         )
         del user["current_game"]
@@ -836,23 +4087,20 @@ async def suggest_white_callback(update: Update, context: ContextTypes.DEFAULT_T
     word = normalize(query.data.split(':', 1)[1])
     user_id = str(update.effective_user.id)
     
-    # Загружаем текущие предложения и основной словарь
-    current_suggestions = load_suggestions()
-    with BASE_FILE.open("r", encoding="utf-8") as f:
-        base_words = set(json.load(f))
-    
     # Загружаем данные пользователя
     store = load_store()
-    user = store["users"].get(user_id, {})
-    
-    # Добавляем слово в предложения для белого списка, если его там еще нет
-    if word not in current_suggestions["white"] and word not in base_words:
-        current_suggestions["white"].add(word)
-        save_suggestions(current_suggestions)
-        # Обновляем глобальную переменную
-        global suggestions
-        suggestions = current_suggestions
-    
+    user = store["users"].setdefault(user_id, {})
+
+    # Голосуем за слово в белом списке, если его нет в основном словаре
+    if in_main_dictionary(word):
+        await query.edit_message_text(f"Слово «{word}» уже есть в словаре.")
+        return GUESSING
+    if not suggest_word("white", word, user_id):
+        await query.edit_message_text(
+            "Прости, сейчас нельзя добавить новое слово — список предложений переполнен."
+        )
+        return GUESSING
+
     # Добавляем слово в список предложенных пользователем, если его там еще нет
     if "suggested_words" not in user:
         user["suggested_words"] = []
@@ -878,6 +4126,15 @@ async def ignore_ask(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 @check_ban_status
 async def ignore_guess(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # игру могли закрыть снаружи (соперник в дуэли победил) — тогда команда работает как обычно
+    store = load_store()
+    u = store["users"].get(str(update.effective_user.id), {})
+    if "current_game" not in u and not context.user_data.get("duel_waiting"):
+        command = update.message.text.split()[0].lstrip("/").split("@")[0]
+        entry = {
+            "play": ask_length, "daily": daily_start, "duel": duel_start, "absurd": absurd_start,
+        }.get(command, start)
+        return await entry(update, context)
     await update.message.reply_text("Команды /start и /play не работают во время игры — сначала /reset.")
     return GUESSING
 
@@ -893,6 +4150,9 @@ async def hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # Проверяем, есть ли активная игра
     if "current_game" not in user_entry:
         await update.message.reply_text("Эту команду можно использовать только во время игры.")
+        # в очереди дуэли остаемся в GUESSING, чтобы не потерять матч
+        if context.user_data.get("duel_waiting"):
+            return GUESSING
         return ConversationHandler.END
 
     cg = user_entry["current_game"]
@@ -914,8 +4174,8 @@ async def hint(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
     # Выбираем кандидатов: разная позиция, но >= num_letters общих символов
     candidates = []
-    for w in WORDLIST:
-        if len(w) != length or w == secret:
+    for w in WORDS_BY_LENGTH.get(length, []):
+        if w == secret:
             continue
         w_counter = Counter(w)
         # пересечение счетчиков по минимуму
@@ -953,7 +4213,19 @@ async def reset(update: Update, context: ContextTypes.DEFAULT_TYPE):
     store = load_store()
     uid = str(update.effective_user.id)
     user = store["users"].get(uid)
+    duel_leave_queue(uid)
     if user and "current_game" in user:
+        # выход из дуэли = сдался
+        match = DUEL_MATCHES.get(user["current_game"].get("duel"))
+        if match:
+            match["players"][uid]["done"] = True
+            for opp_uid in match["players"]:
+                if opp_uid != uid:
+                    context.application.create_task(duel_push(
+                        context.bot, opp_uid, f"⚔️ {match['players'][uid]['name']} сдался. Доиграй слово сам!"
+                    ))
+            if all(p["done"] for p in match["players"].values()):
+                duel_finish(match)
         del user["current_game"]
         save_store(store)
 
@@ -983,6 +4255,60 @@ async def notification_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE
     await update.message.reply_text(f"Уведомления при пробуждении бота {state}.")
 
 
+@check_ban_status
+async def hard_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/hard — включить/выключить хард-режим (со следующей игры)."""
+    uid = str(update.effective_user.id)
+    store = load_store()
+    user = store["users"].setdefault(uid, {"stats": {}})
+    user["hard_mode"] = not user.get("hard_mode", False)
+    save_store(store)
+    if user["hard_mode"]:
+        await update.message.reply_text(
+            "🔒 Хард-режим включен со следующей игры: зеленые буквы остаются на своих местах, "
+            "желтые обязательно используются, серые — нельзя."
+        )
+    else:
+        await update.message.reply_text("Хард-режим выключен со следующей игры.")
+
+
+@check_ban_status
+async def display_toggle(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/display [картинка|текст|одно] — выбор вида доски; без аргумента — следующий по кругу."""
+    uid = str(update.effective_user.id)
+    store = load_store()
+    user = store["users"].setdefault(uid, {"stats": {}})
+    arg = (context.args[0].lower() if context.args else "")
+    current = user.get("display", "image")
+    mode = DISPLAY_ALIASES.get(arg) or DISPLAY_MODES[(DISPLAY_MODES.index(current) + 1) % len(DISPLAY_MODES)]
+    user["display"] = mode
+    save_store(store)
+    if mode == "text":
+        await update.message.reply_text(
+            "Доска будет приходить текстом — так быстрее. "
+            "Картинку пришлю в конце игры или по кнопке «Картинка»."
+        )
+    elif mode == "edit":
+        await update.message.reply_text(
+            "Доска будет одним сообщением на игру — я буду обновлять картинку после каждой догадки."
+        )
+    else:
+        await update.message.reply_text("Доска будет приходить картинкой.")
+
+
+@check_ban_status
+async def board_image_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Кнопка «Картинка» в текстовом режиме — присылает текущую доску изображением."""
+    query = update.callback_query
+    store = load_store()
+    cg = store["users"].get(str(update.effective_user.id), {}).get("current_game")
+    if not cg or not cg["guesses"]:
+        await query.answer("Игра уже закончилась.")
+        return
+    await query.answer()
+    await reply_board(query.message, cg["secret"], cg["guesses"], f"Попытка {cg['attempts']} из 6")
+
+
 @check_ban_status
 async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Показывает личную статистику — только вне игры."""
@@ -994,14 +4320,24 @@ async def my_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("Эту команду можно использовать только вне игры.")
         return
     s = user.get("stats", {})
-    await update.message.reply_text(
+    text = (
         "```"
         f"🧑 Ваши результаты:\n\n"
         f"🎲 Всего игр: {s.get('games_played',0)}\n"
         f"🏆 Побед: {s.get('wins',0)}\n"
         f"💔 Поражений: {s.get('losses',0)}\n"
         f"📊 Процент: {s.get('win_rate',0.0)*100:.2f}%"
-        "```",
+        "```"
+    )
+    if not s.get("games_played"):
+        await update.message.reply_text(text, parse_mode="Markdown")
+        return
+
+    # график кэшируется, пока статистика не изменится
+    chart = render_stats_chart(json.dumps(s, sort_keys=True))
+    await update.message.reply_photo(
+        photo=InputFile(BytesIO(chart), filename="stats.png"),
+        caption=text,
         parse_mode="Markdown"
     )
 
@@ -1038,6 +4374,27 @@ async def global_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
 
 
+@check_ban_status
+async def daily_top(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Итоги слова дня и таблица лидеров по каждой длине."""
+    update_user_activity(update.effective_user)
+    day = today_msk()
+    store = load_store()
+    by_length = store["daily"].get(day, {})
+    if not by_length:
+        await update.message.reply_text("Сегодня слово дня еще никто не разгадал. Начни: /daily")
+        return
+
+    lines = [f"🗓 Слово дня, {day}"]
+    for length in sorted(by_length, key=int):
+        agg = by_length[length]
+        lines.append(f"\n🔤 {length} букв: сыграно {agg['played']}, побед {agg['wins']}")
+        for place, (attempts, at, _uid, name) in enumerate(agg["leaders"], start=1):
+            lines.append(f"{place}. {name} — {attempts} поп. ({at})")
+
+    await update.message.reply_text("\n".join(lines))
+
+
 @check_ban_status
 async def only_outside_game(update, context):
     clear_notification_flag(str(update.effective_user.id))
@@ -1103,67 +4460,45 @@ async def feedback_word(update: Update, context: ContextTypes.DEFAULT_TYPE):
     word = normalize(update.message.text)
     target = context.user_data["fb_target"]
 
-    if SUGGESTIONS_FILE.exists() and SUGGESTIONS_FILE.stat().st_size >= 1_000_000:
-        await update.message.reply_text(
-            "Прости, сейчас нельзя добавить новое слово — файл предложений уже слишком большой."
-        )
-        context.user_data.pop("in_feedback", None)
-        context.user_data["just_done"] = True
-        return ConversationHandler.END
-
     if " " in word:
         await update.message.reply_text("Пожалуйста, введите слово без пробелов.")
         return FEEDBACK_WORD
 
-    suggestions = load_suggestions()
+    user_id = str(update.effective_user.id)
+    accepted = None
 
     # Черный список: добавляем, только если слово есть в словаре
     if target == "black":
-        if word in WORDLIST:
-            suggestions["black"].add(word)
-            save_suggestions(suggestions)
-            
-            # Добавляем слово в профиль пользователя
-            store = load_store()
-            user_id = str(update.effective_user.id)
-            if user_id not in store["users"]:
-                store["users"][user_id] = {}
-            if "suggested_words" not in store["users"][user_id]:
-                store["users"][user_id]["suggested_words"] = []
-            if word not in store["users"][user_id]["suggested_words"]:
-                store["users"][user_id]["suggested_words"].append(word)
-                save_store(store)
-                
+        if in_main_dictionary(word):
+            accepted = suggest_word("black", word, user_id)
             resp = "Спасибо, добавил в предложения для чёрного списка."
         else:
             resp = "Нельзя: слово должно быть в основном словаре."
 
     # Белый список: добавляем, только если слова нет в словаре и длина 4–11
     else:
-        if 4 <= len(word) <= 11 and word not in WORDLIST:
-            suggestions["white"].add(word)
-            save_suggestions(suggestions)
-            
-            # Добавляем слово в профиль пользователя
-            store = load_store()
-            user_id = str(update.effective_user.id)
-            if user_id not in store["users"]:
-                store["users"][user_id] = {}
-            if "suggested_words" not in store["users"][user_id]:
-                store["users"][user_id]["suggested_words"] = []
-            if word not in store["users"][user_id]["suggested_words"]:
-                store["users"][user_id]["suggested_words"].append(word)
-                save_store(store)
-                
+        if 4 <= len(word) <= 11 and not in_main_dictionary(word):
+            accepted = suggest_word("white", word, user_id)
             resp = "Спасибо, добавил в предложения для белого списка."
         else:
-            if word in WORDLIST:
+            if in_main_dictionary(word):
                 resp = "Нельзя: такое слово уже есть в основном словаре."
             elif not (4 <= len(word) <= 11):
                 resp = "Нельзя: длина слова должна быть от 4 до 11 символов."
             else:
                 resp = "Нельзя: слово должно быть вне основного словаря и из 4–11 букв."
 
+    if accepted is False:
+        resp = "Прости, сейчас нельзя добавить новое слово — список предложений переполнен."
+    elif accepted:
+        # Добавляем слово в профиль пользователя
+        store = load_store()
+        user = store["users"].setdefault(user_id, {})
+        user.setdefault("suggested_words", [])
+        if word not in user["suggested_words"]:
+            user["suggested_words"].append(word)
+            save_store(store)
+
     await update.message.reply_text(resp)
     context.user_data.pop("in_feedback", None)
     context.user_data["just_done"] = True
@@ -1210,11 +4545,9 @@ async def dict_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if update.effective_user.id != ADMIN_ID:
         return
 
-    # Читаем свежий словарь из base_words.json
-    with BASE_FILE.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-        main_words = data.get("main", [])
-        additional_words = data.get("additional", [])
+    # Текущая версия словаря в памяти
+    main_words = WORDLIST
+    additional_words = ADDITIONAL_WORDS
 
     total_main = len(main_words)
     total_additional = len(additional_words)
@@ -1251,44 +4584,385 @@ async def dict_file(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 async def dump_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/dump_activity — сжатая NDJSON-выгрузка, /dump_activity summary — только сводка."""
     if update.effective_user.id != ADMIN_ID:
         return
 
-    path = USER_FILE  # это Path("user_activity.json")
-    if not path.exists():
+    if not USER_FILE.exists():
         return await update.message.reply_text("Файл user_activity.json не найден.")
 
-    # прочитаем текст, и если короткий — отправим как сообщение
-    content = path.read_text("utf-8")
-    if len(content) < 3000:
-        # отправляем в кодовом блоке
-        return await update.message.reply_text(
-            f"<pre>{content}</pre>", parse_mode="HTML"
+    store = load_store()
+    if context.args and context.args[0].lower() == "summary":
+        summary = activity_summary(store)
+        save_store(store)
+        await update.message.reply_text(summary)
+        return
+
+    await send_activity_export(bulk_bot(context), update.effective_chat.id, store)
+
+
+async def activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/activity [minute|hour|day] — спарклайны нагрузки за последний час / двое суток / 90 дней."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+
+    name = context.args[0].lower() if context.args else "hour"
+    if name not in SERIES_RESOLUTIONS:
+        await update.message.reply_text("Формат: /activity minute|hour|day")
+        return
+
+    titles = {
+        "games": "Игры", "guesses": "Догадки", "wins": "Победы", "losses": "Поражения",
+        "new_users": "Новые", "active": "Пик онлайн",
+    }
+    lines = [f"📈 Активность ({name}, {SERIES_RESOLUTIONS[name][1]} точек)"]
+    for metric, title in titles.items():
+        values = series_values(name, metric)
+        lines.append(f"{title}: Σ{sum(values):g} max {max(values):g}\n{sparkline(values)}")
+
+    renders = series_values(name, "renders")
+    render_ms = series_values(name, "render_ms")
+    avg = [ms / n if n else 0 for ms, n in zip(render_ms, renders)]
+    total = sum(renders)
+    lines.append(
+        f"Рендер, мс: среднее {sum(render_ms) / total if total else 0:.1f} max {max(avg):.1f}\n{sparkline(avg)}"
+    )
+    hits, misses = sum(series_values(name, "photo_hits")), sum(series_values(name, "photo_misses"))
+    lines.append(
+        f"Кэш file_id: попаданий {hits:g} из {hits + misses:g} "
+        f"({hits / (hits + misses) * 100 if hits + misses else 0:.0f}%), записей {len(FILE_IDS)}"
+    )
+    for cls, st in OUTBOUND.stats.items():
+        avg_wait = st["wait_total"] / st["count"] * 1000 if st["count"] else 0
+        lines.append(
+            f"Очередь {cls}: {st['count']} запр., ожидание ср. {avg_wait:.0f} мс, "
+            f"max {st['wait_max'] * 1000:.0f} мс, повторов {st['retries']}"
+        )
+    await update.message.reply_text("<pre>" + "\n".join(lines) + "</pre>", parse_mode="HTML")
+
+
+# --- Профилирование на живом боте (/profile, /memsnap) ---
+# Пока профилировщик выключен, ничего не работает: ни потока, ни хуков.
+
+PROFILE_DEFAULT_SECONDS = 30
+PROFILE_MAX_SECONDS = 600
+# Период опроса стека главного потока семплирующим профилировщиком
+PROFILE_SAMPLE_INTERVAL = 0.005
+MEMSNAP_TOP = 30
+
+PROFILE = {"mode": None}
+_memsnap_prev = None
+
+
+def _sample_stacks(thread_id: int, stacks: Counter, stop: threading.Event) -> None:
+    """Поток-семплер: раз в PROFILE_SAMPLE_INTERVAL снимает стек потока event loop."""
+    while not stop.wait(PROFILE_SAMPLE_INTERVAL):
+        frame = sys._current_frames().get(thread_id)
+        names = []
+        while frame is not None:
+            code = frame.f_code
+            names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+            frame = frame.f_back
+        if names:
+            stacks[";".join(reversed(names))] += 1
+
+
+def flamegraph_svg(stacks: Counter, width: int = 1200, row_h: int = 16) -> str:
+    """Простой flamegraph в SVG из свернутых стеков (корень снизу)."""
+    tree = {"n": 0, "kids": {}}
+    for stack, n in stacks.items():
+        node = tree
+        node["n"] += n
+        for name in stack.split(";"):
+            node = node["kids"].setdefault(name, {"n": 0, "kids": {}})
+            node["n"] += n
+
+    def depth(node):
+        return 1 + max((depth(k) for k in node["kids"].values()), default=0)
+
+    total = tree["n"] or 1
+    height = depth(tree) * row_h
+    rects = []
+
+    def walk(node, x, level):
+        for name, kid in sorted(node["kids"].items()):
+            w = kid["n"] / total * width
+            if w >= 0.5:
+                y = height - (level + 1) * row_h
+                hue = 20 + hash(name) % 40
+                label = name if w > 40 else ""
+                title = f"{name} — {kid['n']} ({kid['n'] / total * 100:.1f}%)"
+                for a, b in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+                    label, title = label.replace(a, b), title.replace(a, b)
+                rects.append(
+                    f'<g><title>{title}</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" height="{row_h - 1}" '
+                    f'fill="hsl({hue},90%,60%)"/><text x="{x + 2:.1f}" y="{y + row_h - 4}" font-size="11" '
+                    f'font-family="monospace">{label[:int(w // 7)]}</text></g>'
+                )
+                walk(kid, x, level + 1)
+            x += w
+
+    walk(tree, 0.0, 0)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}">'
+        + "".join(rects) + "</svg>"
+    )
+
+
+def profile_start(mode: str) -> None:
+    if mode == "cprofile":
+        prof = cProfile.Profile()
+        prof.enable()
+        PROFILE.update(mode=mode, profiler=prof, started=time.perf_counter())
+        return
+    stacks, stop = Counter(), threading.Event()
+    thread = threading.Thread(
+        target=_sample_stacks, args=(threading.get_ident(), stacks, stop),
+        name="profile-sampler", daemon=True
+    )
+    thread.start()
+    PROFILE.update(mode=mode, stacks=stacks, stop=stop, thread=thread, started=time.perf_counter())
+
+
+def profile_stop() -> list[tuple[str, bytes]]:
+    """Останавливает профилировщик и возвращает файлы отчета [(имя, данные)]."""
+    mode = PROFILE["mode"]
+    elapsed = time.perf_counter() - PROFILE["started"]
+    stamp = datetime.now(MSK).strftime("%Y%m%d-%H%M%S")
+    files = []
+    if mode == "cprofile":
+        prof = PROFILE["profiler"]
+        prof.disable()
+        out = StringIO()
+        stats = pstats.Stats(prof, stream=out)
+        out.write(f"cProfile, {elapsed:.1f} с\n\n")
+        stats.sort_stats("cumulative").print_stats(60)
+        stats.sort_stats("tottime").print_stats(40)
+        files.append((f"profile-{stamp}.txt", out.getvalue().encode("utf-8")))
+    else:
+        PROFILE["stop"].set()
+        PROFILE["thread"].join()
+        stacks = PROFILE["stacks"]
+        folded = "\n".join(f"{s} {n}" for s, n in stacks.most_common())
+        files.append((f"profile-{stamp}.folded", folded.encode("utf-8")))
+        files.append((f"profile-{stamp}.svg", flamegraph_svg(stacks).encode("utf-8")))
+    PROFILE.clear()
+    PROFILE["mode"] = None
+    return files
+
+
+async def send_profile(bot) -> None:
+    for name, data in profile_stop():
+        await bot.send_document(chat_id=ADMIN_ID, document=InputFile(BytesIO(data), filename=name))
+
+
+async def profile_timeout(context: ContextTypes.DEFAULT_TYPE):
+    if PROFILE["mode"]:
+        await send_profile(context.bot)
+
+
+async def profile_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/profile start [секунд] [sample|cprofile] | stop — профилирование event loop."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    args = [a.lower() for a in context.args or []]
+    action = args[0] if args else ""
+
+    if action == "stop":
+        if not PROFILE["mode"]:
+            await update.message.reply_text("Профилировщик не запущен.")
+            return
+        for job in context.job_queue.get_jobs_by_name("profile_timeout"):
+            job.schedule_removal()
+        await send_profile(context.bot)
+        return
+
+    if action != "start":
+        await update.message.reply_text(
+            "Формат: /profile start [секунд] [sample|cprofile] или /profile stop\n"
+            "sample — семплы стека раз в 5 мс (flamegraph), cprofile — точные счетчики вызовов."
         )
+        return
+    if PROFILE["mode"]:
+        await update.message.reply_text(f"Уже идет профилирование ({PROFILE['mode']}).")
+        return
+
+    seconds = PROFILE_DEFAULT_SECONDS
+    mode = "sample"
+    for a in args[1:]:
+        if a.isdigit():
+            seconds = min(max(int(a), 1), PROFILE_MAX_SECONDS)
+        elif a in ("sample", "cprofile"):
+            mode = a
+    profile_start(mode)
+    context.job_queue.run_once(profile_timeout, seconds, name="profile_timeout")
+    await update.message.reply_text(f"⏱ Профилирование ({mode}) на {seconds} с запущено.")
+
+
+async def memsnap(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    /memsnap — топ аллокаций tracemalloc (первый вызов включает трассировку),
+    /memsnap stop — выключить трассировку и снять ее накладные расходы.
+    """
+    global _memsnap_prev
+    if update.effective_user.id != ADMIN_ID:
+        return
 
-    # иначе — отправляем как документ
-    with path.open("rb") as f:
-        await update.message.reply_document(
-            document=InputFile(f, filename=path.name),
-            caption="📁 user_activity.json"
+    if context.args and context.args[0].lower() == "stop":
+        tracemalloc.stop()
+        _memsnap_prev = None
+        await update.message.reply_text("Трассировка памяти выключена.")
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+        await update.message.reply_text(
+            "Трассировка памяти включена. Повтори /memsnap через пару минут — пришлю топ аллокаций."
         )
+        return
+
+    snap = tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    ))
+    current, peak = tracemalloc.get_traced_memory()
+    out = StringIO()
+    out.write(f"tracemalloc: сейчас {current / 2**20:.1f} МБ, пик {peak / 2**20:.1f} МБ\n\n")
+    out.write(f"Топ {MEMSNAP_TOP} по строкам:\n")
+    for stat in snap.statistics("lineno")[:MEMSNAP_TOP]:
+        out.write(f"{stat}\n")
+    if _memsnap_prev is not None:
+        out.write("\nРост с прошлого снимка:\n")
+        for stat in snap.compare_to(_memsnap_prev, "lineno")[:MEMSNAP_TOP]:
+            out.write(f"{stat}\n")
+    out.write(f"\nТоп {MEMSNAP_TOP // 3} стеков:\n")
+    for stat in snap.statistics("traceback")[:MEMSNAP_TOP // 3]:
+        out.write(f"\n{stat.count} блоков, {stat.size / 1024:.1f} КиБ\n")
+        out.write("\n".join(stat.traceback.format()) + "\n")
+    _memsnap_prev = snap
+
+    stamp = datetime.now(MSK).strftime("%Y%m%d-%H%M%S")
+    await update.message.reply_document(
+        document=InputFile(BytesIO(out.getvalue().encode("utf-8")), filename=f"memsnap-{stamp}.txt"),
+        caption=f"🧠 {current / 2**20:.1f} МБ под трассировкой"
+    )
+
+
+# Сколько слов показываем на одной странице модерации
+REVIEW_PAGE_SIZE = 8
+REVIEW_LABELS = {"black": "⚫", "white": "⚪", "add": "➕"}
+
+
+def review_queue() -> list[tuple[str, str, dict]]:
+    """Все предложения: сначала самые популярные, затем самые старые."""
+    items = [(key, w, e) for key in SUGGESTION_LISTS for w, e in suggestions[key].items()]
+    items.sort(key=lambda it: (-it[2]["votes"], it[2].get("first_seen") or ""))
+    return items
+
+
+def review_page(page: int) -> tuple[str, InlineKeyboardMarkup]:
+    """Текст и кнопки одной страницы модерации."""
+    items = review_queue()
+    pages = max(1, -(-len(items) // REVIEW_PAGE_SIZE))
+    page = min(max(page, 0), pages - 1)
+    chunk = items[page * REVIEW_PAGE_SIZE:(page + 1) * REVIEW_PAGE_SIZE]
+
+    lines = [f"Модерация предложений — стр. {page + 1}/{pages}, всего {len(items)}",
+             "⚫ убрать из словаря, ⚪ добавить в main, ➕ добавить в additional"]
+    keyboard = []
+    for key, w, e in chunk:
+        lines.append(f"{REVIEW_LABELS[key]} {w} — голосов: {e['votes']}")
+        keyboard.append([
+            InlineKeyboardButton(f"✅ {REVIEW_LABELS[key]} {w}", callback_data=f"mod:ok:{page}:{key}:{w}"),
+            InlineKeyboardButton("❌", callback_data=f"mod:no:{page}:{key}:{w}"),
+        ])
+    if not chunk:
+        lines.append("— пусто")
+
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("◀️", callback_data=f"mod:page:{page - 1}"))
+    if chunk:
+        nav.append(InlineKeyboardButton("✅ Все на странице", callback_data=f"mod:all:{page}"))
+    if page < pages - 1:
+        nav.append(InlineKeyboardButton("▶️", callback_data=f"mod:page:{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+def approve_suggestions(items: list[tuple[str, str]]) -> tuple[tuple[int, int, int], int]:
+    """
+    Применяет одобренные предложения точечным патчем словаря и
+    убирает их из предложений и профилей авторов.
+    """
+    patched = patch_dictionary(
+        remove_main=[w for key, w in items if key == "black"],
+        add_main=[w for key, w in items if key == "white"],
+        add_additional=[w for key, w in items if key == "add"],
+    )
+    store = load_store()
+    cleared = drop_suggestions(store, items)
+    save_suggestions(suggestions)
+    if cleared:
+        save_store(store)
+    return patched, cleared
+
+
+async def suggestions_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/suggestions_review — постраничная модерация с кнопками."""
+    if update.effective_user.id != ADMIN_ID:
+        return
+    text, markup = review_page(0)
+    await update.message.reply_text(text, reply_markup=markup)
+
+
+async def suggestions_review_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.callback_query
+    if update.effective_user.id != ADMIN_ID:
+        await query.answer()
+        return
+
+    parts = query.data.split(":", 4)
+    action, page = parts[1], int(parts[2])
+    note = ""
+    if action in ("ok", "no"):
+        key, word = parts[3], parts[4]
+        if word not in suggestions.get(key, {}):
+            note = "Уже обработано"
+        elif action == "ok":
+            approve_suggestions([(key, word)])
+            note = f"Одобрено: {word}"
+        else:
+            store = load_store()
+            if drop_suggestions(store, [(key, word)]):
+                save_store(store)
+            save_suggestions(suggestions)
+            note = f"Отклонено: {word}"
+    elif action == "all":
+        items = [(key, w) for key, w, _e in review_queue()[page * REVIEW_PAGE_SIZE:(page + 1) * REVIEW_PAGE_SIZE]]
+        (removed, added, added_extra), _cleared = approve_suggestions(items)
+        note = f"Одобрено {len(items)}: -{removed}, +{added}, +{added_extra}"
+
+    await query.answer(note)
+    text, markup = review_page(page)
+    try:
+        await query.edit_message_text(text, reply_markup=markup)
+    except BadRequest:
+        # страница не изменилась
+        pass
 
 
 async def suggestions_view(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # только админ
     if update.effective_user.id != ADMIN_ID:
         return
-    sugg = load_suggestions()
-    black = sugg.get("black", [])
-    white = sugg.get("white", [])
-    add = sugg.get("add", [])
+    fmt = lambda key: ", ".join(
+        f'"{w}" ({e["votes"]})' for w, e in sorted(suggestions[key].items())
+    ) or "— пусто"
     text = (
-        "Предложения для черного списка:\n"
-        + (", ".join(f'"{w}"' for w in black) if black else "— пусто")
-        + "\n\nПредложения для белого списка:\n"
-        + (", ".join(f'"{w}"' for w in white) if white else "— пусто")
-        + "\n\nПредложения для дополнительного списка:\n"
-        + (", ".join(f'"{w}"' for w in add) if add else "— пусто")
+        "Предложения для черного списка:\n" + fmt("black")
+        + "\n\nПредложения для белого списка:\n" + fmt("white")
+        + "\n\nПредложения для дополнительного списка:\n" + fmt("add")
     )
     await update.message.reply_text(text)
 
@@ -1322,24 +4996,19 @@ async def suggestions_move_process(update: Update, context: ContextTypes.DEFAULT
     
     context.user_data["in_remove"] = True
     text = update.message.text.strip()
-    sugg = load_suggestions()
     moved = {"black": [], "white": []}
 
-    # извлекаем слова через запятую
+    # извлекаем слова через запятую; авторы и голоса переезжают вместе со словом
     words = [w.strip().lower() for w in text.split(",") if w.strip()]
     for w in words:
-        # Проверяем наличие слова в черном списке
-        if w in sugg["black"]:
-            sugg["black"].remove(w)
-            sugg["add"].add(w)
-            moved["black"].append(w)
-        # Проверяем наличие слова в белом списке
-        elif w in sugg["white"]:
-            sugg["white"].remove(w)
-            sugg["add"].add(w)
-            moved["white"].append(w)
-
-    save_suggestions(sugg)
+        for key in ("black", "white"):
+            entry = suggestions[key].pop(w, None)
+            if entry is not None:
+                suggestions["add"].setdefault(w, entry)
+                moved[key].append(w)
+                break
+
+    save_suggestions(suggestions)
     
     # формируем ответ
     parts = []
@@ -1386,7 +5055,6 @@ async def suggestions_remove_process(update: Update, context: ContextTypes.DEFAU
     
     context.user_data["in_remove"] = True
     text = update.message.text.strip()
-    sugg = load_suggestions()
     removed = {"black": [], "white": [], "add": []}
 
     # парсим построчно
@@ -1395,33 +5063,16 @@ async def suggestions_remove_process(update: Update, context: ContextTypes.DEFAU
             continue
         key, vals = line.split(":", 1)
         key = key.strip().lower()
-        if key not in ("black", "white", "add"):
+        if key not in SUGGESTION_LISTS:
             continue
         # извлекаем слова через запятую
         words = [w.strip().lower() for w in vals.split(",") if w.strip()]
-        for w in words:
-            if w in sugg[key]:
-                sugg[key].remove(w)
-                removed[key].append(w)
+        removed[key].extend(w for w in words if w in suggestions[key])
 
-    save_suggestions(sugg)
-    
-    # Удаляем слова из профилей пользователей
+    # Удаляем слова из предложений и из профилей их авторов
     store = load_store()
-    removed_count = 0
-    
-    # Собираем все удаленные слова из всех списков
-    all_removed_words = set(removed["black"]) | set(removed["white"]) | set(removed["add"])
-    
-    # Проходим по всем пользователям и удаляем слова из их списков
-    for user_id, user_data in store["users"].items():
-        if "suggested_words" in user_data:
-            before = len(user_data["suggested_words"])
-            user_data["suggested_words"] = [w for w in user_data["suggested_words"] 
-                                         if w not in all_removed_words]
-            removed_count += before - len(user_data["suggested_words"])
-    
-    # Сохраняем изменения, если что-то было удалено
+    removed_count = drop_suggestions(store, [(key, w) for key in removed for w in removed[key]])
+    save_suggestions(suggestions)
     if removed_count > 0:
         save_store(store)
     
@@ -1445,67 +5096,15 @@ async def suggestions_remove_process(update: Update, context: ContextTypes.DEFAU
 
 
 async def suggestions_approve(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Одобряет все предложения разом (точечный патч словаря, без пересборки)."""
     if update.effective_user.id != ADMIN_ID:
         return
 
-    # 1. Загружаем предложения
-    sugg = load_suggestions()  # {'black': set(), 'white': set(), 'add': set()}
-
-    # 2. Читаем текущий base_words.json
-    with BASE_FILE.open("r", encoding="utf-8") as f:
-        data = json.load(f)
-        main_words = set(data.get("main", []))
-        additional_words = set(data.get("additional", []))
-
-    # 3. Убираем «чёрные» и добавляем «белые» и «add»
-    main_words -= sugg["black"]
-    main_words |= sugg["white"]
-    additional_words |= sugg["add"]
-
-    # 4. Фильтруем по критериям (только буквы, длина 4–11) и сортируем
-    filtered_main = [w for w in main_words if w.isalpha() and 4 <= len(w) <= 11]
-    filtered_main.sort()
-    filtered_additional = [w for w in additional_words if w.isalpha() and 4 <= len(w) <= 11]
-    filtered_additional.sort()
-
-    # 5. Сохраняем обратно в base_words.json
-    with BASE_FILE.open("w", encoding="utf-8") as f:
-        json.dump({"main": filtered_main, "additional": filtered_additional}, f, ensure_ascii=False, indent=2)
+    items = [(key, w) for key in SUGGESTION_LISTS for w in suggestions[key]]
+    (removed, added, added_extra), removed_count = approve_suggestions(items)
 
-    logger.info(f"-> Wrote {len(filtered_main)} main words and {len(filtered_additional)} additional words to {BASE_FILE.resolve()}")
-
-    # 6. Обновляем глобальный список в памяти
-    global WORDLIST
-    WORDLIST = filtered_main
-
-    # 7. Удаляем одобренные слова из списка предложенных у пользователей
-    store = load_store()
-    removed_count = 0
-    
-    # Собираем все одобренные слова (белый список и add список)
-    approved_words = sugg["white"] | sugg["add"]
-    blacklisted_words = sugg["black"]
-    
-    # Проходим по всем пользователям и удаляем одобренные слова из их списков
-    for user_id, user_data in store["users"].items():
-        if "suggested_words" in user_data:
-            before = len(user_data["suggested_words"])
-            user_data["suggested_words"] = [
-                w for w in user_data["suggested_words"] 
-                if w not in approved_words and w not in blacklisted_words
-            ]
-            removed_count += before - len(user_data["suggested_words"])
-    
-    # Сохраняем изменения, если что-то было удалено
-    if removed_count > 0:
-        save_store(store)
-
-    # 8. Очищаем suggestions.json
-    save_suggestions({"black": set(), "white": set(), "add": set()})
-
-    # 9. Ответ админу
     await update.message.reply_text(
-        f"Словарь пересобран: +{len(sugg['white'])}, +{len(sugg['add'])}, -{len(sugg['black'])}.\n"
+        f"Словарь обновлен: +{added}, +{added_extra}, -{removed}.\n"
         f"Удалено {removed_count} слов (одобренные и черный список) из профилей пользователей.\n"
         "Предложения очищены."
     )
@@ -1520,34 +5119,52 @@ async def broadcast_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     return BROADCAST
 
 
-async def broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    text = update.message.text
+async def broadcast_run(context: ContextTypes.DEFAULT_TYPE, chat_id: int, text: str):
+    """
+    Сама рассылка — фоновая задача: идет через пул рассылок с низким приоритетом,
+    параллельно не больше BULK_POOL_SIZE запросов, и не держит обработку апдейтов.
+    """
     store = load_store()      # берем тех, кого мы когда-то записали
+    bot = bulk_bot(context)
     failed = []
     skipped = 0
     total_sent = 0
-    
+    gate = asyncio.Semaphore(BULK_POOL_SIZE)
+
+    async def send_one(uid: str):
+        nonlocal total_sent
+        async with gate:
+            try:
+                await bot.send_message(chat_id=int(uid), text=text, rate_limit_args="bulk")
+                total_sent += 1
+            except Exception as e:
+                logger.error(f"Ошибка при отправке сообщения пользователю {uid}: {e}")
+                failed.append(uid)
+
+    targets = []
     for uid, user_data in store["users"].items():
         # Пропускаем забаненных пользователей
         if user_data.get("banned", False):
             skipped += 1
             continue
-            
-        try:
-            await context.bot.send_message(chat_id=int(uid), text=text)
-            total_sent += 1
-        except Exception as e:
-            logger.error(f"Ошибка при отправке сообщения пользователю {uid}: {e}")
-            failed.append(uid)
-    
+        targets.append(uid)
+    await asyncio.gather(*(send_one(uid) for uid in targets))
+
     msg = f"✅ Рассылка успешно отправлена!\n"
     msg += f"• Отправлено: {total_sent} пользователям\n"
     msg += f"• Пропущено (забанено): {skipped}"
     
     if failed:
         msg += f"\n\n❌ Не удалось доставить сообщения пользователям: {', '.join(failed)}"
-    
-    await update.message.reply_text(msg)
+
+    await context.bot.send_message(chat_id=chat_id, text=msg)
+
+
+async def broadcast_send(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    context.application.create_task(
+        broadcast_run(context, update.effective_chat.id, update.message.text)
+    )
+    await update.message.reply_text("📤 Рассылка запущена, пришлю отчет по завершении.")
     context.user_data.pop("in_broadcast", None)
     context.user_data["just_done"] = True
     return ConversationHandler.END
@@ -1589,6 +5206,7 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             "banned": True,
             "notification": False  # Отключаем уведомления при бане
         }
+        BANNED_USERS.add(user_id)
         await update.message.reply_text(f"✅ Пользователь с ID {user_id} успешно заблокирован.")
     else:
         # Пользователь уже есть в базе, обновляем статус бана
@@ -1597,6 +5215,7 @@ async def ban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
         else:
             users[user_id]["banned"] = True
             users[user_id]["notification"] = False  # Отключаем уведомления при бане
+            BANNED_USERS.add(user_id)
             # Сбрасываем состояние guessing
             if "current_game" in users[user_id]:
                 del users[user_id]["current_game"]
@@ -1642,6 +5261,7 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
             await update.message.reply_text(f"ℹ️ Пользователь с ID {user_id} не заблокирован.")
         else:
             users[user_id]["banned"] = False
+            BANNED_USERS.discard(user_id)
             # Удаляем флаг уведомлений, чтобы использовать настройки по умолчанию
             if "notification" in users[user_id]:
                 del users[user_id]["notification"]
@@ -1666,7 +5286,50 @@ async def unban_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 
 def main():
-    
+
+    # офлайн-режим: только посчитать оценки сложности и выйти
+    if "--score-words" in sys.argv:
+        save_word_scores(compute_word_scores(WORDLIST))
+        logger.info(f"-> Scored words into {SCORES_FILE.resolve()}")
+        return
+
+    # кодеки стора: время и размер на 1k/10k/100k пользователей
+    # устойчивость к падениям и цена fsync на сохранение
+    if "--bench-writes" in sys.argv:
+        print(bench_writes())
+        return
+
+    if "--bench-store" in sys.argv:
+        print(f"STORE_CODEC={STORE_CODEC}")
+        print(bench_store_codecs())
+        return
+
+    # пропускная способность inline-режима
+    if "--bench-inline" in sys.argv:
+        print(bench_inline())
+        return
+
+    # подбор дуэлей под нагрузкой
+    if "--bench-duel" in sys.argv:
+        print(bench_duel())
+        return
+
+    # цена хода в режиме абсурда
+    if "--bench-absurd" in sys.argv:
+        print(bench_absurd())
+        return
+
+    # сверка и замер проверки хард-режима
+    if "--bench-hard" in sys.argv:
+        print(bench_hard_mode())
+        return
+
+    # замер кодирования картинок доски
+    if "--bench-images" in sys.argv:
+        print(f"BOARD_COMPRESS_LEVEL={BOARD_COMPRESS_LEVEL}, BOARD_CELL_PX={BOARD_CELL_PX}")
+        print(bench_board_encoding())
+        return
+
     token = os.getenv("BOT_TOKEN")
     if not token:
         logger.error("BOT_TOKEN не установлен")
@@ -1675,14 +5338,53 @@ def main():
     app = (
         ApplicationBuilder()
         .token(token)
-        .post_init(set_commands)
+        # интерактивные ответы: большой пул, короткое ожидание соединения
+        .request(HTTPXRequest(connection_pool_size=INTERACTIVE_POOL_SIZE, pool_timeout=5.0))
+        .get_updates_request(HTTPXRequest(connection_pool_size=1))
+        .rate_limiter(OUTBOUND)
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
         .build()
     )
 	
     # отправляем один раз при загрузке
     app.job_queue.run_once(send_activity_periodic, when=0)
     app.job_queue.run_once(send_unfinished_games, when=1)
-
+    # брошенные игры закрываем до напоминаний, чтобы не будить тех, кто давно ушел
+    app.job_queue.run_repeating(gc_sessions, interval=SESSION_GC_INTERVAL, first=0)
+    # правки base_words.json на сервере подхватываем без перезапуска
+    app.job_queue.run_repeating(watch_dictionary, interval=DICT_WATCH_INTERVAL, first=DICT_WATCH_INTERVAL)
+
+    # кэш file_id картинок
+    app.job_queue.run_repeating(save_file_ids, interval=60, first=60)
+    app.job_queue.run_repeating(flush_suggestions, interval=60, first=60)
+    app.job_queue.run_repeating(save_challenge_stats, interval=60, first=60)
+
+    # отложенные last_seen
+    app.job_queue.run_repeating(flush_last_seen, interval=LAST_SEEN_FLUSH_INTERVAL, first=LAST_SEEN_FLUSH_INTERVAL)
+
+    # временные ряды активности сбрасываем на диск раз в минуту
+    app.job_queue.run_repeating(save_series, interval=60, first=60)
+
+    # слово дня: готовим кэш при старте и каждую полночь по Москве
+    app.job_queue.run_once(prepare_daily, when=2)
+    app.job_queue.run_daily(prepare_daily, time=dtime(0, 0, tzinfo=MSK))
+    # оценки сложности считаем в фоне, если словарь поменялся
+    request_rescore(WORDLIST, delay=0)
+
+    # до всех остальных хендлеров: сначала флуд-контроль, затем отметка активности
+    app.add_handler(TypeHandler(Update, flood_guard), group=-2)
+    app.add_handler(TypeHandler(Update, touch_user), group=-1)
+
+    # группы: свои хендлеры раньше ConversationHandler'ов (те ведут состояние на пользователя)
+    groups = filters.ChatType.GROUPS
+    app.add_handler(CommandHandler("play", group_play, filters=groups))
+    app.add_handler(CommandHandler("guess", group_guess, filters=groups))
+    app.add_handler(CommandHandler("reset", group_reset, filters=groups))
+    app.add_handler(CommandHandler(
+        ["start", "help", "daily", "duel", "absurd", "hint", "feedback"], group_help, filters=groups
+    ))
+    app.add_handler(MessageHandler(groups & filters.TEXT & ~filters.COMMAND, group_guess))
 
     feedback_conv = ConversationHandler(
     entry_points=[CommandHandler("feedback", feedback_start)],
@@ -1705,6 +5407,9 @@ def main():
     conv = ConversationHandler(
         entry_points=[
             CommandHandler("play", ask_length),
+            CommandHandler("daily", daily_start),
+            CommandHandler("duel", duel_start),
+            CommandHandler("absurd", absurd_start),
             CommandHandler("start", start),
         ],
         states={
@@ -1713,6 +5418,9 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, receive_length),
                 CommandHandler("start", ignore_ask),
                 CommandHandler("play", ignore_ask),
+                CommandHandler("daily", ignore_ask),
+                CommandHandler("duel", ignore_ask),
+                CommandHandler("absurd", ignore_ask),
                 CommandHandler("hint", hint_not_allowed),
                 CommandHandler("reset", reset),
                 CommandHandler("my_stats", only_outside_game),
@@ -1723,6 +5431,9 @@ def main():
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_guess),
                 CommandHandler("start", ignore_guess),
 		        CommandHandler("play", ignore_guess),
+                CommandHandler("daily", ignore_guess),
+                CommandHandler("duel", ignore_guess),
+                CommandHandler("absurd", ignore_guess),
                 CommandHandler("hint", hint),
                 CommandHandler("reset", reset),
                 CommandHandler("my_stats", only_outside_game),
@@ -1738,6 +5449,8 @@ def main():
     # 1) просмотр и подтверждение предложений
     app.add_handler(CommandHandler("suggestions_view", suggestions_view))
     app.add_handler(CommandHandler("suggestions_approve", suggestions_approve))
+    app.add_handler(CommandHandler("suggestions_review", suggestions_review))
+    app.add_handler(CallbackQueryHandler(suggestions_review_callback, pattern=r'^mod:'))
 
     # 2) удаление через ConversationHandler
     remove_conv = ConversationHandler(
@@ -1777,8 +5490,9 @@ def main():
     )
     app.add_handler(broadcast_conv)
 
+    # Только личка: в группах любой текст — это догадка в общей игре
     app.add_handler(
-    MessageHandler(filters.TEXT & ~filters.COMMAND, unknown_text),
+    MessageHandler(filters.TEXT & ~filters.COMMAND & filters.ChatType.PRIVATE, unknown_text),
     group=99
     )
 
@@ -1787,15 +5501,25 @@ def main():
     app.add_handler(CommandHandler("hint", hint_not_allowed))
     app.add_handler(CommandHandler("reset", reset_global))
     app.add_handler(CommandHandler("notification", notification_toggle))
+    app.add_handler(CommandHandler("display", display_toggle))
+    app.add_handler(CommandHandler("hard", hard_toggle))
+    app.add_handler(CommandHandler("challenge", challenge))
     app.add_handler(CommandHandler("my_stats", my_stats))
     app.add_handler(CommandHandler("global_stats", global_stats))
+    app.add_handler(CommandHandler("daily_top", daily_top))
     app.add_handler(CommandHandler("dict_file", dict_file))
+    app.add_handler(CommandHandler("dict_reload", dict_reload))
     app.add_handler(CommandHandler("dump_activity", dump_activity))
+    app.add_handler(CommandHandler("activity", activity))
+    app.add_handler(CommandHandler("profile", profile_cmd))
+    app.add_handler(CommandHandler("memsnap", memsnap))
     app.add_handler(CommandHandler("ban", ban_user))
     app.add_handler(CommandHandler("unban", unban_user))
     
     # Обработчик для кнопки предложения слова в белый список
     app.add_handler(CallbackQueryHandler(suggest_white_callback, pattern=r'^suggest_white:'))
+    app.add_handler(CallbackQueryHandler(board_image_callback, pattern=r'^board_img$'))
+    app.add_handler(InlineQueryHandler(inline_query))
 
     app.run_polling(drop_pending_updates=True)
 